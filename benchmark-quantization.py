@@ -0,0 +1,104 @@
+"""
+Benchmarks the quantized vector storage of NumpyMemoryStore: recall@k against the exact float32 scan versus the
+memory of the scanned vector matrix, for each quantization and rescore factor. The vectors are synthetic clusters,
+no embedding model is called.
+
+Example:
+    python benchmark-quantization.py --num_vectors=200000 --dims=1024 --rescore_factors=1,4
+"""
+
+import tempfile
+import time
+
+import fire
+import numpy as np
+
+from memoryscope.core.storage.numpy_memory_store import NumpyMemoryStore
+from memoryscope.scheme.memory_node import MemoryNode
+from memoryscope.scheme.model_response import ModelResponse
+
+
+class LookupEmbeddingModel(object):
+    """Embeds the benchmark queries `q{i}` by looking up their precomputed vectors."""
+
+    def __init__(self, query_vectors: np.ndarray):
+        self.query_vectors = query_vectors
+
+    def call(self, text, **kwargs) -> ModelResponse:
+        embeddings = [self.query_vectors[int(t[1:])].tolist() for t in text]
+        return ModelResponse(embedding_results=embeddings[0] if len(embeddings) == 1 else embeddings)
+
+
+def run_store(emb: LookupEmbeddingModel,
+              vectors: np.ndarray,
+              num_queries: int,
+              top_k: int,
+              persist_dir: str = None,
+              **store_kwargs):
+    store = NumpyMemoryStore(embedding_model=emb, init_capacity=len(vectors), persist_dir=persist_dir,
+                             **store_kwargs)
+    batch_size = 10000
+    for start in range(0, len(vectors), batch_size):
+        store.batch_insert([MemoryNode(memory_id=str(i), content="", vector=vectors[i].tolist())
+                            for i in range(start, min(start + batch_size, len(vectors)))])
+
+    results = []
+    start_time = time.time()
+    for i in range(num_queries):
+        nodes = store.retrieve_memories(query=f"q{i}", top_k=top_k, return_vectors=False)
+        results.append({n.memory_id for n in nodes})
+    query_ms = (time.time() - start_time) * 1000 / num_queries
+    scan_bytes = store.scan_bytes
+    store.close()
+    return results, scan_bytes, query_ms
+
+
+def benchmark(num_vectors: int = 50000,
+              dims: int = 256,
+              num_clusters: int = 100,
+              num_queries: int = 100,
+              top_k: int = 10,
+              rescore_factors: tuple = (1, 2, 4),
+              seed: int = 0):
+    """
+    Prints the recall-vs-memory report.
+
+    Args:
+        num_vectors (int): The number of memory vectors.
+        dims (int): The dims of the vectors.
+        num_clusters (int): The number of gaussian clusters the vectors are drawn around, close neighbors make the
+            quantization errors visible.
+        num_queries (int): The number of queries, drawn around the same clusters.
+        top_k (int): The k of recall@k.
+        rescore_factors (tuple): The rescore factors benchmarked for each quantization.
+        seed (int): The random seed.
+    """
+    if isinstance(rescore_factors, int):
+        rescore_factors = (rescore_factors,)
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(num_clusters, dims)).astype(np.float32)
+    vectors = centers[rng.integers(num_clusters, size=num_vectors)] + \
+        0.3 * rng.normal(size=(num_vectors, dims)).astype(np.float32)
+    query_vectors = centers[rng.integers(num_clusters, size=num_queries)] + \
+        0.3 * rng.normal(size=(num_queries, dims)).astype(np.float32)
+    emb = LookupEmbeddingModel(query_vectors)
+
+    expected, flat_bytes, flat_ms = run_store(emb, vectors, num_queries, top_k)
+    print(f"num_vectors={num_vectors} dims={dims} top_k={top_k} num_queries={num_queries}")
+    print(f"{'quantization':<14}{'rescore':>8}{'scan MB':>10}{'memory':>8}{f'recall@{top_k}':>11}{'query ms':>10}")
+    print(f"{'none':<14}{'-':>8}{flat_bytes / 2 ** 20:>10.1f}{1:>8.2f}{1:>11.4f}{flat_ms:>10.2f}")
+
+    for quantization in ["float16", "int8"]:
+        for rescore_factor in rescore_factors:
+            # persisted, so that the float32 vectors used by the rescoring are memory mapped
+            with tempfile.TemporaryDirectory() as persist_dir:
+                results, scan_bytes, query_ms = run_store(emb, vectors, num_queries, top_k, persist_dir,
+                                                          quantization=quantization,
+                                                          rescore_factor=rescore_factor)
+            recall = np.mean([len(r & e) / len(e) for r, e in zip(results, expected)])
+            print(f"{quantization:<14}{rescore_factor:>8}{scan_bytes / 2 ** 20:>10.1f}"
+                  f"{scan_bytes / flat_bytes:>8.2f}{recall:>11.4f}{query_ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    fire.Fire(benchmark)
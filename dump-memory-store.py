@@ -0,0 +1,56 @@
+"""
+Exports the memory store of a config into a columnar dump, or bulk-loads a dump into it, with the stored vectors and
+without any embedding call. Used to move a tenant between clusters or to seed a test environment.
+
+Example:
+    python dump-memory-store.py export --config_path=memoryscope/core/config/demo_config.yaml \
+        --dump_dir=./dump/alice --user_name=alice
+    python dump-memory-store.py load --config_path=memoryscope/core/config/demo_config.yaml --dump_dir=./dump/alice
+"""
+
+import fire
+
+from memoryscope import MemoryScope
+from memoryscope.core.storage.memory_dump import MemoryDump
+
+
+def export(config_path: str,
+           dump_dir: str,
+           user_name: str = None,
+           target_name: str = None,
+           chunk_size: int = 10000,
+           compress: bool = False):
+    """
+    Exports the memory nodes of the store, optionally only those of a user / target.
+
+    Args:
+        config_path (str): The memoryscope config of the store.
+        dump_dir (str): The directory to write the dump into.
+        user_name (str, optional): Only export the memories of this user.
+        target_name (str, optional): Only export the memories of this target.
+        chunk_size (int): The number of nodes per chunk file.
+        compress (bool): Compress the chunk files.
+    """
+    filter_dict = {k: v for k, v in {"user_name": user_name, "target_name": target_name}.items() if v is not None}
+    with MemoryScope(config_path=config_path) as ms:
+        count = MemoryDump(dump_dir).export(ms.context.memory_store, filter_dict, chunk_size, compress)
+    print(f"export {count} memory nodes to {dump_dir}.")
+
+
+def load(config_path: str, dump_dir: str, batch_size: int = 500, workers: int = 4):
+    """
+    Bulk-loads a dump into the store.
+
+    Args:
+        config_path (str): The memoryscope config of the store.
+        dump_dir (str): The directory of the dump.
+        batch_size (int): The number of nodes per insert batch.
+        workers (int): The number of concurrent insert batches.
+    """
+    with MemoryScope(config_path=config_path) as ms:
+        count = MemoryDump(dump_dir).load(ms.context.memory_store, batch_size, workers)
+    print(f"load {count} memory nodes from {dump_dir}.")
+
+
+if __name__ == "__main__":
+    fire.Fire({"export": export, "load": load})
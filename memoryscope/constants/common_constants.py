@@ -25,6 +25,8 @@ MEMORY_MANAGER = "memory_manager"
 
 QUERY_WITH_TS = "query_with_ts"
 
+QUERY_VECTOR = "query_vector"
+
 RETRIEVE_MEMORY_NODES = "retrieve_memory_nodes"
 
 RANKED_MEMORY_NODES = "ranked_memory_nodes"
@@ -1,11 +1,16 @@
+import asyncio
 import inspect
 import time
 import os
 from abc import abstractmethod, ABCMeta
-from typing import Any
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, TypeVar
 
+from memoryscope.core.utils.circuit_breaker import CircuitBreaker
 from memoryscope.core.utils.logger import Logger
+from memoryscope.core.utils.rate_limiter import RateLimiter
 from memoryscope.core.utils.registry import Registry
+from memoryscope.core.utils.retry_policy import RetryPolicy
 from memoryscope.core.utils.timer import Timer
 from memoryscope.enumeration.model_enum import ModelEnum
 from memoryscope.scheme.model_response import ModelResponse, ModelResponseGen
@@ -14,6 +19,8 @@ from memoryscope.core.memoryscope_context import get_memoryscope_uuid
 
 MODEL_REGISTRY = Registry("models")
 
+T = TypeVar("T")
+
 
 class BaseModel(metaclass=ABCMeta):
     m_type: ModelEnum | None = None
@@ -24,6 +31,12 @@ class BaseModel(metaclass=ABCMeta):
                  timeout: int = None,
                  max_retries: int = 3,
                  retry_interval: float = 1.0,
+                 max_retry_interval: float = 30.0,
+                 circuit_failure_threshold: int = 5,
+                 circuit_reset_timeout: float = 30.0,
+                 max_concurrency: int = 0,
+                 rpm: int = 0,
+                 tpm: int = 0,
                  kwargs_filter: bool = True,
                  raise_exception: bool = True,
                  **kwargs):
@@ -37,6 +50,14 @@ class BaseModel(metaclass=ABCMeta):
         self.raise_exception: bool = raise_exception
         self.context: MemoryscopeContext = get_memoryscope_uuid()
         self.kwargs: dict = kwargs
+        # shared by the sync and async paths, see RetryPolicy and CircuitBreaker
+        self.retry_policy: RetryPolicy = RetryPolicy(max_retries=max_retries,
+                                                     interval=retry_interval,
+                                                     max_interval=max_retry_interval)
+        self.circuit_breaker: CircuitBreaker = CircuitBreaker(failure_threshold=circuit_failure_threshold,
+                                                              reset_timeout=circuit_reset_timeout)
+        # the provider requests of this model wait their turn here, shared by all the workers using the model
+        self.rate_limiter: RateLimiter = RateLimiter(max_concurrency=max_concurrency, rpm=rpm, tpm=tpm)
 
         self._model: Any = None
         self.logger = Logger.get_logger("base_model")
@@ -60,6 +81,13 @@ class BaseModel(metaclass=ABCMeta):
 
         return self._model
 
+    @staticmethod
+    def estimate_tokens(*texts: str) -> int:
+        """
+        A rough token count of the texts for the `tpm` limit, about 3 characters per token.
+        """
+        return sum(len(text) for text in texts if text) // 3 + 1
+
     @abstractmethod
     def before_call(self, model_response: ModelResponse, **kwargs):
         pass
@@ -72,27 +100,137 @@ class BaseModel(metaclass=ABCMeta):
     def _call(self, model_response: ModelResponse, stream: bool = False, **kwargs):
         pass
 
+    def _on_circuit_open(self, model_response: ModelResponse) -> ModelResponse:
+        model_response.status = False
+        model_response.details = f"circuit of model={self.model_name} is open, fail fast!"
+        self.logger.warning(model_response.details, stacklevel=3)
+        if self.raise_exception:
+            raise RuntimeError(model_response.details)
+        return model_response
+
+    @contextmanager
+    def _circuit_trial(self):
+        """
+        Guards a call let through by the circuit breaker. A half-open trial call ending without an outcome, e.g.
+        cancelled or interrupted, gives its turn back, else the circuit would stay half-open and fail fast forever.
+        """
+        trial = self.circuit_breaker.state == CircuitBreaker.HALF_OPEN
+        try:
+            yield
+        except BaseException:
+            if trial:
+                self.circuit_breaker.abort_trial()
+            raise
+
+    def _should_retry(self, attempt: int) -> bool:
+        """
+        Whether another attempt is worth it after a failed one: some retries are left and the circuit was not opened
+        by other calls meanwhile.
+        """
+        return attempt + 1 < self.retry_policy.max_retries and self.circuit_breaker.state != CircuitBreaker.OPEN
+
+    def _on_attempt_failed(self, model_response: ModelResponse, attempt: int, cost_str: str) -> bool:
+        """
+        Logs a failed attempt. Returns whether another attempt is worth it, see `_should_retry`.
+        """
+        self.logger.warning(f"call model={self.model_name} failed! {cost_str} retry_cnt={attempt} "
+                            f"details={model_response.details}", stacklevel=3)
+        return self._should_retry(attempt)
+
+    def _on_retries_exhausted(self, model_response: ModelResponse, error: Exception | None) -> ModelResponse:
+        # the circuit breaker counts failed calls, not failed attempts
+        self.circuit_breaker.record_failure()
+        if error is not None and self.raise_exception:
+            raise error
+        return model_response
+
+    def retry_call(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """
+        Calls the provider through `fn` with the retry policy and the circuit breaker of `call`, for the requests not
+        packaged into a ModelResponse, e.g. a single query embedding. The error of the last attempt is raised.
+
+        Args:
+            fn (Callable[..., T]): The provider call.
+            *args: The positional arguments of `fn`.
+            **kwargs: The keyword arguments of `fn`.
+
+        Returns:
+            T: The result of `fn`.
+        """
+        if not self.circuit_breaker.allow():
+            raise RuntimeError(f"circuit of model={self.model_name} is open, fail fast!")
+        with self._circuit_trial():
+            for i in range(self.retry_policy.max_retries):
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception as e:
+                    self.logger.warning(f"call model={self.model_name} failed! retry_cnt={i} details={e.args}")
+                    if not self._should_retry(i):
+                        self.circuit_breaker.record_failure()
+                        raise
+                    time.sleep(self.retry_policy.backoff(i, e))
+                else:
+                    self.circuit_breaker.record_success()
+                    return result
+
+    async def async_retry_call(self, fn: Callable[..., Awaitable[T]], *args, **kwargs) -> T:
+        """
+        Asynchronously calls the provider through `fn`, see `retry_call`.
+
+        Args:
+            fn (Callable[..., Awaitable[T]]): The async provider call.
+            *args: The positional arguments of `fn`.
+            **kwargs: The keyword arguments of `fn`.
+
+        Returns:
+            T: The result of `fn`.
+        """
+        if not self.circuit_breaker.allow():
+            raise RuntimeError(f"circuit of model={self.model_name} is open, fail fast!")
+        with self._circuit_trial():
+            for i in range(self.retry_policy.max_retries):
+                try:
+                    result = await fn(*args, **kwargs)
+                except Exception as e:
+                    self.logger.warning(f"call model={self.model_name} failed! retry_cnt={i} details={e.args}")
+                    if not self._should_retry(i):
+                        self.circuit_breaker.record_failure()
+                        raise
+                    await asyncio.sleep(self.retry_policy.backoff(i, e))
+                else:
+                    self.circuit_breaker.record_success()
+                    return result
+
     def call(self, stream: bool = False, **kwargs) -> ModelResponse | ModelResponseGen:
         with Timer(self.__class__.__name__, time_log_type="none") as t:
             model_response = ModelResponse(m_type=self.m_type)
 
             self.before_call(stream=stream, model_response=model_response, **kwargs)
-            for i in range(self.max_retries):
-                if self.raise_exception:
-                    self._call(stream=stream, model_response=model_response, **kwargs)
-                else:
+            if not self.circuit_breaker.allow():
+                return self._on_circuit_open(model_response)
+
+            with self._circuit_trial():
+                error: Exception | None = None
+                for i in range(self.retry_policy.max_retries):
+                    model_response.status = True
+                    model_response.details = ""
+                    error = None
                     try:
                         self._call(stream=stream, model_response=model_response, **kwargs)
                     except Exception as e:
+                        error = e
                         model_response.status = False
                         model_response.details = e.args
 
-                if isinstance(model_response, ModelResponse) and not model_response.status:
-                    self.logger.warning(f"call model={self.model_name} failed! {t.cost_str} retry_cnt={i} "
-                                        f"details={model_response.details}", stacklevel=2)
-                    time.sleep(i * self.retry_interval)
-                else:
-                    return self.after_call(stream=stream, model_response=model_response, **kwargs)
+                    if model_response.status:
+                        self.circuit_breaker.record_success()
+                        return self.after_call(stream=stream, model_response=model_response, **kwargs)
+                    if not self._on_attempt_failed(model_response, i, t.cost_str):
+                        break
+                    time.sleep(self.retry_policy.backoff(i, error))
+
+                # the failed response is returned, with `status` False and the `details` of the last attempt
+                return self._on_retries_exhausted(model_response, error)
 
     @abstractmethod
     async def _async_call(self, model_response: ModelResponse, **kwargs) -> ModelResponse:
@@ -103,19 +241,28 @@ class BaseModel(metaclass=ABCMeta):
             model_response = ModelResponse(m_type=self.m_type)
 
             self.before_call(model_response=model_response, **kwargs)
-            for i in range(self.max_retries):
-                if self.raise_exception:
-                    await self._async_call(model_response=model_response, **kwargs)
-                else:
+            if not self.circuit_breaker.allow():
+                return self._on_circuit_open(model_response)
+
+            with self._circuit_trial():
+                error: Exception | None = None
+                for i in range(self.retry_policy.max_retries):
+                    model_response.status = True
+                    model_response.details = ""
+                    error = None
                     try:
                         await self._async_call(model_response=model_response, **kwargs)
                     except Exception as e:
+                        error = e
                         model_response.status = False
                         model_response.details = e.args
 
-                if not model_response.status:
-                    self.logger.warning(f"async_call model={self.model_name} failed! {t.cost_str} retry_cnt={i} "
-                                        f"details={model_response.details}", stacklevel=2)
-                    time.sleep(i * self.retry_interval)
-                else:
-                    return self.after_call(model_response=model_response, **kwargs)
+                    if model_response.status:
+                        self.circuit_breaker.record_success()
+                        return self.after_call(model_response=model_response, **kwargs)
+                    if not self._on_attempt_failed(model_response, i, t.cost_str):
+                        break
+                    # never block the event loop while backing off
+                    await asyncio.sleep(self.retry_policy.backoff(i, error))
+
+                return self._on_retries_exhausted(model_response, error)
@@ -0,0 +1,374 @@
+import asyncio
+import random
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import yaml
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.base.llms.types import ChatMessage, ChatResponse, ChatResponseGen, CompletionResponse, \
+    CompletionResponseGen, LLMMetadata, MessageRole
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.llms.callbacks import llm_chat_callback, llm_completion_callback
+from llama_index.core.llms.custom import CustomLLM
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import NodeWithScore, QueryBundle
+
+from memoryscope.constants.language_constants import NONE_WORD, CONTAINED_WORD
+from memoryscope.core.utils.tool_functions import md5_hash
+from memoryscope.enumeration.language_enum import LanguageEnum
+
+LATENCY_DISTS = ("constant", "uniform", "exponential", "lognormal")
+
+
+class FakeBackendError(ConnectionError):
+    """The injected error of a fake backend, a ConnectionError as a real provider would raise."""
+
+
+class FakeLatency(object):
+    """
+    Draws the latency and the injected errors of the offline stand-ins of the llama-index backends below, registered
+    as `fake_embedding`, `fake_generation` and `fake_rank`. Each fake call sleeps a latency drawn from `latency_dist`
+    and fails with probability `error_rate`, so that the overhead of MemoryScope itself can be measured under load
+    without any api key.
+    """
+
+    def __init__(self, latency: float = 0.0, latency_dist: str = "constant", error_rate: float = 0.0,
+                 seed: int = None):
+        """
+        Args:
+            latency (float): The mean latency of a call in seconds.
+            latency_dist (str): The latency distribution, one of `LATENCY_DISTS`, all with the mean `latency`.
+                lognormal has a sigma of 1, a heavy tail as real providers have.
+            error_rate (float): The probability of a call to fail.
+            seed (int): The seed of the draws, random if not set.
+        """
+        if latency_dist not in LATENCY_DISTS:
+            raise ValueError(f"latency_dist={latency_dist} is not supported, choose from {LATENCY_DISTS}!")
+        self.latency: float = latency
+        self.latency_dist: str = latency_dist
+        self.error_rate: float = error_rate
+        self._random = random.Random(seed)
+
+    def sample(self) -> float:
+        if self.latency <= 0:
+            return 0.0
+        if self.latency_dist == "uniform":
+            return self._random.uniform(0, 2 * self.latency)
+        if self.latency_dist == "exponential":
+            return self._random.expovariate(1 / self.latency)
+        if self.latency_dist == "lognormal":
+            # mean = exp(mu + sigma ** 2 / 2)
+            return self._random.lognormvariate(np.log(self.latency) - 0.5, 1.0)
+        return self.latency
+
+    def _check_error(self, name: str):
+        if self.error_rate > 0 and self._random.random() < self.error_rate:
+            raise FakeBackendError(f"injected error of {name}!")
+
+    def wait(self, name: str):
+        time.sleep(self.sample())
+        self._check_error(name)
+
+    async def async_wait(self, name: str):
+        await asyncio.sleep(self.sample())
+        self._check_error(name)
+
+
+def lexical_tokens(text: str) -> set:
+    """
+    The lowercase words of the text, each CJK character as a word.
+    """
+    return set(re.findall(r"[一-鿿]|[^\W一-鿿]+", text.lower()))
+
+
+class FakeEmbedding(BaseEmbedding):
+    """
+    Deterministic embeddings seeded by the md5 of the text: the same text always gets the same unit vector, and
+    queries are embedded as documents, so that a memory is retrieved by its own content.
+    """
+
+    dimensions: int = Field(default=1536, description="The dimension of the embeddings.")
+    _fake_latency: FakeLatency = PrivateAttr()
+
+    def __init__(self,
+                 model_name: str = "fake",
+                 dimensions: int = 1536,
+                 embed_batch_size: int = 10,
+                 latency: float = 0.0,
+                 latency_dist: str = "constant",
+                 error_rate: float = 0.0,
+                 seed: int = None,
+                 **kwargs):
+        super().__init__(model_name=model_name, dimensions=dimensions, embed_batch_size=embed_batch_size, **kwargs)
+        self._fake_latency = FakeLatency(latency, latency_dist, error_rate, seed)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "FakeEmbedding"
+
+    def _embed(self, text: str) -> List[float]:
+        rng = np.random.default_rng(int(md5_hash(text), 16))
+        vector = rng.standard_normal(self.dimensions)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        # one latency per batch, as one upstream request
+        self._fake_latency.wait(self.class_name())
+        return [self._embed(text) for text in texts]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._get_text_embeddings([query])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        await self._fake_latency.async_wait(self.class_name())
+        return [self._embed(text) for text in texts]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return (await self._aget_text_embeddings([query]))[0]
+
+
+class FakeRank(BaseNodePostprocessor):
+    """
+    Reranks the nodes by their lexical overlap with the query: the cosine of their sets of words.
+    """
+
+    top_n: int = Field(default=3, description="The number of nodes returned.")
+    _fake_latency: FakeLatency = PrivateAttr()
+
+    def __init__(self,
+                 top_n: int = 3,
+                 latency: float = 0.0,
+                 latency_dist: str = "constant",
+                 error_rate: float = 0.0,
+                 seed: int = None):
+        super().__init__(top_n=top_n)
+        self._fake_latency = FakeLatency(latency, latency_dist, error_rate, seed)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "FakeRank"
+
+    def _postprocess_nodes(self,
+                           nodes: List[NodeWithScore],
+                           query_bundle: Optional[QueryBundle] = None) -> List[NodeWithScore]:
+        if query_bundle is None:
+            raise ValueError("Missing query bundle in extra info.")
+        self._fake_latency.wait(self.class_name())
+
+        query_tokens = lexical_tokens(query_bundle.query_str)
+        results = []
+        for node in nodes:
+            tokens = lexical_tokens(node.node.get_content())
+            score = 0.0
+            if query_tokens and tokens:
+                score = len(query_tokens & tokens) / np.sqrt(len(query_tokens) * len(tokens))
+            results.append(NodeWithScore(node=node.node, score=float(score)))
+        results.sort(key=lambda x: x.score, reverse=True)
+        return results[: self.top_n]
+
+
+class FakePromptMatcher(object):
+    """
+    Recognizes which worker prompt a chat is, by matching its system message with the `*_system` prompts of the
+    worker yaml files, and cuts the user query out of the user message after the `*_few_shot` prompt.
+    """
+
+    WORKER_DIR: Path = Path(__file__).parent.parent / "worker"
+
+    def __init__(self):
+        # (task, language, system pattern, few shot pattern)
+        self.patterns: List[Tuple[str, LanguageEnum, re.Pattern, re.Pattern | None]] = []
+        for yaml_path in sorted(self.WORKER_DIR.glob("*/*.yaml")):
+            with open(yaml_path) as f:
+                prompt_dict: Dict[str, Dict[str, str]] = yaml.safe_load(f) or {}
+            for key, prompts in prompt_dict.items():
+                if not key.endswith("_system") or not isinstance(prompts, dict):
+                    continue
+                task = key[: -len("_system")]
+                for language, prompt in prompts.items():
+                    few_shot = prompt_dict.get(f"{task}_few_shot", {}).get(language)
+                    self.patterns.append((task,
+                                          LanguageEnum(language),
+                                          self._to_pattern(prompt),
+                                          self._to_pattern(few_shot) if few_shot else None))
+        # the longest prompts first, in case one prompt is the prefix of another
+        self.patterns.sort(key=lambda x: len(x[2].pattern), reverse=True)
+
+    @staticmethod
+    def _to_pattern(template: str) -> re.Pattern:
+        parts = re.split(r"\{[a-z_]+}", template.strip())
+        return re.compile("(?:.*?)".join(re.escape(part) for part in parts), re.DOTALL)
+
+    def match(self, system_content: str, user_content: str) -> Tuple[str, LanguageEnum, str]:
+        """
+        Returns:
+            Tuple[str, LanguageEnum, str]: The task, the language and the user query of the chat, an empty task if
+                the chat is not a worker prompt.
+        """
+        for task, language, system_pattern, few_shot_pattern in self.patterns:
+            if not system_pattern.search(system_content):
+                continue
+            user_query = user_content
+            if few_shot_pattern is not None:
+                m = few_shot_pattern.search(user_content)
+                if m:
+                    user_query = user_content[m.end():]
+            return task, language, user_query.strip()
+        return "", LanguageEnum.EN, user_content
+
+
+FIRST_PERSON_PATTERN = {
+    LanguageEnum.CN: re.compile(r"我"),
+    LanguageEnum.EN: re.compile(r"\b(i|i'm|i've|me|my|mine)\b", re.IGNORECASE),
+}
+REFLECTION_SUBJECTS = {
+    LanguageEnum.CN: ["爱好", "职业"],
+    LanguageEnum.EN: ["hobbies", "occupation"],
+}
+_PROMPT_MATCHER: FakePromptMatcher | None = None
+
+
+def get_prompt_matcher() -> FakePromptMatcher:
+    global _PROMPT_MATCHER
+    if _PROMPT_MATCHER is None:
+        _PROMPT_MATCHER = FakePromptMatcher()
+    return _PROMPT_MATCHER
+
+
+class FakeGeneration(CustomLLM):
+    """
+    A rule-based LLM answering the worker prompts in the `<...>` formats `ResponseTextParser.parse_v1` expects:
+    sentences with a first person word are scored important and become observations, repeated observations are
+    marked contained. Other chats get a fixed answer.
+    """
+
+    context_window: int = Field(default=32768, description="The context window of the fake model.")
+    num_output: int = Field(default=2000, description="The max output tokens of the fake model.")
+    _fake_latency: FakeLatency = PrivateAttr()
+
+    def __init__(self,
+                 max_tokens: int = 2000,
+                 latency: float = 0.0,
+                 latency_dist: str = "constant",
+                 error_rate: float = 0.0,
+                 seed: int = None,
+                 **kwargs):
+        super().__init__(num_output=max_tokens)
+        self._fake_latency = FakeLatency(latency, latency_dist, error_rate, seed)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "FakeGeneration"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(context_window=self.context_window, num_output=self.num_output,
+                           is_chat_model=True, model_name="fake")
+
+    @staticmethod
+    def _numbered_lines(user_query: str) -> List[Tuple[str, str]]:
+        """
+        The `<index> <sentence>` lines of the user query, the sentence stripped of any `<time> <name>:` prefix.
+        """
+        lines = []
+        for line in user_query.split("\n"):
+            m = re.match(r"^(\d+)\s+(.*)$", line.strip())
+            if m:
+                content = re.split(r"[:：]", m.group(2), maxsplit=1)[-1].strip()
+                lines.append((m.group(1), content.replace("<", "").replace(">", "")))
+        return lines
+
+    def respond(self, messages: Sequence[ChatMessage]) -> str:
+        system_content = "\n".join(str(m.content) for m in messages if m.role == MessageRole.SYSTEM)
+        user_content = str(messages[-1].content) if messages else ""
+        task, language, user_query = get_prompt_matcher().match(system_content, user_content)
+        none_word = NONE_WORD[language]
+
+        if task == "info_filter":
+            first_person = FIRST_PERSON_PATTERN[language]
+            return "\n".join(f"<{idx}> <{3 if first_person.search(content) else 0}>"
+                             for idx, content in self._numbered_lines(user_query))
+
+        if task in ("get_observation", "get_observation_with_time"):
+            results = []
+            for idx, content in self._numbered_lines(user_query):
+                keywords = sorted(lexical_tokens(content), key=len, reverse=True)[:2]
+                results.append(f"<{idx}> <> <{content or none_word}> <{', '.join(keywords)}>")
+            return "\n".join(results)
+
+        if task in ("contra_repeat", "long_contra_repeat"):
+            seen = set()
+            results = []
+            for idx, content in self._numbered_lines(user_query):
+                status = CONTAINED_WORD[language] if content in seen else none_word
+                seen.add(content)
+                results.append(f"<{idx}> <{status}> <>" if task == "long_contra_repeat" else f"<{idx}> <{status}>")
+            return "\n".join(results)
+
+        if task == "get_reflection_subject":
+            subjects = [s for s in REFLECTION_SUBJECTS[language] if s not in user_query]
+            return "\n".join(subjects) if subjects else none_word
+
+        if task == "update_insight":
+            first_line = user_query.split("\n")[0].replace("<", "").replace(">", "").strip()
+            return f"<{first_line or none_word}>"
+
+        if task == "extract_time":
+            return none_word
+
+        return f"This is a fake response to: {user_content[-100:]}"
+
+    def _complete_text(self, prompt: str) -> str:
+        return self.respond([ChatMessage(role=MessageRole.USER, content=prompt)])
+
+    @staticmethod
+    def _stream_text(text: str) -> CompletionResponseGen:
+        content = ""
+        for delta in re.findall(r"\S+\s*|\s+", text):
+            content += delta
+            yield CompletionResponse(text=content, delta=delta)
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        self._fake_latency.wait(self.class_name())
+        return CompletionResponse(text=self._complete_text(prompt))
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        self._fake_latency.wait(self.class_name())
+        return self._stream_text(self._complete_text(prompt))
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        await self._fake_latency.async_wait(self.class_name())
+        return CompletionResponse(text=self._complete_text(prompt))
+
+    @llm_chat_callback()
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        self._fake_latency.wait(self.class_name())
+        return ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=self.respond(messages)))
+
+    @llm_chat_callback()
+    def stream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseGen:
+        self._fake_latency.wait(self.class_name())
+
+        def gen() -> ChatResponseGen:
+            for response in self._stream_text(self.respond(messages)):
+                yield ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=response.text),
+                                   delta=response.delta)
+
+        return gen()
+
+    @llm_chat_callback()
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        await self._fake_latency.async_wait(self.class_name())
+        return ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=self.respond(messages)))
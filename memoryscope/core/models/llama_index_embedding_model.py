@@ -1,25 +1,176 @@
-from typing import List
+from typing import Any, Dict, List, Tuple
 
 from llama_index.embeddings.dashscope import DashScopeEmbedding
+from llama_index.embeddings.dashscope.base import get_text_embedding
 from llama_index.embeddings.openai import OpenAIEmbedding
 
 from memoryscope.core.models.base_model import BaseModel, MODEL_REGISTRY
+from memoryscope.core.models.fake_backends import FakeEmbedding
 from memoryscope.enumeration.model_enum import ModelEnum
 from memoryscope.scheme.model_response import ModelResponse
 from memoryscope.core.utils.logger import Logger
+from memoryscope.core.utils.embedding_disk_cache import EmbeddingDiskCache
+from memoryscope.core.utils.lru_cache import LruCache
+from memoryscope.core.utils.micro_batcher import MicroBatcher
 
 
 class LlamaIndexEmbeddingModel(BaseModel):
     """
     Manages text embeddings utilizing the DashScopeEmbedding within the LlamaIndex framework,
     facilitating embedding operations for both sync and async modes, inheriting from BaseModel.
+    Embeddings are cached in memory by (module_name, model_name, text), and optionally in an EmbeddingDiskCache
+    shared across processes, only the misses of both caches are sent upstream.
+    The misses of concurrent calls from different threads are merged by a MicroBatcher into one upstream request.
     """
     m_type: ModelEnum = ModelEnum.EMBEDDING_MODEL
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self,
+                 *args,
+                 cache_size: int = 10000,
+                 cache_ttl: float = 3600,
+                 disk_cache_path: str = None,
+                 disk_cache_size: int = 1000000,
+                 batch_max_size: int = 32,
+                 batch_max_wait: float = 0.005,
+                 **kwargs):
+        """
+        Initializes the LlamaIndexEmbeddingModel.
+
+        Args:
+            cache_size (int): The max number of embeddings cached in memory, 0 to disable the cache.
+            cache_ttl (float): The seconds an embedding stays cached, never expires if not set.
+            disk_cache_path (str): The SQLite file of the persistent embedding cache, disabled if not set.
+            disk_cache_size (int): The max number of embeddings kept in the persistent cache.
+            batch_max_size (int): The max number of texts merged from concurrent calls into one upstream request.
+            batch_max_wait (float): The max seconds a call waits for concurrent calls to merge with, 0 to disable.
+            *args, **kwargs: The arguments of BaseModel.
+        """
         super().__init__(*args, **kwargs)
+        self.cache: LruCache | None = LruCache(max_size=cache_size, ttl=cache_ttl) if cache_size > 0 else None
+        self.disk_cache: EmbeddingDiskCache | None = None
+        if disk_cache_path:
+            self.disk_cache = EmbeddingDiskCache(disk_cache_path, max_size=disk_cache_size)
+        self.text_batcher = MicroBatcher(self._embed_texts, max_size=batch_max_size, max_wait=batch_max_wait)
+        self.query_batcher = MicroBatcher(self._embed_queries, max_size=batch_max_size, max_wait=batch_max_wait)
         self.logger = Logger.get_logger("llama_index_embedding_model")
 
+    @property
+    def disk_cache_model(self) -> str:
+        """
+        The model name the embeddings of this model are stored under in the persistent cache.
+        """
+        return f"{self.module_name}/{self.model_name}"
+
+    def _cache_key(self, text: str, text_type: str = "document") -> tuple:
+        return self.module_name, self.model_name, text_type, text
+
+    def _lookup_cache(self, texts: List[str]) -> Tuple[Dict[tuple, Any], List[str]]:
+        """
+        Looks up the cached embeddings of the texts.
+
+        Returns:
+            Tuple[Dict[tuple, Any], List[str]]: The cached embeddings by cache key, and the distinct texts missed.
+        """
+        cached = self.cache.get_many([self._cache_key(t) for t in texts]) if self.cache is not None else {}
+        miss_texts = list(dict.fromkeys(t for t in texts if self._cache_key(t) not in cached))
+        if miss_texts and self.disk_cache is not None:
+            disk_cached = self.disk_cache.get_many(self.disk_cache_model, miss_texts)
+            if disk_cached:
+                disk_cached = {self._cache_key(t): e for t, e in disk_cached.items()}
+                if self.cache is not None:
+                    self.cache.put_many(disk_cached)
+                cached.update(disk_cached)
+                miss_texts = [t for t in miss_texts if self._cache_key(t) not in cached]
+        return cached, miss_texts
+
+    def _merge_cache(self,
+                     texts: List[str],
+                     cached: Dict[tuple, Any],
+                     miss_texts: List[str],
+                     miss_embeddings: List[List[float]]) -> List[List[float]]:
+        """
+        Caches the embeddings of the missed texts, then returns the embeddings of all texts in order.
+        """
+        embedded = {self._cache_key(t): e for t, e in zip(miss_texts, miss_embeddings)}
+        if self.cache is not None:
+            self.cache.put_many(embedded)
+        if self.disk_cache is not None:
+            self.disk_cache.put_many(self.disk_cache_model, dict(zip(miss_texts, miss_embeddings)))
+        cached.update(embedded)
+        return [cached[self._cache_key(t)] for t in texts]
+
+    def _embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds a merged batch of texts in one upstream request, texts repeated by several callers only once.
+        """
+        distinct_texts = list(dict.fromkeys(texts))
+        with self.rate_limiter.limit(self.estimate_tokens(*distinct_texts)):
+            embeddings = self.model.get_text_embedding_batch(texts=distinct_texts)
+        embeddings = dict(zip(distinct_texts, embeddings))
+        return [embeddings[t] for t in texts]
+
+    def _embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        Embeds a merged batch of queries. llama-index has no batched query embedding, so only the models whose query
+        embedding is a text embedding with other params are batched, the others embed the queries one by one.
+        """
+        distinct_queries = list(dict.fromkeys(queries))
+        model = self.model
+        with self.rate_limiter.limit(self.estimate_tokens(*distinct_queries)):
+            if len(distinct_queries) == 1:
+                embeddings = [model.get_query_embedding(distinct_queries[0])]
+            elif isinstance(model, DashScopeEmbedding):
+                # same as DashScopeEmbedding._get_query_embedding, with a list of texts
+                embeddings = get_text_embedding(model.model_name, distinct_queries, api_key=model._api_key,
+                                                text_type="query")
+            elif isinstance(model, OpenAIEmbedding) and model._query_engine == model._text_engine:
+                embeddings = model.get_text_embedding_batch(texts=distinct_queries)
+            else:
+                embeddings = [model.get_query_embedding(q) for q in distinct_queries]
+        embeddings = dict(zip(distinct_queries, embeddings))
+        return [embeddings[q] for q in queries]
+
+    def get_query_embedding(self, query: str) -> List[float]:
+        """
+        Embeds a search query, which some models embed differently from documents, through the cache. The misses
+        are retried and guarded by the circuit breaker like `call`.
+
+        Args:
+            query (str): The query to embed.
+
+        Returns:
+            List[float]: The query embedding.
+        """
+        key = self._cache_key(query, text_type="query")
+        embedding = self.cache.get(key) if self.cache is not None else None
+        if embedding is None:
+            embedding = self.retry_call(lambda: self.query_batcher.submit([query])[0])
+            if self.cache is not None:
+                self.cache.put(key, embedding)
+        return embedding
+
+    async def aget_query_embedding(self, query: str) -> List[float]:
+        """
+        Asynchronously embeds a search query through the cache, see `get_query_embedding`.
+
+        Args:
+            query (str): The query to embed.
+
+        Returns:
+            List[float]: The query embedding.
+        """
+        key = self._cache_key(query, text_type="query")
+        embedding = self.cache.get(key) if self.cache is not None else None
+        if embedding is None:
+            embedding = await self.async_retry_call(self._aembed_query, query)
+            if self.cache is not None:
+                self.cache.put(key, embedding)
+        return embedding
+
+    async def _aembed_query(self, query: str) -> List[float]:
+        async with self.rate_limiter.alimit(self.estimate_tokens(query)):
+            return await self.model.aget_query_embedding(query)
+
     @classmethod
     def register_model(cls, model_name: str, model_class: type):
         """
@@ -33,6 +184,7 @@ class LlamaIndexEmbeddingModel(BaseModel):
 
     MODEL_REGISTRY.register("dashscope_embedding", DashScopeEmbedding)
     MODEL_REGISTRY.register("openai_embedding", OpenAIEmbedding)
+    MODEL_REGISTRY.register("fake_embedding", FakeEmbedding)
 
     def before_call(self, model_response: ModelResponse, **kwargs):
         text: str | List[str] = kwargs.pop("text", "")
@@ -59,8 +211,8 @@ class LlamaIndexEmbeddingModel(BaseModel):
         Executes a synchronous call to generate embeddings for the input data.
 
         This method utilizes the `get_text_embedding_batch` method of the encapsulated model,
-        passing the processed data from `self.data`. The result is then packaged into a
-        `ModelResponse` object with the model type specified by `self.m_type`.
+        passing the texts of `self.data` missed by the cache, merged with those of concurrent calls.
+        The result is then packaged into a `ModelResponse` object with the model type specified by `self.m_type`.
 
         Args:
             **kwargs: Additional keyword arguments that might be used in the embedding process.
@@ -68,7 +220,10 @@ class LlamaIndexEmbeddingModel(BaseModel):
         Returns:
             ModelResponse: An object containing the embedding results and the model type.
         """
-        model_response.raw = self.model.get_text_embedding_batch(**model_response.meta_data["data"])
+        texts: List[str] = model_response.meta_data["data"]["texts"]
+        cached, miss_texts = self._lookup_cache(texts)
+        miss_embeddings = self.text_batcher.submit(miss_texts)
+        model_response.raw = self._merge_cache(texts, cached, miss_texts, miss_embeddings)
 
     async def _async_call(self, model_response: ModelResponse, **kwargs):
         """
@@ -84,4 +239,10 @@ class LlamaIndexEmbeddingModel(BaseModel):
         Returns:
             ModelResponse: An object encapsulating the embedding output and the model's type.
         """
-        model_response.raw = await self.model.aget_text_embedding_batch(**model_response.meta_data["data"])
+        texts: List[str] = model_response.meta_data["data"]["texts"]
+        cached, miss_texts = self._lookup_cache(texts)
+        miss_embeddings = []
+        if miss_texts:
+            async with self.rate_limiter.alimit(self.estimate_tokens(*miss_texts)):
+                miss_embeddings = await self.model.aget_text_embedding_batch(texts=miss_texts)
+        model_response.raw = self._merge_cache(texts, cached, miss_texts, miss_embeddings)
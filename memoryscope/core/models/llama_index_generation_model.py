@@ -1,15 +1,22 @@
-from typing import List
+import json
+import threading
+from typing import Any, Dict, List
 
 from llama_index.core.base.llms.types import ChatMessage, ChatResponse, CompletionResponse
 from llama_index.llms.dashscope import DashScope
 from llama_index.llms.openai import OpenAI
 
+from memoryscope.core.memoryscope_context import MemoryscopeContext
 from memoryscope.core.models.base_model import BaseModel, MODEL_REGISTRY
+from memoryscope.core.models.fake_backends import FakeGeneration
 from memoryscope.enumeration.message_role_enum import MessageRoleEnum
 from memoryscope.enumeration.model_enum import ModelEnum
 from memoryscope.scheme.message import Message
 from memoryscope.scheme.model_response import ModelResponse, ModelResponseGen
 from memoryscope.core.utils.logger import Logger
+from memoryscope.core.utils.lru_cache import LruCache
+from memoryscope.core.utils.response_disk_cache import ResponseDiskCache
+from memoryscope.core.utils.tool_functions import md5_hash
 
 
 class LlamaIndexGenerationModel(BaseModel):
@@ -19,17 +26,142 @@ class LlamaIndexGenerationModel(BaseModel):
     language model service from a registry, and generating text responses, with support
     for both streaming and non-streaming modes. It encapsulates logic for formatting
     these interactions within the context of a memory scope management system.
+    Non-streaming responses can be cached, opt-in, in memory and optionally in a ResponseDiskCache, keyed by the
+    hash of (model, messages, generation kwargs), so that re-run deterministic backend calls are not paid twice.
     """
 
     m_type: ModelEnum = ModelEnum.GENERATION_MODEL
 
     MODEL_REGISTRY.register("dashscope_generation", DashScope)
     MODEL_REGISTRY.register("openai_generation", OpenAI)
+    MODEL_REGISTRY.register("fake_generation", FakeGeneration)
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self,
+                 *args,
+                 cache_size: int = 0,
+                 cache_ttl: float = None,
+                 disk_cache_path: str = None,
+                 disk_cache_size: int = 100000,
+                 **kwargs):
+        """
+        Initializes the LlamaIndexGenerationModel.
+
+        Args:
+            cache_size (int): The max number of responses cached in memory, 0 to disable the cache.
+            cache_ttl (float): The seconds a response stays cached in memory, never expires if not set.
+            disk_cache_path (str): The SQLite file of the persistent response cache, disabled if not set.
+            disk_cache_size (int): The max number of responses kept in the persistent cache.
+            *args, **kwargs: The arguments of BaseModel.
+        """
         super().__init__(*args, **kwargs)
+        self.cache: LruCache | None = LruCache(max_size=cache_size, ttl=cache_ttl) if cache_size > 0 else None
+        self.disk_cache: ResponseDiskCache | None = None
+        if disk_cache_path:
+            self.disk_cache = ResponseDiskCache(disk_cache_path, max_size=disk_cache_size)
+        self.cache_hits: int = 0
+        self.cache_misses: int = 0
+        self._cache_lock = threading.Lock()
         self.logger = Logger.get_logger("llama_index_generation_model")
 
+    @property
+    def cache_enabled(self) -> bool:
+        return self.cache is not None or self.disk_cache is not None
+
+    @property
+    def cache_hit_ratio(self) -> float:
+        total = self.cache_hits + self.cache_misses
+        return self.cache_hits / total if total else 0.0
+
+    def response_cache_key(self, data: Dict[str, Any]) -> str:
+        """
+        Hashes a request: the model, its configured kwargs (e.g. `temperature`), the prompt or the messages, and
+        the generation kwargs of the call.
+
+        Args:
+            data (Dict[str, Any]): The request data built by `before_call`.
+
+        Returns:
+            str: The md5 hash of the request.
+        """
+        request = {key: value for key, value in data.items() if key != "messages"}
+        if "messages" in data:
+            request["messages"] = [(str(msg.role.value), msg.content) for msg in data["messages"]]
+        return md5_hash(json.dumps({"module_name": self.module_name,
+                                    "model_name": self.model_name,
+                                    "model_kwargs": self.kwargs,
+                                    "request": request}, sort_keys=True, ensure_ascii=False, default=str))
+
+    def _lookup_response(self, key: str) -> str | None:
+        """
+        Looks up the cached response in memory then on disk, and reports the hit ratio to the monitor.
+        """
+        response = self.cache.get(key) if self.cache is not None else None
+        if response is None and self.disk_cache is not None:
+            response = self.disk_cache.get(key)
+            if response is not None and self.cache is not None:
+                self.cache.put(key, response)
+
+        with self._cache_lock:
+            if response is None:
+                self.cache_misses += 1
+            else:
+                self.cache_hits += 1
+        monitor = MemoryscopeContext().monitor
+        if monitor is not None:
+            monitor.add(key=f"{self.model_name}.response_cache_hit_ratio", value=self.cache_hit_ratio)
+        return response
+
+    def _cache_response(self, key: str, raw: CompletionResponse | ChatResponse):
+        response = raw.text if isinstance(raw, CompletionResponse) else raw.message.content
+        if not response:
+            return
+        if self.cache is not None:
+            self.cache.put(key, response)
+        if self.disk_cache is not None:
+            self.disk_cache.put(key, response)
+
+    @staticmethod
+    def _cached_raw(data: Dict[str, Any], response: str) -> CompletionResponse | ChatResponse:
+        if "prompt" in data:
+            return CompletionResponse(text=response)
+        return ChatResponse(message=ChatMessage(role=MessageRoleEnum.ASSISTANT.value, content=response))
+
+    def _estimate_request_tokens(self, data: Dict[str, Any]) -> int:
+        """
+        Estimates the tokens of a request for the `tpm` limit: its input, plus the max output tokens, which the
+        providers count in their rate limits too.
+        """
+        if "prompt" in data:
+            tokens = self.estimate_tokens(data["prompt"])
+        else:
+            tokens = self.estimate_tokens(*[str(msg.content or "") for msg in data.get("messages", [])])
+        max_tokens = data.get("max_tokens", self.kwargs.get("max_tokens"))
+        return tokens + (max_tokens or 0)
+
+    @staticmethod
+    def _used_tokens(raw: CompletionResponse | ChatResponse) -> int | None:
+        """
+        Reads the tokens a request actually used from the usage reported by the provider, None if not reported.
+        """
+        token_counts = getattr(raw, "additional_kwargs", None) or {}
+        if "total_tokens" in token_counts:
+            return int(token_counts["total_tokens"])
+        response = getattr(raw, "raw", None)
+        usage = response.get("usage") if isinstance(response, dict) else getattr(response, "usage", None)
+        if isinstance(usage, dict):
+            if "total_tokens" in usage:
+                return int(usage["total_tokens"])
+            if "input_tokens" in usage and "output_tokens" in usage:
+                return int(usage["input_tokens"]) + int(usage["output_tokens"])
+        elif usage is not None and getattr(usage, "total_tokens", None) is not None:
+            return int(usage.total_tokens)
+        return None
+
+    def _adjust_request_tokens(self, tokens: int, raw: CompletionResponse | ChatResponse):
+        used_tokens = self._used_tokens(raw)
+        if used_tokens is not None:
+            self.rate_limiter.adjust_tokens(used_tokens - tokens)
+
     def before_call(self, model_response: ModelResponse, **kwargs):
         """
         Prepares the input data before making a call to the language model.
@@ -69,11 +201,16 @@ class LlamaIndexGenerationModel(BaseModel):
         call_result = model_response.raw
         if stream:
             def gen() -> ModelResponseGen:
-                for response in call_result:
-                    delta = response.delta if response.delta else ""
-                    model_response.message.content += delta
-                    model_response.delta = response.delta
-                    yield model_response
+                try:
+                    for response in call_result:
+                        delta = response.delta if response.delta else ""
+                        model_response.message.content += delta
+                        model_response.delta = response.delta
+                        yield model_response
+                finally:
+                    # a stream abandoned by the consumer is closed, ending its request
+                    if hasattr(call_result, "close"):
+                        call_result.close()
                 self.logger.info(self.logger.format_chat_message(model_response))
             return gen()
         else:
@@ -89,19 +226,45 @@ class LlamaIndexGenerationModel(BaseModel):
     def _call(self, model_response: ModelResponse, stream: bool = False, **kwargs):
         data = model_response.meta_data["data"]
         # FIXME: special case for OpenAI model, is this necessary?
-        data.pop("stream")
-        if "prompt" in data:
-            if stream:
-                model_response.raw = self.model.stream_complete(**data)
-            else:
-                model_response.raw = self.model.complete(**data)
-        elif "messages" in data:
-            if stream:
-                model_response.raw = self.model.stream_chat(**data)
+        data.pop("stream", None)
+
+        # streaming calls are never cached
+        cache_key = self.response_cache_key(data) if self.cache_enabled and not stream else None
+        if cache_key is not None:
+            response = self._lookup_response(cache_key)
+            if response is not None:
+                model_response.raw = self._cached_raw(data, response)
+                model_response.meta_data["cache_hit"] = True
+                return
+
+        tokens = self._estimate_request_tokens(data)
+        self.rate_limiter.acquire(tokens)
+        try:
+            if "prompt" in data:
+                if stream:
+                    model_response.raw = self.model.stream_complete(**data)
+                else:
+                    model_response.raw = self.model.complete(**data)
+            elif "messages" in data:
+                if stream:
+                    model_response.raw = self.model.stream_chat(**data)
+                else:
+                    model_response.raw = self.model.chat(**data)
             else:
-                model_response.raw = self.model.chat(**data)
+                raise RuntimeError("prompt or messages is missing!")
+        except BaseException:
+            self.rate_limiter.release()
+            raise
+
+        if stream:
+            # the request stays in flight until its stream is consumed or closed
+            model_response.raw = self.rate_limiter.release_after(model_response.raw)
         else:
-            raise RuntimeError("prompt or messages is missing!")
+            self.rate_limiter.release()
+            self._adjust_request_tokens(tokens, model_response.raw)
+
+        if cache_key is not None:
+            self._cache_response(cache_key, model_response.raw)
 
     async def _async_call(self, model_response: ModelResponse, **kwargs):
         """
@@ -120,9 +283,23 @@ class LlamaIndexGenerationModel(BaseModel):
         """
         data = model_response.meta_data["data"]
 
-        if "prompt" in data:
-            model_response.raw = await self.model.acomplete(**data)
-        elif "messages" in data:
-            model_response.raw = await self.model.achat(**data)
-        else:
-            raise RuntimeError("prompt or messages is missing!")
+        cache_key = self.response_cache_key(data) if self.cache_enabled else None
+        if cache_key is not None:
+            response = self._lookup_response(cache_key)
+            if response is not None:
+                model_response.raw = self._cached_raw(data, response)
+                model_response.meta_data["cache_hit"] = True
+                return
+
+        tokens = self._estimate_request_tokens(data)
+        async with self.rate_limiter.alimit(tokens):
+            if "prompt" in data:
+                model_response.raw = await self.model.acomplete(**data)
+            elif "messages" in data:
+                model_response.raw = await self.model.achat(**data)
+            else:
+                raise RuntimeError("prompt or messages is missing!")
+        self._adjust_request_tokens(tokens, model_response.raw)
+
+        if cache_key is not None:
+            self._cache_response(cache_key, model_response.raw)
@@ -1,13 +1,21 @@
-from typing import List
+import asyncio
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
 
 from llama_index.core.data_structs import Node
 from llama_index.core.schema import NodeWithScore
 from llama_index.postprocessor.dashscope_rerank import DashScopeRerank
 
 from memoryscope.core.models.base_model import BaseModel, MODEL_REGISTRY
+from memoryscope.core.memoryscope_context import MemoryscopeContext
+from memoryscope.core.models.fake_backends import FakeRank
 from memoryscope.enumeration.model_enum import ModelEnum
 from memoryscope.scheme.model_response import ModelResponse
 from memoryscope.core.utils.logger import Logger
+from memoryscope.core.utils.lru_cache import LruCache
+from memoryscope.core.utils.tool_functions import md5_hash
 
 
 class LlamaIndexRankModel(BaseModel):
@@ -16,19 +24,96 @@ class LlamaIndexRankModel(BaseModel):
     to a provided query, utilizing the DashScope Rerank model. It transforms document lists
     and queries into a compatible format for ranking, manages the ranking process, and allocates
     rank scores to individual documents.
+    Large document lists are split into chunks of `chunk_size` documents, reranked concurrently, one upstream request
+    per chunk, and their scores merged back by the original index of each document.
+    Scores are cached by (normalized query hash, document hash), only the documents missed are sent upstream. As the
+    key holds the hash of the content, a memory whose content changes is reranked again.
     """
     m_type: ModelEnum = ModelEnum.RANK_MODEL
 
     MODEL_REGISTRY.register("dashscope_rank", DashScopeRerank)
-    
-    def __init__(self, *args, **kwargs):
+    MODEL_REGISTRY.register("fake_rank", FakeRank)
+
+    def __init__(self,
+                 *args,
+                 chunk_size: int = 100,
+                 chunk_workers: int = 4,
+                 cache_size: int = 10000,
+                 cache_ttl: float = 3600,
+                 **kwargs):
+        """
+        Initializes the LlamaIndexRankModel.
+
+        Args:
+            chunk_size (int): The max number of documents of one upstream request, below the 500 documents limit of
+                the Dashscope rerank model.
+            chunk_workers (int): The max number of chunks reranked concurrently.
+            cache_size (int): The max number of scores cached in memory, 0 to disable the cache.
+            cache_ttl (float): The seconds a score stays cached, never expires if not set.
+            *args, **kwargs: The arguments of BaseModel.
+        """
         super().__init__(*args, **kwargs)
+        self.chunk_size: int = chunk_size
+        self.chunk_workers: int = chunk_workers
+        # a pool of its own, the chunks of a worker running in the context thread pool must not wait for that pool
+        self._chunk_pool: ThreadPoolExecutor | None = None
+        self._chunk_pool_lock = threading.Lock()
+        self.cache: LruCache | None = LruCache(max_size=cache_size, ttl=cache_ttl) if cache_size > 0 else None
+        self.cache_hits: int = 0
+        self.cache_misses: int = 0
+        self._cache_lock = threading.Lock()
         self.logger = Logger.get_logger("llama_index_rank_model")
 
+    @property
+    def chunk_pool(self) -> ThreadPoolExecutor:
+        if self._chunk_pool is None:
+            with self._chunk_pool_lock:
+                if self._chunk_pool is None:
+                    self._chunk_pool = ThreadPoolExecutor(max_workers=self.chunk_workers,
+                                                          thread_name_prefix="rank_chunk")
+        return self._chunk_pool
+
+    @property
+    def cache_hit_ratio(self) -> float:
+        total = self.cache_hits + self.cache_misses
+        return self.cache_hits / total if total else 0.0
+
+    def _cache_key(self, query_hash: str, document: str) -> tuple:
+        return self.module_name, self.model_name, query_hash, md5_hash(document)
+
+    @staticmethod
+    def _query_hash(query: str) -> str:
+        # queries differing only in case or whitespace share their scores
+        return md5_hash(re.sub(r"\s+", " ", query.strip().lower()))
+
+    def _lookup_scores(self, query: str, documents: List[str]) -> Dict[int, float]:
+        """
+        Looks up the cached scores of the documents, and reports the hit ratio to the monitor.
+
+        Returns:
+            Dict[int, float]: The cached scores by document index.
+        """
+        if self.cache is None:
+            return {}
+        query_hash = self._query_hash(query)
+        keys = [self._cache_key(query_hash, doc) for doc in documents]
+        cached = self.cache.get_many(keys)
+        scores = {idx: cached[key] for idx, key in enumerate(keys) if key in cached}
+
+        with self._cache_lock:
+            self.cache_hits += len(scores)
+            self.cache_misses += len(documents) - len(scores)
+        monitor = MemoryscopeContext().monitor
+        if monitor is not None:
+            monitor.add(key=f"{self.model_name}.rank_cache_hit_ratio", value=self.cache_hit_ratio)
+        return scores
+
     def before_call(self, model_response: ModelResponse, **kwargs):
         """
         Prepares necessary data before the ranking call by extracting the query and documents,
         ensuring they are valid, and initializing nodes with dummy scores.
+        Each node is identified by the index of its document, to merge the scores of the chunks back. Only the
+        nodes whose score is not cached are ranked.
 
         Args:
             model_response: model response
@@ -40,14 +125,15 @@ class LlamaIndexRankModel(BaseModel):
             documents = [documents]
         assert query and documents and all(documents), \
             f"query or documents is empty! query={query}, documents={len(documents)}"
-        assert len(documents) < 500, \
-            "The input documents of Dashscope rerank model should not larger than 500!"
         # Using -1.0 as dummy scores
-        nodes = [NodeWithScore(node=Node(text=doc), score=-1.0) for doc in documents]
+        nodes = [NodeWithScore(node=Node(text=doc, id_=str(idx)), score=-1.0) for idx, doc in enumerate(documents)]
+
+        cached_scores = self._lookup_scores(query, documents)
 
         model_response.meta_data.update({
-            "data": {"nodes": nodes, "query_str": query, "top_n": len(documents)},
-            "documents_map": {doc: idx for idx, doc in enumerate(documents)},
+            "data": {"nodes": nodes, "query_str": query},
+            "cached_scores": cached_scores,
+            "miss_nodes": [node for idx, node in enumerate(nodes) if idx not in cached_scores],
         })
 
     def after_call(self, model_response: ModelResponse, **kwargs) -> ModelResponse:
@@ -65,18 +151,34 @@ class LlamaIndexRankModel(BaseModel):
         if not model_response.rank_scores:
             model_response.rank_scores = {}
 
-        documents_map = model_response.meta_data["documents_map"]
-        for node in model_response.raw:
-            text = node.node.text
-            idx = documents_map[text]
-            model_response.rank_scores[idx] = node.score
+        model_response.rank_scores.update(model_response.meta_data["cached_scores"])
+        new_scores = {int(node.node.node_id): node.score for node in model_response.raw}
+        model_response.rank_scores.update(new_scores)
+
+        if self.cache is not None and new_scores:
+            data = model_response.meta_data["data"]
+            query_hash = self._query_hash(data["query_str"])
+            self.cache.put_many({self._cache_key(query_hash, data["nodes"][idx].node.text): score
+                                 for idx, score in new_scores.items()})
 
         self.logger.info(self.logger.format_rank_message(model_response))
         return model_response
 
+    def _chunks(self, nodes: List[NodeWithScore]) -> List[List[NodeWithScore]]:
+        chunk_size = max(self.chunk_size, 1)
+        return [nodes[i: i + chunk_size] for i in range(0, len(nodes), chunk_size)]
+
+    def _rank_chunk(self, query_str: str, nodes: List[NodeWithScore]) -> List[NodeWithScore]:
+        # a shallow copy per chunk, instead of setting top_n on the model shared by concurrent calls
+        model = self.model.copy(update={"top_n": len(nodes)})
+        tokens = self.estimate_tokens(query_str, *[node.node.text for node in nodes])
+        with self.rate_limiter.limit(tokens):
+            return model.postprocess_nodes(nodes=nodes, query_str=query_str)
+
     def _call(self, model_response: ModelResponse, **kwargs):
         """
-        Executes the ranking process by passing prepared data to the model's postprocessing method.
+        Executes the ranking process by passing prepared data to the model's postprocessing method, one chunk of
+        the documents missed by the cache per call, the chunks reranked concurrently.
 
         Args:
             **kwargs: Keyword arguments (unused).
@@ -84,13 +186,20 @@ class LlamaIndexRankModel(BaseModel):
         Returns:
             ModelResponse: A response object encapsulating the ranked nodes.
         """
-        self.model.top_n = model_response.meta_data["data"]["top_n"]
-        model_response.meta_data["data"].pop("top_n")
-        model_response.raw = self.model.postprocess_nodes(**model_response.meta_data["data"])
-
-    async def _async_call(self, **kwargs) -> ModelResponse:
+        data = model_response.meta_data["data"]
+        chunks = self._chunks(model_response.meta_data["miss_nodes"])
+        if not chunks:
+            model_response.raw = []
+        elif len(chunks) == 1:
+            model_response.raw = self._rank_chunk(data["query_str"], chunks[0])
+        else:
+            results = self.chunk_pool.map(lambda chunk: self._rank_chunk(data["query_str"], chunk), chunks)
+            model_response.raw = [node for result in results for node in result]
+
+    async def _async_call(self, model_response: ModelResponse, **kwargs):
         """
-        Asynchronous wrapper for the `_call` method, maintaining the same functionality.
+        Asynchronous version of `_call`: the llama-index rerankers have no async api, so each chunk is reranked in a
+        worker thread and the chunks are awaited together.
 
         Args:
             **kwargs: Keyword arguments (unused).
@@ -98,4 +207,7 @@ class LlamaIndexRankModel(BaseModel):
         Returns:
             ModelResponse: A response object encapsulating the ranked nodes.
         """
-        raise NotImplementedError
+        data = model_response.meta_data["data"]
+        results = await asyncio.gather(*[asyncio.to_thread(self._rank_chunk, data["query_str"], chunk)
+                                         for chunk in self._chunks(model_response.meta_data["miss_nodes"])])
+        model_response.raw = [node for result in results for node in result]
@@ -3,6 +3,9 @@ from .base_monitor import BaseMonitor
 from .dummy_memory_store import DummyMemoryStore
 from .dummy_monitor import DummyMonitor
 from .llama_index_es_memory_store import LlamaIndexEsMemoryStore
+from .memory_dump import MemoryDump
+from .numpy_memory_store import NumpyMemoryStore
+from .write_behind_memory_store import WriteBehindMemoryStore
 from .llama_index_sync_elasticsearch import (
     # get_elasticsearch_client,
     # _mode_must_match_retrieval_strategy,
@@ -18,6 +21,9 @@ __all__ = [
     "DummyMemoryStore",
     "DummyMonitor",
     "LlamaIndexEsMemoryStore",
+    "MemoryDump",
+    "NumpyMemoryStore",
+    "WriteBehindMemoryStore",
     "ESCombinedRetrieveStrategy",
     "SyncElasticsearchStore"
 ]
\ No newline at end of file
@@ -1,5 +1,6 @@
+import asyncio
 from abc import ABCMeta, abstractmethod
-from typing import Dict, List
+from typing import Dict, Iterator, List, Tuple
 
 from memoryscope.scheme.memory_node import MemoryNode
 
@@ -14,7 +15,9 @@ class BaseMemoryStore(metaclass=ABCMeta):
     def retrieve_memories(self,
                           query: str = "",
                           top_k: int = 3,
-                          filter_dict: Dict[str, List[str]] = None) -> List[MemoryNode]:
+                          filter_dict: Dict[str, List[str]] = None,
+                          return_vectors: bool = True,
+                          query_vector: List[float] = None) -> List[MemoryNode]:
         """
         Retrieves a list of MemoryNode objects that are most relevant to the query,
         considering a filter dictionary for additional constraints. The number of nodes returned
@@ -25,6 +28,10 @@ class BaseMemoryStore(metaclass=ABCMeta):
             top_k (int): The maximum number of MemoryNode objects to return.
             filter_dict (Dict[str, List[str]]): A dictionary with keys representing filter fields
                                                 and values as lists of strings for filtering criteria.
+            return_vectors (bool): Whether to fill the vectors of the MemoryNode objects. Skipping them saves the
+                                   transfer and the decoding of the embeddings when the caller does not need them.
+            query_vector (List[float]): The query embedding already computed by the caller with
+                                        `get_query_embedding`, so that the store does not embed the query again.
 
         Returns:
             List[MemoryNode]: A list of MemoryNode objects sorted by relevance to the query,
@@ -36,7 +43,8 @@ class BaseMemoryStore(metaclass=ABCMeta):
     async def a_retrieve_memories(self,
                                   query: str = "",
                                   top_k: int = 3,
-                                  filter_dict: Dict[str, List[str]] = None) -> List[MemoryNode]:
+                                  filter_dict: Dict[str, List[str]] = None,
+                                  return_vectors: bool = True) -> List[MemoryNode]:
         """
         Asynchronously retrieves a list of MemoryNode objects that best match the query,
         respecting a filter dictionary, with the result size capped at top_k.
@@ -45,12 +53,70 @@ class BaseMemoryStore(metaclass=ABCMeta):
             query (str): The text to search for in memory nodes.
             top_k (int): Maximum number of nodes to return.
             filter_dict (Dict[str, List[str]]): Filters to apply on memory nodes.
+            return_vectors (bool): Whether to fill the vectors of the MemoryNode objects.
 
         Returns:
             List[MemoryNode]: A list of up to top_k MemoryNode objects matching the criteria.
         """
         pass
 
+    def retrieve_memories_multi(self,
+                                query: str,
+                                sub_queries: List[Tuple[Dict[str, List[str]], int]],
+                                return_vectors: bool = True,
+                                query_vector: List[float] = None) -> List[List[MemoryNode]]:
+        """
+        Retrieves memories of several (filter_dict, top_k) sub-queries sharing the same query. Subclasses should
+        override it to embed the query once and run all sub-queries together; the default one simply calls
+        `retrieve_memories` for each sub-query.
+
+        Args:
+            query (str): The query string used to find relevant memories.
+            sub_queries (List[Tuple[Dict[str, List[str]], int]]): A list of (filter_dict, top_k).
+            return_vectors (bool): Whether to fill the vectors of the MemoryNode objects.
+            query_vector (List[float]): The query embedding already computed by the caller with
+                                        `get_query_embedding`, so that the store does not embed the query again.
+
+        Returns:
+            List[List[MemoryNode]]: The MemoryNode objects of each sub-query, in the order of `sub_queries`.
+        """
+        return [self.retrieve_memories(query=query, top_k=top_k, filter_dict=filter_dict, return_vectors=return_vectors,
+                                       query_vector=query_vector)
+                for filter_dict, top_k in sub_queries]
+
+    def iter_memories(self,
+                      filter_dict: Dict[str, List[str]] = None,
+                      page_size: int = 500,
+                      return_vectors: bool = False) -> Iterator[List[MemoryNode]]:
+        """
+        Scans all MemoryNode objects matching the filter dictionary, page by page. Unlike `retrieve_memories`
+        without query, the scan is not capped, and only one page is held in memory at a time.
+
+        Subclasses should override it with a native scan. The default one re-runs `retrieve_memories` without query
+        on a window doubled each round until the store returns fewer nodes than asked, and yields the nodes not seen
+        before, which relies on the store listing the nodes in a stable order.
+
+        Args:
+            filter_dict (Dict[str, List[str]]): Filters to apply on memory nodes.
+            page_size (int): The number of MemoryNode objects of each page.
+            return_vectors (bool): Whether to fill the vectors of the MemoryNode objects.
+
+        Returns:
+            Iterator[List[MemoryNode]]: The pages of MemoryNode objects, in no particular order.
+        """
+        seen_ids = set()
+        top_k = page_size
+        while True:
+            nodes = self.retrieve_memories(query="", top_k=top_k, filter_dict=filter_dict,
+                                           return_vectors=return_vectors)
+            new_nodes = [n for n in nodes if n.memory_id not in seen_ids]
+            seen_ids.update(n.memory_id for n in new_nodes)
+            for i in range(0, len(new_nodes), page_size):
+                yield new_nodes[i: i + page_size]
+            if len(nodes) < top_k:
+                return
+            top_k *= 2
+
     @abstractmethod
     def batch_insert(self, nodes: List[MemoryNode]):
         pass
@@ -63,6 +129,25 @@ class BaseMemoryStore(metaclass=ABCMeta):
     def batch_delete(self, nodes: List[MemoryNode]):
         pass
 
+    async def a_batch_insert(self, nodes: List[MemoryNode]):
+        """
+        Asynchronously inserts the memory nodes. Subclasses with an asynchronous client should override it, the
+        default one runs `batch_insert` in a worker thread so that the event loop is not blocked.
+        """
+        await asyncio.to_thread(self.batch_insert, nodes)
+
+    async def a_batch_update(self, nodes: List[MemoryNode], update_embedding: bool = True):
+        """
+        Asynchronously updates the memory nodes, see `a_batch_insert`.
+        """
+        await asyncio.to_thread(self.batch_update, nodes, update_embedding)
+
+    async def a_batch_delete(self, nodes: List[MemoryNode]):
+        """
+        Asynchronously deletes the memory nodes, see `a_batch_insert`.
+        """
+        await asyncio.to_thread(self.batch_delete, nodes)
+
     def flush(self):
         """
         Flushes any pending memory updates or operations to ensure data consistency.
@@ -77,3 +162,9 @@ class BaseMemoryStore(metaclass=ABCMeta):
         Subclasses must implement this method to define how the memory store is properly closed.
         """
         pass
+
+    async def a_close(self):
+        """
+        Asynchronously closes the memory store, including the resources bound to the event loop.
+        """
+        self.close()
@@ -1,4 +1,5 @@
 from abc import ABCMeta, abstractmethod
+from typing import Any
 
 
 class BaseMonitor(metaclass=ABCMeta):
@@ -11,11 +12,13 @@ class BaseMonitor(metaclass=ABCMeta):
         pass
 
     @abstractmethod
-    def add(self):
+    def add(self, key: str = None, value: Any = None, **kwargs):
         """
         Abstract method to add data or events to the monitor.
         This method should be implemented by subclasses to define how data is added into the monitoring system.
 
+        :param key: The name of the metric or event, e.g. `gpt-4o.response_cache_hit_ratio`.
+        :param value: The value of the metric or the payload of the event.
         :return: None
         """
 
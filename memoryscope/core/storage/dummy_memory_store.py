@@ -1,4 +1,4 @@
-from typing import Dict, List
+from typing import Dict, Iterator, List
 
 from memoryscope.core.models.base_model import BaseModel
 from memoryscope.core.storage.base_memory_store import BaseMemoryStore
@@ -26,14 +26,23 @@ class DummyMemoryStore(BaseMemoryStore):
     def retrieve_memories(self,
                           query: str = "",
                           top_k: int = 3,
-                          filter_dict: Dict[str, List[str]] = None) -> List[MemoryNode]:
-        pass
+                          filter_dict: Dict[str, List[str]] = None,
+                          return_vectors: bool = True,
+                          query_vector: List[float] = None) -> List[MemoryNode]:
+        return []
 
     async def a_retrieve_memories(self,
                                   query: str = "",
                                   top_k: int = 3,
-                                  filter_dict: Dict[str, List[str]] = None) -> List[MemoryNode]:
-        pass
+                                  filter_dict: Dict[str, List[str]] = None,
+                                  return_vectors: bool = True) -> List[MemoryNode]:
+        return []
+
+    def iter_memories(self,
+                      filter_dict: Dict[str, List[str]] = None,
+                      page_size: int = 500,
+                      return_vectors: bool = False) -> Iterator[List[MemoryNode]]:
+        return iter([])
 
     def batch_insert(self, nodes: List[MemoryNode]):
         pass
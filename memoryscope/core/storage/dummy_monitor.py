@@ -1,3 +1,5 @@
+from typing import Any
+
 from memoryscope.core.storage.base_monitor import BaseMonitor
 
 
@@ -8,7 +10,7 @@ class DummyMonitor(BaseMonitor):
     This can be used for testing or in situations where a full monitor implementation is not required.
     """
 
-    def add(self):
+    def add(self, key: str = None, value: Any = None, **kwargs):
         """
         Placeholder for adding data to the monitor.
         This method currently does nothing.
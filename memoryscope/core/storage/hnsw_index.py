@@ -0,0 +1,136 @@
+from typing import Set, Tuple
+
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+
+class HnswIndex(object):
+    """
+    A Hierarchical Navigable Small World graph for approximate inner-product search over normalized vectors, backed
+    by the optional `hnswlib` package (`pip install hnswlib`). Each vector is attached to an integer label (the row of
+    the owning store). Removing a label only tombstones its graph node, tombstoned nodes are still traversed but
+    never returned, and the owner is expected to rebuild the index once the tombstone ratio grows too large.
+    """
+
+    def __init__(self,
+                 dim: int,
+                 m: int = 16,
+                 ef_construction: int = 100,
+                 ef_search: int = 64,
+                 init_capacity: int = 1024,
+                 seed: int = 0):
+        """
+        Initializes an empty HnswIndex.
+
+        Args:
+            dim (int): The dimension of the vectors.
+            m (int): The max number of neighbors per node on the upper layers, doubled on layer 0.
+            ef_construction (int): The beam width used when inserting.
+            ef_search (int): The default beam width used when searching.
+            init_capacity (int): The initial number of vectors allocated, doubled when full.
+            seed (int): The random seed used to draw node levels.
+        """
+        if not self.available():
+            raise ImportError("hnswlib is not installed, please `pip install hnswlib`!")
+        self.dim: int = dim
+        self.m: int = m
+        self.ef_construction: int = ef_construction
+        self.ef_search: int = ef_search
+
+        self._index = hnswlib.Index(space="ip", dim=dim)
+        self._index.init_index(max_elements=max(init_capacity, 1), ef_construction=ef_construction, M=m,
+                               random_seed=seed)
+        self._index.set_ef(ef_search)
+        self._labels: Set[int] = set()
+        self._deleted_cnt: int = 0
+
+    @staticmethod
+    def available() -> bool:
+        """
+        Returns whether the `hnswlib` backend is installed.
+        """
+        return hnswlib is not None
+
+    @property
+    def size(self) -> int:
+        """
+        Returns the number of searchable (not tombstoned) nodes.
+        """
+        return len(self._labels)
+
+    @property
+    def deleted_ratio(self) -> float:
+        """
+        Returns the ratio of tombstoned nodes.
+        """
+        total = len(self._labels) + self._deleted_cnt
+        return self._deleted_cnt / total if total else 0.0
+
+    def add(self, labels: np.ndarray, vectors: np.ndarray):
+        """
+        Inserts a batch of normalized vectors under the given labels, the labels not being in the index yet.
+
+        Args:
+            labels (np.ndarray): The labels attached to the vectors.
+            vectors (np.ndarray): The (n, dim) normalized vectors.
+        """
+        labels = np.asarray(labels, dtype=np.int64)
+        if not len(labels):
+            return
+        count = self._index.get_current_count() + len(labels)
+        capacity = self._index.get_max_elements()
+        if count > capacity:
+            while capacity < count:
+                capacity *= 2
+            self._index.resize_index(capacity)
+        self._index.add_items(np.asarray(vectors, dtype=np.float32).reshape(len(labels), self.dim), labels)
+        self._labels.update(labels.tolist())
+
+    def remove(self, label: int):
+        """
+        Tombstones the node attached to the label, if any.
+
+        Args:
+            label (int): The label to remove.
+        """
+        if label in self._labels:
+            self._labels.remove(label)
+            self._index.mark_deleted(label)
+            self._deleted_cnt += 1
+
+    def search(self,
+               query: np.ndarray,
+               top_k: int,
+               ef: int = None,
+               allowed: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Searches the approximate top_k most similar vectors. Fewer results are returned if the graph search did not
+        reach top_k allowed nodes, the caller may then fall back to an exact search.
+
+        Args:
+            query (np.ndarray): The normalized query vector.
+            top_k (int): The number of results.
+            ef (int): The beam width on layer 0, defaults to `ef_search`. Always at least `top_k`.
+            allowed (np.ndarray): An optional boolean mask indexed by label, only allowed labels are returned.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The labels and similarities sorted by descending similarity.
+        """
+        top_k = min(top_k, self.size)
+        if top_k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        self._index.set_ef(max(ef or self.ef_search, top_k))
+        filter_fn = None if allowed is None else (lambda label: bool(allowed[label]))
+        try:
+            labels, distances = self._index.knn_query(np.asarray(query, dtype=np.float32), k=top_k,
+                                                      filter=filter_fn)
+        except RuntimeError:
+            # less than top_k allowed nodes reached
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        # the `ip` distance is 1 - inner product
+        return labels[0].astype(np.int64), (1.0 - distances[0]).astype(np.float32)
@@ -1,6 +1,6 @@
 import random
 import pickle
-from typing import Dict, List
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
 
 from llama_index.core import VectorStoreIndex
 from llama_index.core.schema import TextNode, NodeWithScore, QueryBundle
@@ -11,10 +11,23 @@ from memoryscope.core.storage.llama_index_sync_elasticsearch import (SyncElastic
                                                                      ESCombinedRetrieveStrategy,
                                                                      _to_elasticsearch_filter)
 from memoryscope.core.utils.logger import Logger
+from memoryscope.core.utils.tool_functions import vector_to_base64, base64_to_vector
 from memoryscope.scheme.memory_node import MemoryNode
 
 
 class LlamaIndexEsMemoryStore(BaseMemoryStore):
+    # MemoryNode fields not stored in the metadata of the elasticsearch documents
+    NON_METADATA_FIELDS: Set[str] = {"content", "vector", "score_recall", "score_rank", "score_rerank"}
+    # the metadata mappings declared at index creation, strings keep the `.keyword` sub field the filters use
+    METADATA_MAPPINGS: Dict[str, Any] = {
+        **{key: {"type": "text", "fields": {"keyword": {"type": "keyword", "ignore_above": 256}}}
+           for key in ["memory_id", "user_name", "target_name", "memory_type", "action_status", "store_status",
+                       "key", "value", "dt"]},
+        **{key: {"type": "long"} for key in ["timestamp", "obs_reflected", "obs_updated"]},
+        # never searched, only returned
+        "key_vector": {"type": "text", "index": False},
+        "_node_content": {"type": "text", "index": False},
+    }
 
     def __init__(self,
                  embedding_model: BaseModel,
@@ -22,14 +35,34 @@ class LlamaIndexEsMemoryStore(BaseMemoryStore):
                  es_url: str,
                  retrieve_mode: str = "dense",
                  hybrid_alpha: float = None,
+                 delete_chunk_size: int = 500,
+                 emb_dims: int = None,
+                 create_index: bool = True,
+                 routing: bool = False,
+                 index_name_template: str = None,
+                 index_buckets: int = 0,
+                 quantization: str = None,
+                 rescore_oversample: float = None,
                  **kwargs):
-        self.emb_dims = None
+        self.emb_dims = emb_dims
+        self.delete_chunk_size: int = delete_chunk_size
         self.index_name = index_name
         self.embedding_model: BaseModel = embedding_model
-        retrieval_strategy = ESCombinedRetrieveStrategy(retrieve_mode=retrieve_mode, hybrid_alpha=hybrid_alpha)
+        # `int8` or `int4` scalar quantization of the hnsw vectors, applied to the indices created from now on
+        if quantization not in (None, "none", "int8", "int4"):
+            raise ValueError(f"quantization={quantization} is not supported by elasticsearch!")
+        index_options = {"type": f"{quantization}_hnsw"} if quantization not in (None, "none") else None
+        retrieval_strategy = ESCombinedRetrieveStrategy(retrieve_mode=retrieve_mode,
+                                                        hybrid_alpha=hybrid_alpha,
+                                                        index_options=index_options,
+                                                        rescore_oversample=rescore_oversample)
         self.es_store = SyncElasticsearchStore(index_name=index_name,
                                                es_url=es_url,
                                                retrieval_strategy=retrieval_strategy,
+                                               metadata_mappings=self.METADATA_MAPPINGS,
+                                               routing=routing,
+                                               index_name_template=index_name_template,
+                                               index_buckets=index_buckets,
                                                **kwargs)
 
         # TODO The llamaIndex utilizes some deprecated functions, hence langchain logs warning messages. By
@@ -38,30 +71,71 @@ class LlamaIndexEsMemoryStore(BaseMemoryStore):
                                                         embed_model=self.embedding_model.model)
 
         self.logger = Logger.get_logger("es_memory_store")
+        if create_index:
+            self.create_index()
+
+    def create_index(self):
+        """
+        Creates the index with the declared mappings if it does not exist. The embedding dims are probed once with
+        the embedding model if `emb_dims` is not configured. With a bucket `index_name_template` all the bucket
+        indices are created; the per tenant indices are created on their first insert.
+        """
+        if self.es_store.index_name_template:
+            indices = self.es_store.bucket_indices()
+        else:
+            indices = [self.index_name]
+        indices = [index for index in indices if not self.es_store.has_index(index)]
+        if not indices:
+            return
+
+        if not self.emb_dims:
+            self.emb_dims = len(self.embedding_model.get_query_embedding("get num dimensions"))
+        for index in indices:
+            self.es_store.create_index(self.emb_dims, index)
+
+    def _route(self, filter_dict: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+        """
+        Returns the (index, routing) a query searches, only the shard or index of the tenant if the filter pins it.
+        """
+        return self.es_store.route(filter_dict or {})
+
+    def _node_routes(self, nodes: List[MemoryNode]) -> Dict[str, Tuple[str, Optional[str]]]:
+        """
+        Returns the (index, routing) of each node by its memory id, the same as its insert.
+        """
+        return {node.memory_id: self.es_store.route({key: getattr(node, key, None)
+                                                     for key in self.es_store.tenant_fields})
+                for node in nodes}
 
     def retrieve_memories(self,
                           query: str = "",
                           top_k: int = 3,
-                          filter_dict: Dict[str, List[str]] | Dict[str, str] = None) -> List[MemoryNode]:
-        # if index is not created, return []
-        exists = self.es_store.client.indices.exists(index=self.index_name)
-        if not exists:
-            return []
-
+                          filter_dict: Dict[str, List[str]] | Dict[str, str] = None,
+                          return_vectors: bool = True,
+                          query_vector: List[float] = None) -> List[MemoryNode]:
+        # a missing index is handled by the search itself as an empty result
         if filter_dict is None:
             filter_dict = {}
 
         es_filter = _to_elasticsearch_filter(filter_dict)
-        retriever = self.index.as_retriever(vector_store_kwargs={"es_filter": es_filter, "fields": ['embedding']},
+        fields = ['embedding'] if return_vectors else []
+        index, routing = self._route(filter_dict)
+        retriever = self.index.as_retriever(vector_store_kwargs={"es_filter": es_filter,
+                                                                 "fields": fields,
+                                                                 "index": index,
+                                                                 "routing": routing},
                                             similarity_top_k=top_k,
                                             sparse_top_k=top_k)
 
         if query:
-            text_nodes = retriever.retrieve(query)
-            if text_nodes and text_nodes[0].embedding:
-                self.emb_dims = len(text_nodes[0].embedding)
+            if query_vector is None:
+                query_vector = self.embedding_model.get_query_embedding(query)
+            query_bundle = QueryBundle(query_str=query, embedding=query_vector)
+            self.emb_dims = len(query_bundle.embedding)
+            text_nodes = retriever.retrieve(query_bundle)
         else:
-            text_nodes = self.es_store.sync_search_all_with_filter(es_filter, ['embedding'])
+            text_nodes = self.es_store.sync_search_all_with_filter(es_filter, fields, size=top_k, index=index,
+                                                                   routing=routing)
         self.logger.log_dictionary_info({
             "action": "retrieve_memories",
             "query": query,
@@ -69,29 +143,253 @@ class LlamaIndexEsMemoryStore(BaseMemoryStore):
         })
         return [self._text_node_2_memory_node(n) for n in text_nodes]
 
+    def retrieve_memories_multi(self,
+                                query: str,
+                                sub_queries: List[Tuple[Dict[str, List[str]], int]],
+                                return_vectors: bool = True,
+                                query_vector: List[float] = None) -> List[List[MemoryNode]]:
+        if not query:
+            return super().retrieve_memories_multi(query, sub_queries, return_vectors)
+
+        # embed the query once, if not done by the caller, then send all sub-queries in one `_msearch`
+        query_embedding = query_vector if query_vector is not None else self.embedding_model.get_query_embedding(query)
+        self.emb_dims = len(query_embedding)
+        valid_idx = [i for i, (_, top_k) in enumerate(sub_queries) if top_k > 0]
+        results = self.es_store.sync_multi_query(query_str=query,
+                                                 query_embedding=query_embedding,
+                                                 sub_queries=[(_to_elasticsearch_filter(sub_queries[i][0] or {}),
+                                                               sub_queries[i][1]) for i in valid_idx],
+                                                 fields=['embedding'] if return_vectors else [],
+                                                 routes=[self._route(sub_queries[i][0]) for i in valid_idx])
+
+        nodes_list: List[List[MemoryNode]] = [[] for _ in sub_queries]
+        for i, result in zip(valid_idx, results):
+            text_nodes = [NodeWithScore(node=node, score=score)
+                          for node, score in zip(result.nodes, result.similarities)]
+            self.logger.log_dictionary_info({
+                "action": "retrieve_memories_multi",
+                "query": query,
+                "text_nodes": [f"ID: {n.node_id} |Text: {n.text}" for n in text_nodes]
+            })
+            nodes_list[i] = [self._text_node_2_memory_node(n) for n in text_nodes]
+        return nodes_list
+
+    def iter_memories(self,
+                      filter_dict: Dict[str, List[str]] | Dict[str, str] = None,
+                      page_size: int = 500,
+                      return_vectors: bool = False) -> Iterator[List[MemoryNode]]:
+        es_filter = _to_elasticsearch_filter(filter_dict or {})
+        fields = ['embedding'] if return_vectors else []
+        index, routing = self._route(filter_dict)
+        for text_nodes in self.es_store.sync_scan_with_filter(es_filter, fields, page_size=page_size, index=index,
+                                                              routing=routing):
+            yield [self._text_node_2_memory_node(n) for n in text_nodes]
+
     async def a_retrieve_memories(self,
                                   query: str = "",
                                   top_k: int = 3,
-                                  filter_dict: Dict[str, List[str]] | Dict[str, str] = None) -> List[MemoryNode]:
-        raise NotImplementedError
+                                  filter_dict: Dict[str, List[str]] | Dict[str, str] = None,
+                                  return_vectors: bool = True) -> List[MemoryNode]:
+        es_filter = _to_elasticsearch_filter(filter_dict or {})
+        fields = ['embedding'] if return_vectors else []
+        index, routing = self._route(filter_dict)
+        if query:
+            query_embedding = await self.embedding_model.aget_query_embedding(query)
+            self.emb_dims = len(query_embedding)
+            result = await self.es_store.async_query(query, query_embedding, es_filter, top_k, fields, index, routing)
+            text_nodes = [NodeWithScore(node=node, score=score)
+                          for node, score in zip(result.nodes, result.similarities)]
+        else:
+            text_nodes = await self.es_store.async_search_all_with_filter(es_filter, fields, size=top_k, index=index,
+                                                                          routing=routing)
+        self.logger.log_dictionary_info({
+            "action": "a_retrieve_memories",
+            "query": query,
+            "text_nodes": [f"ID: {n.node_id} |Text: {n.text}" for n in text_nodes]
+        })
+        return [self._text_node_2_memory_node(n) for n in text_nodes]
+
+    def _embed_nodes(self, nodes: List[MemoryNode]):
+        """
+        Embeds the contents of the nodes without vectors in one call of the embedding model, so that its caches
+        apply. Nodes left without vectors are embedded by llama-index when inserted.
+        """
+        empty_nodes = [n for n in nodes if not n.vector]
+        if not empty_nodes:
+            return
+
+        response = self.embedding_model.call(text=[n.content for n in empty_nodes])
+        if response is None or not response.status:
+            self.logger.warning("embed nodes failed, fallback to the llama-index embedding.")
+            return
+
+        embeddings = response.embedding_results
+        if len(empty_nodes) == 1:
+            embeddings = [embeddings]
+        for node, embedding in zip(empty_nodes, embeddings):
+            node.vector = embedding
+
+    async def _a_embed_nodes(self, nodes: List[MemoryNode]):
+        """
+        Asynchronously embeds the nodes without vectors, see `_embed_nodes`. The asynchronous path has no
+        llama-index fallback, nodes still without vectors raise an error.
+        """
+        empty_nodes = [n for n in nodes if not n.vector]
+        if not empty_nodes:
+            return
+
+        response = await self.embedding_model.async_call(text=[n.content for n in empty_nodes])
+        if response is None or not response.status:
+            raise RuntimeError(f"embed nodes failed! details={response.details if response else None}")
+
+        embeddings = response.embedding_results
+        if len(empty_nodes) == 1:
+            embeddings = [embeddings]
+        for node, embedding in zip(empty_nodes, embeddings):
+            node.vector = embedding
 
     def batch_insert(self, nodes: List[MemoryNode]):
+        self._embed_nodes(nodes)
         self.index.insert_nodes([self._memory_node_2_text_node(node) for node in nodes])
 
+    async def a_batch_insert(self, nodes: List[MemoryNode]):
+        if not nodes:
+            return
+        await self._a_embed_nodes(nodes)
+        await self.es_store.async_add([self._memory_node_2_text_node(node) for node in nodes])
+
+    def _split_metadata_update(self, nodes: List[MemoryNode]) -> Tuple[Dict[str, Dict[str, Any]], List[MemoryNode]]:
+        """
+        Splits a metadata-only update into the partial metadata of each node, and the nodes whose content changed
+        which have to be reinserted.
+        """
+        reinsert_nodes = []
+        id_metadata_dict = {}
+        for node in nodes:
+            dirty_fields = node.dirty_fields - self.NON_METADATA_FIELDS
+            if "content" in node.dirty_fields:
+                reinsert_nodes.append(node)
+            elif dirty_fields:
+                # `meta_data` may be changed in place, which is not tracked
+                id_metadata_dict[node.memory_id] = self._memory_node_2_metadata(node, dirty_fields | {"meta_data"})
+            else:
+                id_metadata_dict[node.memory_id] = self._memory_node_2_metadata(node)
+        return id_metadata_dict, reinsert_nodes
+
+    def _missing_update_ids(self, errors: List[Dict[str, Any]]) -> Set[str]:
+        """
+        Returns the ids not found by the partial updates, which have to be reinserted, and logs the other errors.
+        """
+        missing_ids = set()
+        for error in errors:
+            if error.get("update", {}).get("status") == 404:
+                missing_ids.add(error["update"]["_id"])
+            else:
+                self.logger.warning(f"batch_update failed! item={error}")
+        return missing_ids
+
     def batch_update(self, nodes: List[MemoryNode], update_embedding: bool = True):
+        """
+        Updates the memory nodes. With `update_embedding`, the nodes are reinserted with their contents embedded
+        again. Otherwise only the metadata fields changed since the nodes were loaded are sent as scripted partial
+        updates, the stored text and vector being untouched, so that nodes loaded with `return_vectors=False` are
+        updated safely; the nodes whose content changed are reinserted.
+
+        The changes are tracked from the construction of a node or its last `mark_clean()`: the nodes must come from
+        the store, or `mark_clean()` must be called on a node built elsewhere before changing it, else a changed
+        content is not detected and only the metadata is written.
+
+        Args:
+            nodes (List[MemoryNode]): The nodes to update.
+            update_embedding (bool): Whether to embed the contents again.
+        """
         if update_embedding:
             for node in nodes:
                 node.vector = []
+            self.batch_delete(nodes)
+            self.batch_insert(nodes)
+            return
 
-        self.batch_delete(nodes)
-        self.batch_insert(nodes)
+        # metadata-only update: only the changed metadata fields are sent, the text and the vector are untouched
+        id_metadata_dict, reinsert_nodes = self._split_metadata_update(nodes)
+        errors = self.es_store.batch_update_metadata(id_metadata_dict,
+                                                     chunk_size=self.delete_chunk_size,
+                                                     routes=self._node_routes(nodes))
+        missing_ids = self._missing_update_ids(errors)
+        reinsert_nodes.extend([n for n in nodes if n.memory_id in missing_ids])
 
-    def batch_delete(self, nodes: List[MemoryNode]):
-        # TODO batch_delete
+        if reinsert_nodes:
+            self.batch_delete(reinsert_nodes)
+            self.batch_insert(reinsert_nodes)
         for node in nodes:
-            self.delete(node)
+            node.mark_clean()
+
+        self.logger.log_dictionary_info({
+            "action": "batch_update",
+            "partial_ids": [i for i in id_metadata_dict if i not in missing_ids],
+            "reinsert_ids": [n.memory_id for n in reinsert_nodes],
+        })
+
+    async def a_batch_update(self, nodes: List[MemoryNode], update_embedding: bool = True):
+        """
+        Asynchronously updates the memory nodes, see `batch_update`.
+        """
+        if update_embedding:
+            for node in nodes:
+                node.vector = []
+            await self.a_batch_delete(nodes)
+            await self.a_batch_insert(nodes)
+            return
+
+        id_metadata_dict, reinsert_nodes = self._split_metadata_update(nodes)
+        errors = await self.es_store.async_batch_update_metadata(id_metadata_dict,
+                                                                 chunk_size=self.delete_chunk_size,
+                                                                 routes=self._node_routes(nodes))
+        missing_ids = self._missing_update_ids(errors)
+        reinsert_nodes.extend([n for n in nodes if n.memory_id in missing_ids])
+
+        if reinsert_nodes:
+            await self.a_batch_delete(reinsert_nodes)
+            await self.a_batch_insert(reinsert_nodes)
+        for node in nodes:
+            node.mark_clean()
+
+        self.logger.log_dictionary_info({
+            "action": "a_batch_update",
+            "partial_ids": [i for i in id_metadata_dict if i not in missing_ids],
+            "reinsert_ids": [n.memory_id for n in reinsert_nodes],
+        })
+
+    def batch_delete(self, nodes: List[MemoryNode]):
+        if not nodes:
+            return
+
+        ids = [node.memory_id for node in nodes]
+        errors = self.es_store.batch_delete(ids, chunk_size=self.delete_chunk_size, routes=self._node_routes(nodes))
+        self.logger.log_dictionary_info({
+            "action": "batch_delete",
+            "ids": ids,
+        })
+        for error in errors:
+            self.logger.warning(f"batch_delete failed! item={error}")
+
+    async def a_batch_delete(self, nodes: List[MemoryNode]):
+        if not nodes:
+            return
+
+        ids = [node.memory_id for node in nodes]
+        errors = await self.es_store.async_batch_delete(ids,
+                                                        chunk_size=self.delete_chunk_size,
+                                                        routes=self._node_routes(nodes))
+        self.logger.log_dictionary_info({
+            "action": "a_batch_delete",
+            "ids": ids,
+        })
+        for error in errors:
+            self.logger.warning(f"a_batch_delete failed! item={error}")
 
     def insert(self, node: MemoryNode):
+        self._embed_nodes([node])
         self.index.insert_nodes([self._memory_node_2_text_node(node)])
         self.logger.log_dictionary_info({
             "action": "insert",
@@ -103,7 +401,8 @@ class LlamaIndexEsMemoryStore(BaseMemoryStore):
             "action": "delete",
             "id": node.memory_id,
         })
-        return self.es_store.delete(node.memory_id)
+        # a routed `_bulk` delete only hits the shard of the node, instead of a `delete_by_query` on all of them
+        return self.es_store.batch_delete([node.memory_id], routes=self._node_routes([node]))
 
     def update(self, node: MemoryNode, update_embedding: bool = True):
         if update_embedding:
@@ -117,12 +416,34 @@ class LlamaIndexEsMemoryStore(BaseMemoryStore):
         """
         self.es_store.close()
 
+    async def a_close(self):
+        await self.es_store.aclose()
+        self.close()
+
     def dummy_query_vector(self):
         random_floats = [random.uniform(0, 1) for _ in range(self.emb_dims)]
         return random_floats
 
-    @staticmethod
-    def _memory_node_2_text_node(memory_node: MemoryNode) -> TextNode:
+    @classmethod
+    def _memory_node_2_metadata(cls, memory_node: MemoryNode, fields: Set[str] = None) -> Dict[str, Any]:
+        """
+        Converts a MemoryNode object into the metadata stored along with its text and embedding.
+
+        Args:
+            memory_node (MemoryNode): The MemoryNode to be converted.
+            fields (Set[str]): Only keep these metadata fields if set.
+
+        Returns:
+            Dict[str, Any]: The metadata of the MemoryNode.
+        """
+        include = None if fields is None else set(fields) - cls.NON_METADATA_FIELDS
+        metadatas = memory_node.model_dump(include=include, exclude=cls.NON_METADATA_FIELDS | {"key_vector"})
+        if include is None or "key_vector" in include:
+            metadatas["key_vector"] = vector_to_base64(memory_node.key_vector)
+        return metadatas
+
+    @classmethod
+    def _memory_node_2_text_node(cls, memory_node: MemoryNode) -> TextNode:
         """
         Converts a MemoryNode object into a TextNode object.
 
@@ -133,24 +454,41 @@ class LlamaIndexEsMemoryStore(BaseMemoryStore):
             TextNode: The converted TextNode with content and metadata from the MemoryNode.
         """
         embedding = memory_node.vector
-        key_vector_str = pickle.dumps(memory_node.key_vector).decode('latin1')
         if not embedding:
             embedding = None
-        metadatas = memory_node.model_dump(exclude={"content",
-                                                    "vector",
-                                                    "key_vector",
-                                                    "score_recall",
-                                                    "score_rank",
-                                                    "score_rerank"})
-        metadatas["key_vector"] = key_vector_str
         return TextNode(id_=memory_node.memory_id,
                         text=memory_node.content,
                         embedding=embedding,
                         text_template="{content}",
-                        metadata=metadatas)
+                        metadata=cls._memory_node_2_metadata(memory_node))
         
 
 
+    @staticmethod
+    def decode_key_vector(key_vector_str: str) -> List[float]:
+        """
+        Decodes a stored key vector, either base64 float32 bytes or a legacy latin1 pickle string.
+
+        Args:
+            key_vector_str (str): The stored key vector.
+
+        Returns:
+            List[float]: The key vector, empty if not stored.
+        """
+        if not key_vector_str:
+            return []
+        if LlamaIndexEsMemoryStore.is_legacy_key_vector(key_vector_str):
+            return pickle.loads(key_vector_str.encode('latin1'))
+        return base64_to_vector(key_vector_str)
+
+    @staticmethod
+    def is_legacy_key_vector(key_vector_str: str) -> bool:
+        """
+        Tells whether a stored key vector is a legacy latin1 pickle string, which starts with the pickle protocol
+        opcode, never found in base64.
+        """
+        return bool(key_vector_str) and key_vector_str.startswith("\x80")
+
     @staticmethod
     def _text_node_2_memory_node(text_node: NodeWithScore) -> MemoryNode:
         """
@@ -163,11 +501,8 @@ class LlamaIndexEsMemoryStore(BaseMemoryStore):
             MemoryNode: The converted MemoryNode with text and metadata from the NodeWithScore.
         """
         
-        if text_node.metadata.get("key_vector", None):
-            key_vector = pickle.loads(text_node.metadata["key_vector"].encode('latin1'))
-        else:
-            key_vector = []
-        text_node.metadata["key_vector"] = key_vector
+        text_node.metadata["key_vector"] = LlamaIndexEsMemoryStore.decode_key_vector(
+            text_node.metadata.get("key_vector", None))
 
         text_node.metadata["vector"] = text_node.embedding if text_node.embedding else []
 
@@ -1,13 +1,17 @@
 """Elasticsearch vector store."""
 
-from typing import Any, Callable, Dict, List, Literal, Optional, Union, cast
+import asyncio
+import re
+from typing import Any, Callable, Dict, Iterator, List, Literal, Optional, Tuple, Union, cast
 
 import nest_asyncio
 import numpy as np
+from memoryscope.core.utils.tool_functions import md5_hash
 from memoryscope.core.utils.logger import Logger
 from memoryscope.core.memoryscope_context import get_memoryscope_context
 
-from elasticsearch import AsyncElasticsearch, Elasticsearch
+from elasticsearch import AsyncElasticsearch, BadRequestError, Elasticsearch, NotFoundError
+from elasticsearch.helpers import async_streaming_bulk, streaming_bulk
 from elasticsearch.helpers.vectorstore import (
     AsyncBM25Strategy,
     AsyncSparseVectorStrategy,
@@ -38,6 +42,10 @@ DISTANCE_STRATEGIES = Literal[
     "EUCLIDEAN_DISTANCE",
 ]
 
+# replaces each metadata field sent wholesale: a partial `doc` update would merge the nested objects, e.g. `meta_data`,
+# keeping the keys removed from them
+UPDATE_METADATA_SCRIPT = "ctx._source.metadata.putAll(params.metadata)"
+
 
 def get_elasticsearch_client(
         url: Optional[str] = None,
@@ -74,7 +82,8 @@ def get_elasticsearch_client(
             **connection_params, headers={"user-agent": get_user_agent()}
         )
 
-    es_client.info()  # use sync client so don't have to 'await' to just get info
+    if not use_async:
+        es_client.info()  # use sync client so don't have to 'await' to just get info
 
     return es_client
 
@@ -142,7 +151,13 @@ class ESCombinedRetrieveStrategy(AsyncDenseVectorStrategy):
             rrf: Union[bool, Dict[str, Any]] = True,
             text_field: Optional[str] = "text_field",
             hybrid_alpha: Optional[float] = None,
+            index_options: Optional[Dict[str, Any]] = None,
+            rescore_oversample: Optional[float] = None,
     ):
+        # e.g. {"type": "int8_hnsw"} to keep scalar-quantized vectors in the hnsw graph
+        self.index_options = index_options
+        # rescore the top `k * oversample` quantized candidates with the full-precision vectors
+        self.rescore_oversample = rescore_oversample
         if retrieve_mode == "dense":
             self.alpha = 1.0
         elif retrieve_mode == "sparse":
@@ -216,6 +231,9 @@ class ESCombinedRetrieveStrategy(AsyncDenseVectorStrategy):
             "boost": self.alpha if self.alpha is not None else 1.0,
         }
 
+        if self.rescore_oversample:
+            knn["rescore_vector"] = {"oversample": self.rescore_oversample}
+
         if query_vector is not None:
             knn["query_vector"] = query_vector
         else:
@@ -234,6 +252,18 @@ class ESCombinedRetrieveStrategy(AsyncDenseVectorStrategy):
         return {"knn": knn}
 
 
+    def es_mappings_settings(self,
+                             *,
+                             text_field: str,
+                             vector_field: str,
+                             num_dimensions: Optional[int]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        mappings, settings = super().es_mappings_settings(text_field=text_field,
+                                                          vector_field=vector_field,
+                                                          num_dimensions=num_dimensions)
+        if self.index_options:
+            mappings["properties"][vector_field]["index_options"] = self.index_options
+        return mappings, settings
+
     def before_index_creation(
         self, *, client: AsyncElasticsearch, text_field: str, vector_field: str
     ) -> None:
@@ -377,8 +407,18 @@ class SyncElasticsearchStore(BasePydanticVectorStore):
     retrieval_strategy: AsyncRetrievalStrategy
     logger: Logger = None
     log_elasticsearch_dynamic: bool = False
+    # the default `index.max_result_window` of elasticsearch, the max size of one search
+    max_result_window: int = 10000
+    # the metadata fields identifying a tenant, see `route`
+    tenant_fields: List[str] = ["user_name", "target_name"]
+    routing: bool = False
+    index_name_template: Optional[str] = None
+    index_buckets: int = 0
 
     _store = PrivateAttr()
+    # whether each index exists, asked to elasticsearch once per index
+    _index_states: Dict[str, bool] = PrivateAttr(default_factory=dict)
+    _async_client: Optional[AsyncElasticsearch] = PrivateAttr(default=None)
 
     def __init__(
             self,
@@ -394,6 +434,10 @@ class SyncElasticsearchStore(BasePydanticVectorStore):
             batch_size: int = 200,
             distance_strategy: Optional[DISTANCE_STRATEGIES] = "COSINE",
             retrieval_strategy: Optional[AsyncRetrievalStrategy] = None,
+            metadata_mappings: Optional[Dict[str, Any]] = None,
+            routing: bool = False,
+            index_name_template: Optional[str] = None,
+            index_buckets: int = 0,
     ) -> None:
         nest_asyncio.apply()
 
@@ -415,6 +459,7 @@ class SyncElasticsearchStore(BasePydanticVectorStore):
             "document_id": {"type": "keyword"},
             "doc_id": {"type": "keyword"},
             "ref_doc_id": {"type": "keyword"},
+            **(metadata_mappings or {}),
         }
 
         self._store = VectorStore(
@@ -440,6 +485,9 @@ class SyncElasticsearchStore(BasePydanticVectorStore):
             batch_size=batch_size,
             distance_strategy=distance_strategy,
             retrieval_strategy=retrieval_strategy,
+            routing=routing,
+            index_name_template=index_name_template,
+            index_buckets=index_buckets,
         )
 
         self.logger = Logger.get_logger("elastic_search")
@@ -455,9 +503,195 @@ class SyncElasticsearchStore(BasePydanticVectorStore):
         """
         return self._store.client
 
+    @property
+    def async_client(self) -> AsyncElasticsearch:
+        """
+        Get the asynchronous Elasticsearch client, created on first use with the connection params of the store.
+
+        Returns:
+            AsyncElasticsearch: The asynchronous Elasticsearch client.
+        """
+        if self._async_client is None:
+            self._async_client = get_elasticsearch_client(
+                url=self.es_url,
+                cloud_id=self.es_cloud_id,
+                api_key=self.es_api_key,
+                username=self.es_user,
+                password=self.es_password,
+                use_async=True,
+            )
+        return self._async_client
+
     def close(self) -> None:
         return self._store.close()
 
+    async def aclose(self) -> None:
+        """
+        Closes the asynchronous Elasticsearch client if it was created. Must be awaited in the event loop which
+        used it.
+        """
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+
+    @property
+    def index_exists(self) -> bool:
+        """
+        Whether the default index exists, see `has_index`.
+
+        Returns:
+            bool: True if the index exists.
+        """
+        return self.has_index(self.index_name)
+
+    def has_index(self, index: str) -> bool:
+        """
+        Whether the index exists. Elasticsearch is asked only once per index, then the state is kept by the index
+        creation, the inserts and the searches finding the index missing.
+
+        Args:
+            index (str): The index name.
+
+        Returns:
+            bool: True if the index exists.
+        """
+        if index not in self._index_states:
+            self._index_states[index] = bool(self.client.indices.exists(index=index))
+        return self._index_states[index]
+
+    def _on_index_missing(self, e: NotFoundError, index: str = None):
+        index = index or self.index_name
+        self.logger.warning(f"index={index} is missing! error={e}")
+        self._index_states[index] = False
+
+    def create_index(self, num_dimensions: int, index: str = None) -> bool:
+        """
+        Creates the index with the mappings of the retrieval strategy and the declared metadata mappings, instead of
+        the dynamic mappings elasticsearch would guess on the first insert.
+
+        Args:
+            num_dimensions (int): The dims of the embeddings.
+            index (str): The index name, the default index if not set.
+
+        Returns:
+            bool: True if the index is created, False if it already exists.
+        """
+        index = index or self.index_name
+        if self.has_index(index):
+            return False
+
+        mappings, settings = self.retrieval_strategy.es_mappings_settings(text_field=self.text_field,
+                                                                          vector_field=self.vector_field,
+                                                                          num_dimensions=num_dimensions)
+        metadata = mappings["properties"].get("metadata", {"properties": {}})
+        mappings["properties"]["metadata"] = {"properties": {**metadata["properties"],
+                                                             **self._store.metadata_mappings}}
+        try:
+            self.client.indices.create(index=index, mappings=mappings, settings=settings)
+        except BadRequestError as e:
+            # created by another process meanwhile
+            if e.error != "resource_already_exists_exception":
+                raise
+        self._index_states[index] = True
+        self.logger.info(f"create index={index} num_dimensions={num_dimensions}")
+        return True
+
+    def route(self, values: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+        """
+        Routes a document or a query by the values of its tenant fields, e.g. the metadata of a document or the
+        filter dict of a query. With `routing`, the documents of a tenant share one shard and the queries pinning
+        all tenant fields only search it. With `index_name_template`, e.g. `{index_name}_{bucket}` or
+        `{index_name}_{user_name}`, the tenants are spread over several indices, `bucket` being the hash of the
+        tenant modulo `index_buckets`; the values a query does not pin are replaced by the `*` wildcard.
+
+        Args:
+            values (Dict[str, Any]): The tenant field values. A list value counts if it has exactly one item.
+
+        Returns:
+            Tuple[str, Optional[str]]: The index name or pattern, and the routing value or None.
+        """
+        tenant = []
+        for key in self.tenant_fields:
+            value = values.get(key)
+            if isinstance(value, list):
+                value = value[0] if len(value) == 1 else None
+            tenant.append(value if isinstance(value, str) else None)
+        tenant_key = "/".join(tenant) if None not in tenant else None
+
+        routing = tenant_key if self.routing else None
+        if not self.index_name_template:
+            return self.index_name, routing
+
+        # index names are lowercase and must not contain any of \/*?"<>| ,#:
+        format_kwargs = {key: re.sub(r'[\\/*?"<>| ,#:]', "_", value.lower()) if value is not None else "*"
+                         for key, value in zip(self.tenant_fields, tenant)}
+        format_kwargs["index_name"] = self.index_name
+        if tenant_key is None:
+            format_kwargs["bucket"] = "*"
+        else:
+            format_kwargs["bucket"] = int(md5_hash(tenant_key)[:8], 16) % max(self.index_buckets, 1)
+        return self.index_name_template.format(**format_kwargs), routing
+
+    @property
+    def index_pattern(self) -> str:
+        """
+        The index name or pattern covering all the documents of the store.
+        """
+        return self.route({})[0]
+
+    def bucket_indices(self) -> List[str]:
+        """
+        Returns the index names of all buckets if `index_name_template` spreads the tenants only by bucket, they can
+        then be created upfront. Empty otherwise.
+        """
+        template = self.index_name_template
+        if not template or any(f"{{{key}}}" in template for key in self.tenant_fields):
+            return []
+        return [template.format(index_name=self.index_name, bucket=i) for i in range(max(self.index_buckets, 1))]
+
+    def _index_action(self, node: BaseNode) -> Dict[str, Any]:
+        """
+        Builds the `_bulk` index action of a node, routed by its metadata.
+        """
+        index, routing = self.route(node.metadata)
+        action = {
+            "_op_type": "index",
+            "_index": index,
+            "_id": node.node_id,
+            self.text_field: node.get_content(metadata_mode=MetadataMode.NONE),
+            self.vector_field: node.get_embedding(),
+            "metadata": node_to_metadata_dict(node, remove_text=True),
+        }
+        if routing:
+            action["_routing"] = routing
+        return action
+
+    def _id_actions(self,
+                    op_type: str,
+                    ids: List[str],
+                    routes: Optional[Dict[str, Tuple[str, Optional[str]]]] = None,
+                    id_metadata_dict: Optional[Dict[str, Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """
+        Builds the `_bulk` delete or update actions of the ids, routed by `routes` (id -> (index, routing)). The
+        update actions overwrite the metadata fields of `id_metadata_dict`, see `UPDATE_METADATA_SCRIPT`.
+        """
+        actions = []
+        for _id in ids:
+            index, routing = (routes or {}).get(_id, (self.index_name, None))
+            action = {"_op_type": op_type, "_index": index, "_id": _id}
+            if routing:
+                action["_routing"] = routing
+            if id_metadata_dict is not None:
+                action["script"] = {"source": UPDATE_METADATA_SCRIPT,
+                                    "lang": "painless",
+                                    "params": {"metadata": id_metadata_dict[_id]}}
+            actions.append(action)
+        return actions
+
+    @staticmethod
+    def _action_indices(actions: List[Dict[str, Any]]) -> str:
+        return ",".join(dict.fromkeys(action["_index"] for action in actions))
+
     def add(
             self,
             nodes: List[BaseNode],
@@ -521,31 +755,17 @@ class SyncElasticsearchStore(BasePydanticVectorStore):
         if len(nodes) == 0:
             return []
 
-        # Extract necessary components from each node
-        embeddings: List[List[float]] = []  # Embedding vectors
-        texts: List[str] = []  # Textual contents of nodes
-        metadatas: List[dict] = []  # Metadata associated with nodes
-        ids: List[str] = []  # Unique identifiers for nodes
-
-        for node in nodes:
-            ids.append(node.node_id)  # Node identifier
-            embeddings.append(node.get_embedding())  # Node's embedding vector
-            texts.append(node.get_content(metadata_mode=MetadataMode.NONE))  # Node's raw text content
-            metadatas.append(node_to_metadata_dict(node, remove_text=True))  # Convert node to metadata dictionary
-
-        # Initialize the number of dimensions in the store if not set
-        if not self._store.num_dimensions:
-            self._store.num_dimensions = len(embeddings[0])  # Set based on the first node's embedding size
-
-        # Add the prepared data to the Elasticsearch index asynchronously
-        return self._store.add_texts(
-            texts=texts,
-            metadatas=metadatas,
-            vectors=embeddings,
-            ids=ids,
-            create_index_if_not_exists=create_index_if_not_exists,
-            bulk_kwargs=add_kwargs,
-        )
+        actions = [self._index_action(node) for node in nodes]
+        indices = list(dict.fromkeys(action["_index"] for action in actions))
+        if create_index_if_not_exists:
+            for index in indices:
+                self.create_index(len(nodes[0].get_embedding()), index=index)
+
+        ids = [item["index"]["_id"] for _, item in streaming_bulk(self.client, actions, **add_kwargs)]
+        for index in indices:
+            self._index_states[index] = True
+        self.client.indices.refresh(index=self._action_indices(actions))
+        return ids
 
     def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
         """
@@ -592,6 +812,80 @@ class SyncElasticsearchStore(BasePydanticVectorStore):
         # but the active code line performs the deletion based on '_id', which typically aligns with 'ref_doc_id'.
         return self._store.delete(query={"term": {"_id": ref_doc_id}}, **delete_kwargs)
 
+    def batch_delete(self,
+                     ref_doc_ids: List[str],
+                     chunk_size: int = 500,
+                     routes: Optional[Dict[str, Tuple[str, Optional[str]]]] = None) -> List[Dict[str, Any]]:
+        """
+        Deletes a batch of nodes from the Elasticsearch index with `_bulk` delete actions, sending one request per
+        `chunk_size` ids and refreshing the index once at the end.
+
+        Args:
+            ref_doc_ids (List[str]): The unique identifiers of the nodes/documents to be deleted.
+            chunk_size (int): The number of delete actions sent in one `_bulk` request.
+            routes (Dict[str, Tuple[str, Optional[str]]], optional): The id -> (index, routing) of the nodes, see
+                `route`. The default index without routing if not set.
+
+        Returns:
+            List[Dict[str, Any]]: The bulk items which failed. Ids not found in the index are not considered failed.
+        """
+        del_res = self.sync_batch_delete(ref_doc_ids, chunk_size=chunk_size, routes=routes)
+        self.log_vector_store_brief(title='after batch delete')
+        return del_res
+
+    def sync_batch_delete(self,
+                          ref_doc_ids: List[str],
+                          chunk_size: int = 500,
+                          routes: Optional[Dict[str, Tuple[str, Optional[str]]]] = None) -> List[Dict[str, Any]]:
+        """
+        Synchronously deletes a batch of nodes from the Elasticsearch index, see `batch_delete`.
+        """
+        if not ref_doc_ids:
+            return []
+
+        actions = self._id_actions("delete", ref_doc_ids, routes)
+        errors = []
+        for ok, item in streaming_bulk(self.client,
+                                       actions,
+                                       chunk_size=chunk_size,
+                                       raise_on_error=False,
+                                       yield_ok=False):
+            if item.get("delete", {}).get("status") == 404:
+                continue
+            errors.append(item)
+        self.client.indices.refresh(index=self._action_indices(actions), ignore_unavailable=True)
+        return errors
+
+    def batch_update_metadata(self,
+                              id_metadata_dict: Dict[str, Dict[str, Any]],
+                              chunk_size: int = 500,
+                              routes: Optional[Dict[str, Tuple[str, Optional[str]]]] = None) -> List[Dict[str, Any]]:
+        """
+        Partially updates the metadata of a batch of nodes with `_bulk` scripted update actions, leaving their text
+        and embedding untouched, then refreshes the index once. Each field sent replaces the stored one wholesale.
+
+        Args:
+            id_metadata_dict (Dict[str, Dict[str, Any]]): The node id -> the metadata fields to overwrite.
+            chunk_size (int): The number of update actions sent in one `_bulk` request.
+            routes (Dict[str, Tuple[str, Optional[str]]], optional): The id -> (index, routing) of the nodes, see
+                `route`. The default index without routing if not set.
+
+        Returns:
+            List[Dict[str, Any]]: The bulk items which failed, including the ids not found in the index (404).
+        """
+        if not id_metadata_dict:
+            return []
+
+        actions = self._id_actions("update", list(id_metadata_dict.keys()), routes, id_metadata_dict)
+        errors = [item for _, item in streaming_bulk(self.client,
+                                                     actions,
+                                                     chunk_size=chunk_size,
+                                                     raise_on_error=False,
+                                                     yield_ok=False)]
+        self.client.indices.refresh(index=self._action_indices(actions), ignore_unavailable=True)
+        self.log_vector_store_brief(title='after batch update metadata')
+        return errors
+
     def query(
             self,
             query: VectorStoreQuery,
@@ -634,12 +928,12 @@ class SyncElasticsearchStore(BasePydanticVectorStore):
 
     def sync_delete_all(self):
         try:
-            self._store.client.delete_by_query(index=[self.index_name], body={"query": {"match_all": {}}})
+            self._store.client.delete_by_query(index=[self.index_pattern], body={"query": {"match_all": {}}})
         except: # elasticsearch.NotFoundError
             pass
 
     def sync_search_all(self):
-        search_res = self._store.client.search(index=[self.index_name], body={"query": {"match_all": {}}})
+        search_res = self._store.client.search(index=[self.index_pattern], body={"query": {"match_all": {}}})
         return search_res
 
     def log_vector_store_brief(self, title="current vector store content"):
@@ -656,31 +950,110 @@ class SyncElasticsearchStore(BasePydanticVectorStore):
 
         return brief
 
-    def sync_search_all_with_filter(self, es_filter, fields):
-        query_body = {'query': {'bool': {'filter': es_filter}}}
-        k = 1000
-        fields = ['embedding', 'metadata', 'content']
-        response = self.client.search(
-            index=self.index_name,
-            **query_body,
-            size=k,
-            source=True,
-            source_includes=fields,
+    def _hit_2_text_node(self, hit: Dict[str, Any]) -> TextNode:
+        return TextNode(
+            id_=hit['_id'],
+            text=hit['_source'][self.text_field],
+            embedding=hit['_source'].get('embedding'),
+            text_template="{content}",
+            metadata=hit['_source']['metadata']
         )
-        res = []
-        for hit in response["hits"]["hits"]:
-            tn = TextNode(
-                    id_=hit['_id'],
-                    text=hit['_source']['content'],
-                    embedding=hit['_source']['embedding'],
-                    text_template="{content}",
-                    metadata=hit['_source']['metadata']
-                )
-            res.append(
-                tn
+
+    def _source_kwargs(self, fields: List[str]) -> Dict[str, Any]:
+        # the nodes are built from the flat metadata, `_node_content` duplicating it is never shipped
+        fields = list(dict.fromkeys((fields or []) + ['metadata', self.text_field]))
+        return {"source": True, "source_includes": fields, "source_excludes": ['metadata._node_content']}
+
+    def sync_search_all_with_filter(self, es_filter, fields, size: int = 1000, index: str = None, routing: str = None):
+        """
+        Searches the nodes matching the filter, without ranking. Sizes beyond the `max_result_window` of
+        elasticsearch are collected from `sync_scan_with_filter`.
+
+        Args:
+            es_filter (List[Dict]): The elasticsearch filters.
+            fields (List[str]): The extra source fields to return, e.g. `embedding`.
+            size (int): The max number of nodes to return.
+            index (str, optional): The index name or pattern to search, see `route`. The default index if not set.
+            routing (str, optional): The routing value, see `route`.
+
+        Returns:
+            List[TextNode]: The matching nodes.
+        """
+        if size > self.max_result_window:
+            res = []
+            for page in self.sync_scan_with_filter(es_filter, fields, page_size=self.max_result_window,
+                                                   index=index, routing=routing):
+                res.extend(page[:size - len(res)])
+                if len(res) >= size:
+                    break
+            return res
+
+        index = index or self.index_name
+        try:
+            response = self.client.search(
+                index=index,
+                query={'bool': {'filter': es_filter}},
+                size=size,
+                routing=routing,
+                **self._source_kwargs(fields),
             )
-        return res
-    
+        except NotFoundError as e:
+            self._on_index_missing(e, index)
+            return []
+        return [self._hit_2_text_node(hit) for hit in response["hits"]["hits"]]
+
+    def sync_scan_with_filter(self,
+                              es_filter: List[Dict],
+                              fields: List[str],
+                              page_size: int = 500,
+                              keep_alive: str = "1m",
+                              index: str = None,
+                              routing: str = None) -> Iterator[List[TextNode]]:
+        """
+        Scans all nodes matching the filter page by page, with a point in time and `search_after`. The point in time
+        freezes the index view, so nodes deleted or added while scanning neither shift nor repeat the pages.
+
+        Args:
+            es_filter (List[Dict]): The elasticsearch filters.
+            fields (List[str]): The extra source fields to return, e.g. `embedding`.
+            page_size (int): The number of nodes of each page.
+            keep_alive (str): How long the point in time is kept between two pages.
+            index (str, optional): The index name or pattern to scan, see `route`. The default index if not set.
+            routing (str, optional): The routing value, see `route`.
+
+        Returns:
+            Iterator[List[TextNode]]: The pages of matching nodes.
+        """
+        index = index or self.index_name
+        try:
+            pit_id = self.client.open_point_in_time(index=index, keep_alive=keep_alive, routing=routing)["id"]
+        except NotFoundError as e:
+            self._on_index_missing(e, index)
+            return
+        try:
+            search_after = None
+            while True:
+                response = self.client.search(
+                    query={'bool': {'filter': es_filter}},
+                    pit={"id": pit_id, "keep_alive": keep_alive},
+                    sort=[{"_shard_doc": "asc"}],
+                    search_after=search_after,
+                    size=page_size,
+                    track_total_hits=False,
+                    **self._source_kwargs(fields),
+                )
+                # the point in time id may change between pages
+                pit_id = response.get("pit_id", pit_id)
+                hits = response["hits"]["hits"]
+                if not hits:
+                    break
+                yield [self._hit_2_text_node(hit) for hit in hits]
+                if len(hits) < page_size:
+                    break
+                search_after = hits[-1]["sort"]
+        finally:
+            self.client.close_point_in_time(id=pit_id)
+
     def sync_query(
             self,
             query: VectorStoreQuery,
@@ -689,6 +1062,8 @@ class SyncElasticsearchStore(BasePydanticVectorStore):
             ] = None,
             es_filter: Optional[List[Dict]] = None,
             fields: List[str] = [],
+            index: str = None,
+            routing: str = None,
     ) -> VectorStoreQueryResult:
         """
         Asynchronously queries the Elasticsearch index for the top k most similar nodes
@@ -701,7 +1076,9 @@ class SyncElasticsearchStore(BasePydanticVectorStore):
                 A custom function to modify the Elasticsearch query body. Defaults to None.
             es_filter (List[Dict], optional): Additional filters to apply during the query.
                 If filters are present in the query, these filters will not be used. Defaults to None.
-            fields (List[str], optional): .
+            fields (List[str], optional): The extra source fields to return, e.g. `embedding`.
+            index (str, optional): The index name or pattern to search, see `route`. The default index if not set.
+            routing (str, optional): The routing value, see `route`.
 
         Returns:
             VectorStoreQueryResult: The result of the query, including nodes, their IDs,
@@ -722,19 +1099,230 @@ class SyncElasticsearchStore(BasePydanticVectorStore):
             filter = es_filter or []
         num_candidates = query.similarity_top_k * 10 if query.similarity_top_k <= 1000 else query.similarity_top_k
 
-        hits = self._store.search(
-            query=query.query_str,
-            query_vector=query.query_embedding,
-            k=query.similarity_top_k,
-            num_candidates=num_candidates,  # query.similarity_top_k * 10,
-            filter=filter,
-            custom_query=custom_query,
-            fields=fields,
-        )
+        query_body = self.retrieval_strategy.es_query(query=query.query_str,
+                                                      query_vector=query.query_embedding,
+                                                      text_field=self.text_field,
+                                                      vector_field=self.vector_field,
+                                                      k=query.similarity_top_k,
+                                                      num_candidates=num_candidates,
+                                                      filter=filter)
+        if custom_query is not None:
+            query_body = custom_query(query_body, query.query_str)
+
+        index = index or self.index_name
+        try:
+            response = self.client.search(
+                index=index,
+                **query_body,
+                size=query.similarity_top_k,
+                routing=routing,
+                source=True,
+                source_includes=list(dict.fromkeys((fields or []) + ["metadata", self.text_field])),
+            )
+            hits = response["hits"]["hits"]
+        except NotFoundError as e:
+            self._on_index_missing(e, index)
+            hits = []
 
         return self.post_process_hits(hits)
 
 
+    def sync_multi_query(self,
+                         query_str: str,
+                         query_embedding: List[float],
+                         sub_queries: List[tuple],
+                         fields: Optional[List[str]] = None,
+                         routes: Optional[List[Tuple[str, Optional[str]]]] = None) -> List[VectorStoreQueryResult]:
+        """
+        Executes several queries sharing the same query embedding in one `_msearch` request.
+
+        Args:
+            query_str (str): The query text.
+            query_embedding (List[float]): The query embedding, computed once by the caller.
+            sub_queries (List[tuple]): A list of (es_filter, top_k), es_filter being a list of Elasticsearch filters.
+            fields (List[str], optional): The extra source fields to return, `metadata` and the text are always
+                returned.
+            routes (List[Tuple[str, Optional[str]]], optional): The (index, routing) of each sub query, see `route`.
+                The default index without routing if not set.
+
+        Returns:
+            List[VectorStoreQueryResult]: The results in the order of `sub_queries`.
+        """
+        if not sub_queries:
+            return []
+
+        source_includes = list(dict.fromkeys((fields or []) + ["metadata", self.text_field]))
+        searches = []
+        routes = routes or [(self.index_name, None)] * len(sub_queries)
+        for (es_filter, top_k), (index, routing) in zip(sub_queries, routes):
+            num_candidates = top_k * 10 if top_k <= 1000 else top_k
+            query_body = self.retrieval_strategy.es_query(query=query_str,
+                                                          query_vector=query_embedding,
+                                                          text_field=self.text_field,
+                                                          vector_field=self.vector_field,
+                                                          k=top_k,
+                                                          num_candidates=num_candidates,
+                                                          filter=es_filter or [])
+            query_body.update({"size": top_k, "_source": {"includes": source_includes}})
+            header = {"index": index}
+            if routing:
+                header["routing"] = routing
+            searches.extend([header, query_body])
+
+        response = self.client.msearch(searches=searches)
+        results = []
+        for (index, _), item in zip(routes, response["responses"]):
+            if "error" in item:
+                self.logger.warning(f"msearch sub query failed! error={item['error']}")
+                if item["error"].get("type") == "index_not_found_exception":
+                    self._index_states[index] = False
+                results.append(VectorStoreQueryResult(nodes=[], ids=[], similarities=[]))
+            else:
+                results.append(self.post_process_hits(item["hits"]["hits"]))
+        return results
+
+    async def async_add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        """
+        Asynchronously adds a list of nodes, each containing an embedding, to the Elasticsearch index with `_bulk`
+        index actions on the asynchronous client, then refreshes the index. The documents are the same as the ones
+        of `sync_add`.
+
+        Args:
+            nodes (List[BaseNode]): A list of node objects, each encapsulating an embedding.
+            **add_kwargs (Any): Additional keyword arguments passed to `async_streaming_bulk`, e.g. chunk_size.
+
+        Returns:
+            List[str]: A list of node IDs that were successfully added to the index.
+        """
+        if len(nodes) == 0:
+            return []
+
+        actions = [self._index_action(node) for node in nodes]
+        indices = list(dict.fromkeys(action["_index"] for action in actions))
+        for index in indices:
+            if not self._index_states.get(index):
+                # asked once, then the state is kept, see `has_index`
+                await asyncio.to_thread(self.create_index, len(nodes[0].get_embedding()), index)
+
+        ids = [item["index"]["_id"] async for _, item in async_streaming_bulk(self.async_client, actions, **add_kwargs)]
+        await self.async_client.indices.refresh(index=self._action_indices(actions))
+        return ids
+
+    async def async_batch_delete(self,
+                                 ref_doc_ids: List[str],
+                                 chunk_size: int = 500,
+                                 routes: Optional[Dict[str, Tuple[str, Optional[str]]]] = None) -> List[Dict[str, Any]]:
+        """
+        Asynchronously deletes a batch of nodes from the Elasticsearch index, see `batch_delete`.
+        """
+        if not ref_doc_ids:
+            return []
+
+        actions = self._id_actions("delete", ref_doc_ids, routes)
+        errors = []
+        async for ok, item in async_streaming_bulk(self.async_client,
+                                                   actions,
+                                                   chunk_size=chunk_size,
+                                                   raise_on_error=False,
+                                                   yield_ok=False):
+            if item.get("delete", {}).get("status") == 404:
+                continue
+            errors.append(item)
+        await self.async_client.indices.refresh(index=self._action_indices(actions), ignore_unavailable=True)
+        return errors
+
+    async def async_batch_update_metadata(self,
+                                          id_metadata_dict: Dict[str, Dict[str, Any]],
+                                          chunk_size: int = 500,
+                                          routes: Optional[Dict[str, Tuple[str, Optional[str]]]] = None
+                                          ) -> List[Dict[str, Any]]:
+        """
+        Asynchronously updates the metadata of a batch of nodes, see `batch_update_metadata`.
+        """
+        if not id_metadata_dict:
+            return []
+
+        actions = self._id_actions("update", list(id_metadata_dict.keys()), routes, id_metadata_dict)
+        errors = [item async for _, item in async_streaming_bulk(self.async_client,
+                                                                 actions,
+                                                                 chunk_size=chunk_size,
+                                                                 raise_on_error=False,
+                                                                 yield_ok=False)]
+        await self.async_client.indices.refresh(index=self._action_indices(actions), ignore_unavailable=True)
+        return errors
+
+    async def async_query(self,
+                          query_str: str,
+                          query_embedding: List[float],
+                          es_filter: Any,
+                          top_k: int,
+                          fields: Optional[List[str]] = None,
+                          index: str = None,
+                          routing: str = None) -> VectorStoreQueryResult:
+        """
+        Asynchronously queries the top_k most similar nodes with a query embedding computed by the caller.
+
+        Args:
+            query_str (str): The query text.
+            query_embedding (List[float]): The query embedding.
+            es_filter (Any): The Elasticsearch filters.
+            top_k (int): The number of nodes to return.
+            fields (List[str], optional): The extra source fields to return, e.g. `embedding`.
+            index (str, optional): The index name or pattern to search, see `route`. The default index if not set.
+            routing (str, optional): The routing value, see `route`.
+
+        Returns:
+            VectorStoreQueryResult: The result of the query, empty if the index is missing.
+        """
+        num_candidates = top_k * 10 if top_k <= 1000 else top_k
+        query_body = self.retrieval_strategy.es_query(query=query_str,
+                                                      query_vector=query_embedding,
+                                                      text_field=self.text_field,
+                                                      vector_field=self.vector_field,
+                                                      k=top_k,
+                                                      num_candidates=num_candidates,
+                                                      filter=es_filter or [])
+        index = index or self.index_name
+        try:
+            response = await self.async_client.search(
+                index=index,
+                **query_body,
+                size=top_k,
+                routing=routing,
+                source=True,
+                source_includes=list(dict.fromkeys((fields or []) + ["metadata", self.text_field])),
+            )
+        except NotFoundError as e:
+            self._on_index_missing(e, index)
+            return VectorStoreQueryResult(nodes=[], ids=[], similarities=[])
+        return self.post_process_hits(response["hits"]["hits"])
+
+    async def async_search_all_with_filter(self,
+                                           es_filter,
+                                           fields,
+                                           size: int = 1000,
+                                           index: str = None,
+                                           routing: str = None) -> List[TextNode]:
+        """
+        Asynchronously searches the nodes matching the filter, see `sync_search_all_with_filter`.
+        """
+        if size > self.max_result_window:
+            return await asyncio.to_thread(self.sync_search_all_with_filter, es_filter, fields, size, index, routing)
+
+        index = index or self.index_name
+        try:
+            response = await self.async_client.search(
+                index=index,
+                query={'bool': {'filter': es_filter}},
+                size=size,
+                routing=routing,
+                **self._source_kwargs(fields),
+            )
+        except NotFoundError as e:
+            self._on_index_missing(e, index)
+            return []
+        return [self._hit_2_text_node(hit) for hit in response["hits"]["hits"]]
+
     def post_process_hits(self, hits: List[Dict[str, Any]]) -> VectorStoreQueryResult:
         top_k_nodes = []
         top_k_ids = []
@@ -752,6 +1340,10 @@ class SyncElasticsearchStore(BasePydanticVectorStore):
                 node = metadata_dict_to_node(metadata)
                 node.text = text
                 node.embedding = embedding
+                # `_node_content` is not rewritten by partial metadata updates, the flat fields are up to date
+                for key in node.metadata:
+                    if key in metadata:
+                        node.metadata[key] = metadata[key]
             except Exception:
                 # Legacy support for old metadata format
                 self.logger.warning(
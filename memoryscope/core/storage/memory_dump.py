@@ -0,0 +1,174 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from memoryscope.core.storage.base_memory_store import BaseMemoryStore
+from memoryscope.core.utils.logger import Logger
+from memoryscope.scheme.memory_node import MemoryNode
+
+
+class MemoryDump(object):
+    """
+    A columnar dump of memory nodes, to migrate or seed a memory store without re-embedding. A dump directory holds
+    - `part-{i}.npz`: one chunk of nodes, every MemoryNode field stored as a column. Strings are concatenated utf-8
+      bytes with offsets, float lists (`vector`, `key_vector`) are concatenated float32 with offsets, integers are
+      int64 arrays, so that nothing is pickled;
+    - `manifest.json`: the chunk files and node counts, written last so that a dump is complete once it exists.
+    """
+
+    MANIFEST_NAME: str = "manifest.json"
+
+    STRING_FIELDS: List[str] = ["memory_id", "user_name", "target_name", "content", "key", "value", "memory_type",
+                                "action_status", "store_status", "dt"]
+
+    INT_FIELDS: List[str] = ["timestamp", "obs_reflected", "obs_updated"]
+
+    VECTOR_FIELDS: List[str] = ["vector", "key_vector"]
+
+    # dict fields, stored as json strings
+    JSON_FIELDS: List[str] = ["meta_data"]
+
+    def __init__(self, dump_dir: str):
+        """
+        Initializes the MemoryDump.
+
+        Args:
+            dump_dir (str): The directory holding all files of the dump.
+        """
+        self.dump_dir: str = dump_dir
+        self.logger = Logger.get_logger("memory_dump")
+
+    @staticmethod
+    def _pack_strings(values: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        encoded = [v.encode("utf-8") for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(v) for v in encoded])
+        return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+    @staticmethod
+    def _unpack_strings(data: np.ndarray, offsets: np.ndarray) -> List[str]:
+        raw = data.tobytes()
+        return [raw[offsets[i]: offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+    @staticmethod
+    def _pack_vectors(values: List[List[float]]) -> Tuple[np.ndarray, np.ndarray]:
+        offsets = np.zeros(len(values) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(v) for v in values])
+        data = np.concatenate([np.asarray(v, dtype=np.float32) for v in values]) if offsets[-1] else \
+            np.zeros(0, dtype=np.float32)
+        return data, offsets
+
+    @staticmethod
+    def _unpack_vectors(data: np.ndarray, offsets: np.ndarray) -> List[List[float]]:
+        return [data[offsets[i]: offsets[i + 1]].tolist() for i in range(len(offsets) - 1)]
+
+    def _nodes_to_columns(self, nodes: List[MemoryNode]) -> Dict[str, np.ndarray]:
+        columns = {}
+        for key in self.STRING_FIELDS:
+            columns[f"{key}.data"], columns[f"{key}.offsets"] = self._pack_strings([getattr(n, key) for n in nodes])
+        for key in self.JSON_FIELDS:
+            columns[f"{key}.data"], columns[f"{key}.offsets"] = \
+                self._pack_strings([json.dumps(getattr(n, key), ensure_ascii=False) for n in nodes])
+        for key in self.VECTOR_FIELDS:
+            columns[f"{key}.data"], columns[f"{key}.offsets"] = self._pack_vectors([getattr(n, key) for n in nodes])
+        for key in self.INT_FIELDS:
+            columns[key] = np.asarray([getattr(n, key) for n in nodes], dtype=np.int64)
+        return columns
+
+    def _columns_to_nodes(self, columns: Dict[str, np.ndarray]) -> List[MemoryNode]:
+        fields: Dict[str, List[Any]] = {}
+        for key in self.STRING_FIELDS:
+            fields[key] = self._unpack_strings(columns[f"{key}.data"], columns[f"{key}.offsets"])
+        for key in self.JSON_FIELDS:
+            fields[key] = [json.loads(v) for v in
+                           self._unpack_strings(columns[f"{key}.data"], columns[f"{key}.offsets"])]
+        for key in self.VECTOR_FIELDS:
+            fields[key] = self._unpack_vectors(columns[f"{key}.data"], columns[f"{key}.offsets"])
+        for key in self.INT_FIELDS:
+            fields[key] = columns[key].tolist()
+
+        size = len(fields["memory_id"])
+        return [MemoryNode(**{key: values[i] for key, values in fields.items()}) for i in range(size)]
+
+    def export(self,
+               memory_store: BaseMemoryStore,
+               filter_dict: Dict[str, List[str]] | Dict[str, str] = None,
+               chunk_size: int = 10000,
+               compress: bool = False) -> int:
+        """
+        Streams the memory nodes matching the filter, with their vectors, from the store into the dump directory,
+        one chunk file per page of `iter_memories`.
+
+        Args:
+            memory_store (BaseMemoryStore): The store to export.
+            filter_dict (Dict[str, List[str]] | Dict[str, str], optional): The filter of the nodes to export, e.g.
+                the `user_name` and `target_name` of a tenant. All nodes if not set.
+            chunk_size (int): The number of nodes per chunk file.
+            compress (bool): Compress the chunk files, smaller but slower to write and read.
+
+        Returns:
+            int: The number of exported nodes.
+        """
+        os.makedirs(self.dump_dir, exist_ok=True)
+        save = np.savez_compressed if compress else np.savez
+        chunks = []
+        for nodes in memory_store.iter_memories(filter_dict=filter_dict, page_size=chunk_size, return_vectors=True):
+            file_name = f"part-{len(chunks):06d}.npz"
+            save(os.path.join(self.dump_dir, file_name), **self._nodes_to_columns(nodes))
+            chunks.append({"file": file_name, "count": len(nodes)})
+            self.logger.info(f"export {file_name} count={len(nodes)}")
+
+        count = sum(chunk["count"] for chunk in chunks)
+        with open(os.path.join(self.dump_dir, self.MANIFEST_NAME), "w") as f:
+            json.dump({"count": count, "filter_dict": filter_dict, "chunks": chunks}, f, indent=2)
+        return count
+
+    def iter_chunks(self) -> Iterator[List[MemoryNode]]:
+        """
+        Reads the dump chunk by chunk.
+
+        Returns:
+            Iterator[List[MemoryNode]]: The memory nodes of each chunk, with their vectors.
+        """
+        manifest_path = os.path.join(self.dump_dir, self.MANIFEST_NAME)
+        if not os.path.exists(manifest_path):
+            raise RuntimeError(f"{manifest_path} does not exist, the dump is missing or incomplete!")
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+        for chunk in manifest["chunks"]:
+            with np.load(os.path.join(self.dump_dir, chunk["file"]), allow_pickle=False) as columns:
+                yield self._columns_to_nodes({key: columns[key] for key in columns.files})
+
+    def load(self, memory_store: BaseMemoryStore, batch_size: int = 500, workers: int = 4) -> int:
+        """
+        Bulk-loads the dump into the store. The nodes keep their vectors, so the store does not call the embedding
+        model. Batches of `batch_size` nodes are inserted by `workers` threads, while the next chunk is read.
+
+        Args:
+            memory_store (BaseMemoryStore): The store to load into.
+            batch_size (int): The number of nodes per `batch_insert` call.
+            workers (int): The number of concurrent `batch_insert` calls.
+
+        Returns:
+            int: The number of loaded nodes.
+        """
+        count = 0
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            futures: List[Future] = []
+            for nodes in self.iter_chunks():
+                for start in range(0, len(nodes), batch_size):
+                    futures.append(executor.submit(memory_store.batch_insert, nodes[start: start + batch_size]))
+                # bound the batches waiting in the executor, so that the dump is not read far ahead
+                while len(futures) > 2 * max(workers, 1):
+                    futures.pop(0).result()
+                count += len(nodes)
+                self.logger.info(f"load count={count}")
+
+            for future in futures:
+                future.result()
+        memory_store.flush()
+        return count
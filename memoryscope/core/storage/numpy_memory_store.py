@@ -0,0 +1,995 @@
+import asyncio
+import threading
+from typing import Dict, Iterator, List, Any, Tuple
+
+import numpy as np
+
+from memoryscope.core.models.base_model import BaseModel
+from memoryscope.core.storage.base_memory_store import BaseMemoryStore
+from memoryscope.core.storage.hnsw_index import HnswIndex
+from memoryscope.core.storage.segment_storage import SegmentStorage
+from memoryscope.core.utils.logger import Logger
+from memoryscope.scheme.memory_node import MemoryNode
+
+
+class NumpyMemoryStore(BaseMemoryStore):
+    """
+    An in-process memory store keeping all memory nodes in contiguous numpy arrays. Vectors are held in a single
+    float32 matrix, filterable metadata in column-wise arrays (string fields are dictionary encoded into int32 codes),
+    so that `filter_dict` is evaluated as boolean masks and top-k is selected by `argpartition`.
+    Deleted or re-inserted rows are tombstoned and physically dropped by compaction.
+
+    With `index_type: hnsw`, an HnswIndex (backed by the optional `hnswlib`) is maintained incrementally on top of
+    the vector matrix. Filters keeping only a few rows are still answered by the exact brute-force scan, and the index
+    is rebuilt in a background thread when compaction is needed, queries falling back to the brute-force scan
+    meanwhile. Without `hnswlib` installed, the store keeps the brute-force scan only.
+
+    With `persist_dir`, the vector matrix is a memmap of an append-only file and every change is written ahead to a
+    log before it is applied, see SegmentStorage. Compaction then runs in a background thread as well.
+
+    With `quantization: float16` or `int8`, the brute-force scan runs over a quantized copy of the vector matrix
+    (2x / 4x smaller), then the top `top_k * rescore_factor` candidates are rescored with the float32 vectors. Combined
+    with `persist_dir`, the quantized matrix is a memmap as well, written along with the vectors, so that reopening
+    the store does not quantize the vectors again.
+    """
+
+    # dictionary encoded string columns
+    CATEGORICAL_FIELDS: List[str] = ["user_name", "target_name", "memory_type", "action_status", "store_status", "dt"]
+
+    # numeric columns
+    NUMERIC_FIELDS: List[str] = ["timestamp", "obs_reflected", "obs_updated"]
+
+    # object columns, not designed for filtering but still comparable
+    PAYLOAD_FIELDS: List[str] = ["memory_id", "content", "key", "value", "meta_data", "key_vector"]
+
+    def __init__(self,
+                 embedding_model: BaseModel,
+                 init_capacity: int = 1024,
+                 compact_ratio: float = 0.5,
+                 index_type: str = "flat",
+                 hnsw_m: int = 16,
+                 hnsw_ef_construction: int = 100,
+                 hnsw_ef_search: int = 64,
+                 brute_force_rows: int = 10000,
+                 brute_force_ratio: float = 0.05,
+                 persist_dir: str = None,
+                 wal_checkpoint_ops: int = 10000,
+                 wal_fsync: bool = True,
+                 quantization: str = "none",
+                 rescore_factor: int = 4,
+                 **kwargs):
+        """
+        Initializes the NumpyMemoryStore.
+
+        Args:
+            embedding_model (BaseModel): The model used to embed memory contents and queries.
+            init_capacity (int): The initial number of rows allocated. The arrays double when full.
+            compact_ratio (float): Compact the arrays once the ratio of deleted rows exceeds this value.
+            index_type (str): `flat` for the exact brute-force scan, `hnsw` to add an approximate HnswIndex, which
+                needs `hnswlib`.
+            hnsw_m (int): The max number of neighbors per node of the HnswIndex.
+            hnsw_ef_construction (int): The beam width of the HnswIndex when inserting.
+            hnsw_ef_search (int): The beam width of the HnswIndex when searching.
+            brute_force_rows (int): Use the brute-force scan when the filter keeps no more than this number of rows.
+            brute_force_ratio (float): Use the brute-force scan when the filter keeps less than this ratio of rows.
+            persist_dir (str): The directory to persist the store into. Kept in memory only if not set.
+            wal_checkpoint_ops (int): Checkpoint the metadata columns once the write-ahead log has this many ops.
+            wal_fsync (bool): Fsync the write-ahead log before applying each change, else it is only flushed.
+            quantization (str): `none`, `float16` or `int8`, the precision of the vectors scanned by brute force.
+            rescore_factor (int): Rescore `top_k * rescore_factor` quantized candidates with the float32 vectors.
+            **kwargs: Other memory_store configs (e.g. `index_name`, `es_url`), unused by this store.
+        """
+        self.embedding_model: BaseModel = embedding_model
+        self.init_capacity: int = max(int(init_capacity), 1)
+        self.compact_ratio: float = compact_ratio
+        if index_type not in ("flat", "hnsw"):
+            raise ValueError(f"index_type={index_type} is not supported!")
+        self.index_type: str = index_type
+        self.hnsw_m: int = hnsw_m
+        self.hnsw_ef_construction: int = hnsw_ef_construction
+        self.hnsw_ef_search: int = hnsw_ef_search
+        self.brute_force_rows: int = brute_force_rows
+        self.brute_force_ratio: float = brute_force_ratio
+        self.wal_checkpoint_ops: int = wal_checkpoint_ops
+        if quantization not in ("none", "float16", "int8"):
+            raise ValueError(f"quantization={quantization} is not supported!")
+        self.quantization: str = quantization
+        self.rescore_factor: int = max(int(rescore_factor), 1)
+        self.kwargs: dict = kwargs
+
+        self.emb_dims: int | None = None
+        self._lock = threading.RLock()
+        self._capacity: int = 0
+        self._size: int = 0
+        self._deleted_cnt: int = 0
+        self._id_row_dict: Dict[str, int] = {}
+
+        self._vectors: np.ndarray | None = None
+        # the key vectors by row, only kept in a file when persisted, see `_node_op`
+        self._key_vectors: np.ndarray | None = None
+        # the quantized copy of the vectors and, for int8, the scale of each row
+        self._q_vectors: np.ndarray | None = None
+        self._q_scales: np.ndarray | None = None
+        self._alive: np.ndarray = np.zeros(0, dtype=bool)
+        self._codes: Dict[str, np.ndarray] = {}
+        self._vocab: Dict[str, Dict[str, int]] = {k: {} for k in self.CATEGORICAL_FIELDS}
+        self._vocab_values: Dict[str, List[str]] = {k: [] for k in self.CATEGORICAL_FIELDS}
+        self._numerics: Dict[str, np.ndarray] = {}
+        self._payloads: Dict[str, np.ndarray] = {}
+
+        self._index: HnswIndex | None = None
+        self._index_building: bool = False
+        # (rows, vectors) inserts and (row, None) deletes happened while the index is rebuilding
+        self._pending_index_ops: List[Tuple[np.ndarray | int, np.ndarray | None]] = []
+        self._background_thread: threading.Thread | None = None
+
+        self.logger = Logger.get_logger("numpy_memory_store")
+        if self.index_type == "hnsw" and not HnswIndex.available():
+            self.logger.warning("hnswlib is not installed, index_type=hnsw falls back to the brute-force scan!")
+            self.index_type = "flat"
+
+        self._storage: SegmentStorage | None = None
+        if persist_dir:
+            self._storage = SegmentStorage(persist_dir, wal_fsync=wal_fsync)
+            self._load()
+
+    @property
+    def size(self) -> int:
+        """
+        Returns the number of valid memory nodes in the store.
+        """
+        return self._size - self._deleted_cnt
+
+    @property
+    def scan_bytes(self) -> int:
+        """
+        Returns the number of bytes of the vector matrix scanned by brute-force queries, quantized or not.
+        """
+        if self.quantization != "none":
+            vectors = [self._q_vectors, self._q_scales]
+        else:
+            vectors = [self._vectors]
+        return sum(v[:self._size].nbytes for v in vectors if v is not None)
+
+    @property
+    def _background_running(self) -> bool:
+        return self._background_thread is not None and self._background_thread.is_alive()
+
+    @staticmethod
+    def _new_column(capacity: int, dtype, fill) -> np.ndarray:
+        return np.full(capacity, fill, dtype=dtype)
+
+    def _column_specs(self) -> List[Tuple[Dict[str, np.ndarray], str, Any, Any]]:
+        """
+        Returns (container, key, dtype, fill) of every metadata column.
+        """
+        return [(self._codes, k, np.int32, -1) for k in self.CATEGORICAL_FIELDS] + \
+            [(self._numerics, k, np.int64, 0) for k in self.NUMERIC_FIELDS] + \
+            [(self._payloads, k, object, None) for k in self.PAYLOAD_FIELDS]
+
+    def _allocate(self, capacity: int):
+        """
+        Grows all arrays to the given capacity, keeping the existing rows.
+        """
+        if self._storage is not None:
+            if self._storage.dims is None:
+                self._storage.write_manifest(dims=self.emb_dims, quantization=self.quantization)
+            self._vectors = self._storage.open_vectors(capacity)
+            capacity = len(self._vectors)
+            self._key_vectors = self._storage.open_key_vectors(capacity)
+        else:
+            vectors = np.zeros((capacity, self.emb_dims), dtype=np.float32)
+            if self._vectors is not None:
+                vectors[:self._size] = self._vectors[:self._size]
+            self._vectors = vectors
+        self._allocate_quantized(capacity)
+
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self._size] = self._alive[:self._size]
+        self._alive = alive
+        for container, key, dtype, fill in self._column_specs():
+            column = self._new_column(capacity, dtype, fill)
+            if key in container:
+                column[:self._size] = container[key][:self._size]
+            container[key] = column
+        self._capacity = capacity
+
+    def _allocate_quantized(self, capacity: int):
+        """
+        Grows the quantized vectors to the given capacity, keeping the existing rows.
+        """
+        if self.quantization == "none":
+            return
+        if self._storage is not None:
+            self._q_vectors, self._q_scales = self._storage.open_quantized(self.quantization, capacity)
+            return
+        dtype = np.float16 if self.quantization == "float16" else np.int8
+        q_vectors = np.zeros((capacity, self.emb_dims), dtype=dtype)
+        q_scales = np.ones(capacity, dtype=np.float32)
+        if self._q_vectors is not None:
+            q_vectors[:self._size] = self._q_vectors[:self._size]
+            q_scales[:self._size] = self._q_scales[:self._size]
+        self._q_vectors = q_vectors
+        self._q_scales = q_scales
+
+    def _quantize(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Quantizes float32 vectors row-wise. int8 vectors are scaled symmetrically by the max absolute value of the
+        row, so that `q_vector * scale` approximates the vector.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The quantized vectors and the scale of each row.
+        """
+        vectors = np.atleast_2d(vectors)
+        if self.quantization == "float16":
+            return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1.0
+        q_vectors = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return q_vectors, scales.astype(np.float32)
+
+    def _requantize(self):
+        """
+        Rebuilds the quantized vectors of all used rows from the float32 vectors, chunk by chunk so that a memory
+        mapped matrix is never fully loaded. Only needed when the quantized vectors were not persisted.
+        """
+        if self.quantization == "none" or self._vectors is None:
+            return
+        chunk_size = 65536
+        for start in range(0, self._size, chunk_size):
+            end = min(start + chunk_size, self._size)
+            self._q_vectors[start:end], self._q_scales[start:end] = self._quantize(self._vectors[start:end])
+
+    def _take_rows(self,
+                   order: np.ndarray,
+                   vectors: np.ndarray,
+                   capacity: int,
+                   q_vectors: np.ndarray | None = None,
+                   q_scales: np.ndarray | None = None,
+                   key_vectors: np.ndarray | None = None):
+        """
+        Replaces all arrays by the given rows in the given order, the new vector matrices being provided by the caller.
+        """
+        size = len(order)
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:size] = self._alive[order]
+        for container, key, dtype, fill in self._column_specs():
+            column = self._new_column(capacity, dtype, fill)
+            column[:size] = container[key][order]
+            container[key] = column
+
+        self._alive = alive
+        self._vectors = vectors
+        self._q_vectors = q_vectors
+        self._q_scales = q_scales
+        self._key_vectors = key_vectors
+        self._capacity = capacity
+        self._reset_rows(size)
+
+    def _reset_rows(self, size: int):
+        """
+        Sets the number of used rows, then recounts the tombstones and rebuilds the id -> row mapping.
+        """
+        self._size = size
+        self._deleted_cnt = int(size - self._alive[:size].sum())
+        memory_ids = self._payloads["memory_id"]
+        self._id_row_dict = {memory_ids[row]: row for row in np.flatnonzero(self._alive[:size]).tolist()}
+
+    def _encode(self, key: str, value: str) -> int:
+        """
+        Returns the dictionary code of a categorical value, registering it if unseen.
+        """
+        vocab = self._vocab[key]
+        code = vocab.get(value)
+        if code is None:
+            code = len(vocab)
+            vocab[value] = code
+            self._vocab_values[key].append(value)
+        return code
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        """
+        L2-normalizes vectors row-wise, leaving zero vectors untouched.
+        """
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds a batch of texts with the embedding model.
+        """
+        response = self.embedding_model.call(text=texts)
+        embeddings = response.embedding_results
+        if not response.status or not embeddings:
+            raise RuntimeError(f"embedding call failed! details={response.details}")
+        if len(texts) == 1:
+            embeddings = [embeddings]
+        return embeddings
+
+    def _query_vector(self, query: str, query_vector: List[float] | None) -> np.ndarray | None:
+        """
+        Returns the normalized query vector given by the caller, else embeds the query, None without query.
+        """
+        if not query:
+            return None
+        if query_vector is None:
+            query_vector = self._embed([query])[0]
+        return self._normalize(np.asarray(query_vector, dtype=np.float32))
+
+    def _write_vectors(self, rows: np.ndarray, vectors: np.ndarray):
+        """
+        Writes the normalized vectors, quantized as well if enabled, into the given rows.
+        """
+        self._vectors[rows] = vectors
+        if self.quantization != "none":
+            self._q_vectors[rows], self._q_scales[rows] = self._quantize(vectors)
+
+    def _write_row(self, row: int, node: MemoryNode):
+        """
+        Writes all metadata columns of a memory node into the given row, its vector being written before.
+        """
+        for key in self.CATEGORICAL_FIELDS:
+            self._codes[key][row] = self._encode(key, getattr(node, key))
+        for key in self.NUMERIC_FIELDS:
+            self._numerics[key][row] = getattr(node, key)
+        for key in self.PAYLOAD_FIELDS:
+            self._payloads[key][row] = getattr(node, key)
+        self._alive[row] = True
+
+    def _read_row(self, row: int, score: float | None = None, return_vector: bool = True) -> MemoryNode:
+        """
+        Rebuilds a memory node from the given row.
+        """
+        kwargs: Dict[str, Any] = {key: self._payloads[key][row] for key in self.PAYLOAD_FIELDS}
+        kwargs["meta_data"] = dict(kwargs["meta_data"] or {})
+        kwargs["key_vector"] = list(kwargs["key_vector"] or [])
+        for key in self.CATEGORICAL_FIELDS:
+            kwargs[key] = self._vocab_values[key][self._codes[key][row]]
+        for key in self.NUMERIC_FIELDS:
+            kwargs[key] = int(self._numerics[key][row])
+        if return_vector:
+            kwargs["vector"] = self._vectors[row].tolist()
+        if score is not None:
+            kwargs["score_recall"] = score
+        return MemoryNode(**kwargs)
+
+    def _append_row(self, node: MemoryNode, row: int):
+        """
+        Appends a memory node as the given new row, allocated and its vector written before. An existing row of the
+        same memory id is tombstoned, so that vector rows are never overwritten.
+        """
+        self._tombstone(node.memory_id)
+        self._size = max(self._size, row + 1)
+        self._id_row_dict[node.memory_id] = row
+        self._write_row(row, node)
+
+    def _tombstone(self, memory_id: str) -> int | None:
+        row = self._id_row_dict.pop(memory_id, None)
+        if row is not None:
+            self._alive[row] = False
+            self._deleted_cnt += 1
+            self._index_remove(row)
+        return row
+
+    def _filter_mask(self, filter_dict: Dict[str, Any] = None) -> np.ndarray:
+        """
+        Converts the filter dict into a boolean mask over the used rows. A list value matches any of its items,
+        a scalar value must match exactly, and all keys are combined with AND.
+        """
+        mask = self._alive[:self._size].copy()
+        if not filter_dict:
+            return mask
+
+        for key, value in filter_dict.items():
+            values = value if isinstance(value, list) else [value]
+            key_mask = np.zeros(self._size, dtype=bool)
+            if key in self._codes:
+                codes = self._codes[key][:self._size]
+                for v in values:
+                    code = self._vocab[key].get(v)
+                    if code is not None:
+                        key_mask |= codes == code
+            elif key in self._numerics:
+                key_mask = np.isin(self._numerics[key][:self._size], values)
+            elif key in self._payloads:
+                column = self._payloads[key][:self._size]
+                for v in values:
+                    key_mask |= column == v
+            else:
+                self.logger.warning(f"filter key={key} is not supported!")
+            mask &= key_mask
+        return mask
+
+    def _dump_columns(self) -> Tuple[Dict[str, np.ndarray], List[dict | None]]:
+        """
+        Dumps the metadata columns of the used rows, in the format of the SegmentStorage columns sidecar: typed
+        columns, and the payloads of each alive row. Key vectors found in the key vector file are only flagged.
+        """
+        size = self._size
+        columns = {"alive": self._alive[:size]}
+        for container, key, _, _ in self._column_specs():
+            if container is not self._payloads:
+                columns[key] = container[key][:size]
+        for key in self.CATEGORICAL_FIELDS:
+            columns[f"vocab.{key}"] = np.array(self._vocab_values[key], dtype=str)
+
+        has_key_vector = np.zeros(size, dtype=bool)
+        payloads: List[dict | None] = [None] * size
+        for row in np.flatnonzero(self._alive[:size]).tolist():
+            payload = {key: self._payloads[key][row] for key in self.PAYLOAD_FIELDS}
+            key_vector = payload.pop("key_vector")
+            if self._in_key_vectors(key_vector):
+                has_key_vector[row] = True
+            elif key_vector:
+                payload["key_vector"] = list(key_vector)
+            payloads[row] = payload
+        columns["has_key_vector"] = has_key_vector
+        return columns, payloads
+
+    def _load(self):
+        """
+        Loads the persisted store: the vector files are memory mapped, the columns checkpoint is loaded,
+        then the write-ahead log is replayed.
+        """
+        self.emb_dims = self._storage.dims
+        if self.emb_dims is None:
+            return
+
+        self._vectors = self._storage.open_vectors()
+        if self._vectors is None:
+            return
+
+        columns, payloads = self._storage.load_columns()
+        self._allocate(len(self._vectors))
+        size = len(payloads)
+        if size:
+            self._alive[:size] = columns["alive"]
+            for container, key, _, _ in self._column_specs():
+                if container is not self._payloads:
+                    container[key][:size] = columns[key]
+            for row, payload in enumerate(payloads):
+                for key, value in (payload or {}).items():
+                    self._payloads[key][row] = value
+            for row in np.flatnonzero(columns["has_key_vector"]).tolist():
+                self._payloads["key_vector"][row] = self._key_vectors[row].tolist()
+            for key in self.CATEGORICAL_FIELDS:
+                self._vocab_values[key] = columns[f"vocab.{key}"].tolist()
+                self._vocab[key] = {v: i for i, v in enumerate(self._vocab_values[key])}
+        self._reset_rows(size)
+
+        for op in self._storage.replay_wal():
+            if op["op"] == "insert":
+                row = op["row"]
+                if row >= self._capacity:
+                    self._allocate(row + 1)
+                self._append_row(self._op_node(op, row), row)
+            elif op["op"] == "update":
+                row = self._id_row_dict.get(op["node"]["memory_id"])
+                if row is not None:
+                    self._write_row(row, self._op_node(op, row))
+            elif op["op"] == "delete":
+                self._tombstone(op["memory_id"])
+
+        if self._storage.quantization != self.quantization:
+            # the quantized vectors were not written by the last session
+            self._requantize()
+            self._flush_rows()
+            self._storage.write_manifest(quantization=self.quantization)
+
+        self.logger.info(f"load {self.size} memory nodes from {self._storage.persist_dir}")
+        if self.index_type == "hnsw" and self.size:
+            self._start_background(compact_segments=False)
+
+    def _in_key_vectors(self, key_vector: List[float] | None) -> bool:
+        """
+        Returns whether a key vector is kept in the key vector file, only the key vectors of the store dims are.
+        """
+        return self._key_vectors is not None and bool(key_vector) and len(key_vector) == self.emb_dims
+
+    def _node_op(self, op: str, row: int, node: MemoryNode) -> Dict[str, Any]:
+        """
+        Builds the log record of a node inserted into or updated at the given row. Its key vector is written into
+        the key vector file at that row, and the record only references it.
+        """
+        node_dict = self._node_dict(node)
+        key_vector = node_dict.pop("key_vector")
+        record = {"op": op, "row": row, "node": node_dict}
+        if self._in_key_vectors(key_vector):
+            self._key_vectors[row] = key_vector
+            record["key_vector_row"] = True
+        elif key_vector:
+            node_dict["key_vector"] = key_vector
+        return record
+
+    def _op_node(self, op: Dict[str, Any], row: int) -> MemoryNode:
+        """
+        Rebuilds the node of a replayed log record, see `_node_op`.
+        """
+        node_dict = op["node"]
+        if op.get("key_vector_row"):
+            node_dict["key_vector"] = self._key_vectors[row].tolist()
+        return MemoryNode(**node_dict)
+
+    def _flush_rows(self):
+        """
+        Flushes the memory mapped vector files to the OS.
+        """
+        for rows in (self._vectors, self._key_vectors, self._q_vectors, self._q_scales):
+            if isinstance(rows, np.memmap):
+                rows.flush()
+
+    def _log_ops(self, ops: List[Dict[str, Any]]):
+        """
+        Writes operations ahead to the log, before they are applied. The rows they reference were written before,
+        and are flushed first. Must be called with the lock held.
+        """
+        if self._storage is None or not ops:
+            return
+        if any(op["op"] == "insert" or op.get("key_vector_row") for op in ops):
+            self._flush_rows()
+        self._storage.append_wal(ops)
+
+    def _maybe_checkpoint(self):
+        """
+        Checkpoints the columns when the log grows too long, once the logged operations are applied.
+        """
+        if self._storage is not None and self._storage.wal_ops >= self.wal_checkpoint_ops:
+            self._checkpoint()
+
+    def _checkpoint(self):
+        if self._storage is None or self.emb_dims is None:
+            return
+        self._flush_rows()
+        self._storage.save_columns(*self._dump_columns())
+        self._storage.truncate_wal()
+
+    @staticmethod
+    def _node_dict(node: MemoryNode) -> dict:
+        return node.model_dump(exclude={"vector", "score_recall", "score_rank", "score_rerank"})
+
+    def _compact(self):
+        """
+        Physically drops tombstoned rows of the in-memory arrays and rebuilds the id -> row mapping.
+        """
+        rows = np.flatnonzero(self._alive[:self._size])
+        vectors = np.zeros((self._capacity, self.emb_dims), dtype=np.float32)
+        vectors[:len(rows)] = self._vectors[rows]
+        q_vectors = q_scales = None
+        if self.quantization != "none":
+            q_vectors = np.zeros_like(self._q_vectors)
+            q_vectors[:len(rows)] = self._q_vectors[rows]
+            q_scales = np.ones_like(self._q_scales)
+            q_scales[:len(rows)] = self._q_scales[rows]
+        self.logger.info(f"compact rows {self._size} -> {len(rows)}")
+        self._take_rows(rows, vectors, self._capacity, q_vectors, q_scales)
+
+    def _open_segment(self, capacity: int, gen: int) -> List[np.memmap | None]:
+        """
+        Opens the vectors, quantized vectors and scales of a generation.
+        """
+        q_vectors, q_scales = None, None
+        if self.quantization != "none":
+            q_vectors, q_scales = self._storage.open_quantized(self.quantization, capacity, gen=gen)
+        return [self._storage.open_vectors(capacity, gen=gen), q_vectors, q_scales]
+
+    def _compact_segments(self):
+        """
+        Merges the persisted vectors into a new generation without tombstoned rows. Vectors of the snapshot are
+        copied without holding the lock, then rows appended meanwhile are merged under the lock.
+        """
+        with self._lock:
+            snapshot_size = self._size
+            rows = np.flatnonzero(self._alive[:snapshot_size])
+            old_segment = [self._vectors, self._q_vectors, self._q_scales]
+            new_gen = self._storage.gen + 1
+
+        new_segment = self._open_segment(max(len(rows) * 2, self.init_capacity), new_gen)
+        chunk_size = 65536
+        for start in range(0, len(rows), chunk_size):
+            chunk_rows = rows[start: start + chunk_size]
+            for old_rows, new_rows in zip(old_segment, new_segment):
+                if new_rows is not None:
+                    new_rows[start: start + len(chunk_rows)] = old_rows[chunk_rows]
+
+        with self._lock:
+            order = np.concatenate([rows, np.arange(snapshot_size, self._size)])
+            if len(order) > len(new_segment[0]):
+                new_segment = self._open_segment(len(order) * 2, new_gen)
+            for old_rows, new_rows in zip([self._vectors, self._q_vectors, self._q_scales], new_segment):
+                if new_rows is not None:
+                    new_rows[len(rows): len(order)] = old_rows[snapshot_size: self._size]
+            capacity = len(new_segment[0])
+            key_vectors = self._storage.open_key_vectors(capacity, gen=new_gen)
+            self.logger.info(f"compact segments rows {self._size} -> {len(order)}")
+            self._take_rows(order, new_segment[0], capacity, new_segment[1], new_segment[2], key_vectors)
+            # key vectors are few and may be updated in place, they are written from the payloads under the lock
+            for row, key_vector in enumerate(self._payloads["key_vector"][:self._size].tolist()):
+                if self._in_key_vectors(key_vector):
+                    key_vectors[row] = key_vector
+            self._flush_rows()
+            self._storage.save_columns(*self._dump_columns(), gen=new_gen)
+            self._storage.switch_gen(new_gen)
+            self._pending_index_ops.clear()
+
+    def _new_index(self) -> HnswIndex:
+        return HnswIndex(dim=self.emb_dims,
+                         m=self.hnsw_m,
+                         ef_construction=self.hnsw_ef_construction,
+                         ef_search=self.hnsw_ef_search,
+                         init_capacity=max(self._size, self.init_capacity))
+
+    def _index_add(self, rows: np.ndarray, vectors: np.ndarray):
+        if self.index_type != "hnsw":
+            return
+        if self._index_building:
+            self._pending_index_ops.append((rows, vectors))
+            return
+        if self._index is None:
+            self._index = self._new_index()
+        self._index.add(rows, vectors)
+
+    def _index_remove(self, row: int):
+        if self.index_type != "hnsw":
+            return
+        if self._index_building:
+            self._pending_index_ops.append((row, None))
+        elif self._index is not None:
+            self._index.remove(row)
+
+    def _rebuild_index(self):
+        """
+        Builds a new HnswIndex from a snapshot without holding the lock, queries using the brute-force scan in the
+        meantime, then replays the changes happened during the build and swaps the new index in.
+        """
+        with self._lock:
+            rows = np.flatnonzero(self._alive[:self._size])
+            # rows are only appended while the index is building, the rows of the snapshot are not rewritten
+            snapshot_vectors = self._vectors
+            self._pending_index_ops.clear()
+            index = self._new_index()
+
+        chunk_size = 65536
+        for start in range(0, len(rows), chunk_size):
+            chunk_rows = rows[start: start + chunk_size]
+            index.add(chunk_rows, np.array(snapshot_vectors[chunk_rows]))
+
+        with self._lock:
+            for op_rows, op_vectors in self._pending_index_ops:
+                if op_vectors is None:
+                    index.remove(op_rows)
+                else:
+                    index.add(op_rows, op_vectors)
+            self._pending_index_ops.clear()
+            self._index = index
+            self._index_building = False
+        self.logger.info(f"rebuild hnsw index size={index.size}")
+
+    def _background_job(self, compact_segments: bool):
+        try:
+            if compact_segments:
+                self._compact_segments()
+            if self.index_type == "hnsw":
+                self._rebuild_index()
+        except Exception as e:
+            self.logger.exception(f"memory store background job failed! args={e.args}")
+            with self._lock:
+                self._index_building = False
+
+    def _start_background(self, compact_segments: bool):
+        """
+        Starts compacting the persisted segments and/or rebuilding the index in a background thread.
+        Must be called with the lock held.
+        """
+        if self._background_running:
+            return
+        if self.index_type == "hnsw":
+            self._index = None
+            self._index_building = True
+            self._pending_index_ops.clear()
+        self._background_thread = threading.Thread(target=self._background_job,
+                                                   args=(compact_segments,),
+                                                   daemon=True)
+        self._background_thread.start()
+
+    def _maybe_compact(self):
+        if self._background_running:
+            return
+
+        need_compact = self._size and self._deleted_cnt > max(self.compact_ratio * self._size, 1)
+        need_rebuild = self._index is not None and self._index.deleted_ratio > self.compact_ratio
+        if self._storage is not None:
+            if need_compact:
+                self._start_background(compact_segments=True)
+            elif need_rebuild:
+                self._start_background(compact_segments=False)
+
+        elif self.index_type == "hnsw":
+            # in-memory compaction moves rows, so that it always comes with an index rebuild
+            if need_compact or need_rebuild:
+                self._compact()
+                self._start_background(compact_segments=False)
+
+        elif need_compact:
+            self._compact()
+
+    def _use_index(self, allowed_cnt: int) -> bool:
+        """
+        Decides whether the approximate index is worth using. Very selective filters are answered exactly.
+        """
+        return self._index is not None and not self._index_building \
+            and allowed_cnt > self.brute_force_rows and allowed_cnt >= self.brute_force_ratio * self.size
+
+    def _search(self,
+                query_vector: np.ndarray,
+                top_k: int,
+                mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Searches the top_k rows allowed by the mask.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The rows and their cosine similarities sorted by descending similarity.
+        """
+        rows = np.flatnonzero(mask)
+        if self._use_index(len(rows)):
+            index_rows, sims = self._index.search(query_vector, top_k, self.hnsw_ef_search, allowed=mask)
+            if len(index_rows) >= min(top_k, len(rows)):
+                return index_rows, sims
+            self.logger.warning(f"hnsw index returns {len(index_rows)} < top_k={top_k}, use brute force.")
+
+        return self._rescore(rows, self._scan_sims(rows, query_vector), query_vector, top_k)
+
+    def _scan_sims(self, rows: np.ndarray, query_vector: np.ndarray) -> np.ndarray:
+        """
+        Computes the similarities of the rows by brute force, approximated by the quantized vectors if enabled.
+        """
+        if self.quantization == "none":
+            return self._vectors[rows] @ query_vector
+
+        # chunked, so that the float32 copy of the quantized rows stays small
+        sims = np.empty(len(rows), dtype=np.float32)
+        chunk_size = 65536
+        for start in range(0, len(rows), chunk_size):
+            chunk_rows = rows[start: start + chunk_size]
+            sims[start: start + len(chunk_rows)] = \
+                (self._q_vectors[chunk_rows].astype(np.float32) @ query_vector) * self._q_scales[chunk_rows]
+        return sims
+
+    def _rescore(self,
+                 rows: np.ndarray,
+                 sims: np.ndarray,
+                 query_vector: np.ndarray,
+                 top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Selects the top_k rows by the scanned similarities. Quantized similarities only select the candidates, which
+        are then rescored with the float32 vectors.
+        """
+        if self.quantization == "none":
+            return self._top_k(rows, sims, top_k)
+        candidate_rows, _ = self._top_k(rows, sims, top_k * self.rescore_factor)
+        return self._top_k(candidate_rows, self._vectors[candidate_rows] @ query_vector, top_k)
+
+    @staticmethod
+    def _top_k(rows: np.ndarray, sims: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Selects the top_k rows by `argpartition`, sorted by descending similarity.
+        """
+        if len(rows) > top_k:
+            top_idx = np.argpartition(-sims, top_k - 1)[:top_k]
+        else:
+            top_idx = np.arange(len(rows))
+        top_idx = top_idx[np.argsort(-sims[top_idx], kind="stable")]
+        return rows[top_idx], sims[top_idx]
+
+    def _search_multi(self,
+                      query_vector: np.ndarray,
+                      sub_queries: List[Tuple[np.ndarray, int]]) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Searches the top_k rows of several (mask, top_k) sub-queries sharing the same query vector. The similarities
+        of all rows allowed by the brute-force sub-queries are computed in one matmul.
+        """
+        results: List[Tuple[np.ndarray, np.ndarray] | None] = [None] * len(sub_queries)
+        union_mask = np.zeros(self._size, dtype=bool)
+        for i, (mask, top_k) in enumerate(sub_queries):
+            if self._use_index(int(mask.sum())):
+                results[i] = self._search(query_vector, top_k, mask)
+            else:
+                union_mask |= mask
+
+        union_rows = np.flatnonzero(union_mask)
+        union_sims = self._scan_sims(union_rows, query_vector)
+        for i, (mask, top_k) in enumerate(sub_queries):
+            if results[i] is None:
+                sub_mask = mask[union_rows]
+                results[i] = self._rescore(union_rows[sub_mask], union_sims[sub_mask], query_vector, top_k)
+        return results
+
+    def retrieve_memories(self,
+                          query: str = "",
+                          top_k: int = 3,
+                          filter_dict: Dict[str, List[str]] | Dict[str, str] = None,
+                          return_vectors: bool = True,
+                          query_vector: List[float] = None) -> List[MemoryNode]:
+        if top_k <= 0:
+            return []
+
+        query_vector = self._query_vector(query, query_vector)
+        with self._lock:
+            if not self.size:
+                return []
+
+            mask = self._filter_mask(filter_dict)
+            if query_vector is None:
+                nodes = [self._read_row(row, return_vector=return_vectors) for row in np.flatnonzero(mask)[:top_k]]
+            else:
+                rows, sims = self._search(query_vector, top_k, mask)
+                # keep the same scale as the cosine `_score` of elasticsearch: (1 + cos) / 2
+                nodes = [self._read_row(row, float(1 + sim) / 2, return_vectors) for row, sim in zip(rows, sims)]
+
+        self.logger.log_dictionary_info({
+            "action": "retrieve_memories",
+            "query": query,
+            "text_nodes": [f"ID: {n.memory_id} |Text: {n.content}" for n in nodes]
+        })
+        return nodes
+
+    def retrieve_memories_multi(self,
+                                query: str,
+                                sub_queries: List[Tuple[Dict[str, List[str]], int]],
+                                return_vectors: bool = True,
+                                query_vector: List[float] = None) -> List[List[MemoryNode]]:
+        if not query:
+            return super().retrieve_memories_multi(query, sub_queries, return_vectors)
+
+        nodes_list: List[List[MemoryNode]] = [[] for _ in sub_queries]
+        valid_idx = [i for i, (_, top_k) in enumerate(sub_queries) if top_k > 0]
+        if not valid_idx:
+            return nodes_list
+
+        query_vector = self._query_vector(query, query_vector)
+        with self._lock:
+            if not self.size:
+                return nodes_list
+
+            masks = [(self._filter_mask(sub_queries[i][0]), sub_queries[i][1]) for i in valid_idx]
+            for i, (rows, sims) in zip(valid_idx, self._search_multi(query_vector, masks)):
+                nodes_list[i] = [self._read_row(row, float(1 + sim) / 2, return_vectors)
+                                 for row, sim in zip(rows, sims)]
+
+        self.logger.log_dictionary_info({
+            "action": "retrieve_memories_multi",
+            "query": query,
+            "text_nodes": [[f"ID: {n.memory_id} |Text: {n.content}" for n in nodes] for nodes in nodes_list]
+        })
+        return nodes_list
+
+    def iter_memories(self,
+                      filter_dict: Dict[str, List[str]] | Dict[str, str] = None,
+                      page_size: int = 500,
+                      return_vectors: bool = False) -> Iterator[List[MemoryNode]]:
+        # rows move when segments are compacted, so the scan snapshots the memory ids and resolves them per page.
+        # Nodes deleted during the scan are skipped.
+        with self._lock:
+            if not self.size:
+                return
+            memory_ids = self._payloads["memory_id"][np.flatnonzero(self._filter_mask(filter_dict))].tolist()
+
+        for start in range(0, len(memory_ids), page_size):
+            with self._lock:
+                rows = [self._id_row_dict.get(memory_id) for memory_id in memory_ids[start: start + page_size]]
+                nodes = [self._read_row(row, return_vector=return_vectors) for row in rows if row is not None]
+            if nodes:
+                yield nodes
+
+    async def a_retrieve_memories(self,
+                                  query: str = "",
+                                  top_k: int = 3,
+                                  filter_dict: Dict[str, List[str]] | Dict[str, str] = None,
+                                  return_vectors: bool = True) -> List[MemoryNode]:
+        # the query embedding is a blocking call, run in a worker thread to keep the event loop free
+        return await asyncio.to_thread(self.retrieve_memories, query, top_k, filter_dict, return_vectors)
+
+    def batch_insert(self, nodes: List[MemoryNode]):
+        if not nodes:
+            return
+
+        # embed the nodes without vectors in one call
+        empty_nodes = [n for n in nodes if not n.vector]
+        if empty_nodes:
+            for node, embedding in zip(empty_nodes, self._embed([n.content for n in empty_nodes])):
+                node.vector = embedding
+        vectors = self._normalize(np.asarray([n.vector for n in nodes], dtype=np.float32))
+
+        with self._lock:
+            if self.emb_dims is None:
+                self.emb_dims = vectors.shape[1]
+            elif vectors.shape[1] != self.emb_dims:
+                raise ValueError(f"vector dims={vectors.shape[1]} mismatches store dims={self.emb_dims}!")
+
+            start = self._size
+            if start + len(nodes) > self._capacity:
+                self._allocate(max(self._capacity * 2, start + len(nodes), self.init_capacity))
+            rows = np.arange(start, start + len(nodes))
+            # the vectors go into rows not used yet, the nodes are only applied once logged
+            self._write_vectors(rows, vectors)
+            self._log_ops([self._node_op("insert", row, node) for row, node in zip(rows.tolist(), nodes)])
+            for row, node in zip(rows.tolist(), nodes):
+                self._append_row(node, row)
+            self._index_add(rows, vectors)
+            self._maybe_checkpoint()
+            self._maybe_compact()
+
+        self.logger.log_dictionary_info({
+            "action": "batch_insert",
+            "nodes": [f"ID: {n.memory_id} | Text: {n.content} | Type: {n.memory_type}" for n in nodes]
+        })
+
+    def batch_update(self, nodes: List[MemoryNode], update_embedding: bool = True):
+        if not nodes:
+            return
+
+        if update_embedding:
+            for node in nodes:
+                node.vector = []
+            self.batch_insert(nodes)
+            return
+
+        # metadata-only update, vectors are kept
+        missing_nodes = []
+        with self._lock:
+            updates = []
+            for node in nodes:
+                row = self._id_row_dict.get(node.memory_id)
+                if row is None:
+                    missing_nodes.append(node)
+                else:
+                    updates.append((row, node))
+            self._log_ops([self._node_op("update", row, node) for row, node in updates])
+            for row, node in updates:
+                self._write_row(row, node)
+            self._maybe_checkpoint()
+        if missing_nodes:
+            self.batch_insert(missing_nodes)
+
+    def batch_delete(self, nodes: List[MemoryNode]):
+        if not nodes:
+            return
+
+        with self._lock:
+            memory_ids = list(dict.fromkeys(n.memory_id for n in nodes if n.memory_id in self._id_row_dict))
+            self._log_ops([{"op": "delete", "memory_id": memory_id} for memory_id in memory_ids])
+            for memory_id in memory_ids:
+                self._tombstone(memory_id)
+            self._maybe_checkpoint()
+            self._maybe_compact()
+
+        self.logger.log_dictionary_info({
+            "action": "batch_delete",
+            "ids": [n.memory_id for n in nodes],
+        })
+
+    def close(self):
+        """
+        Waits for the background job, checkpoints the persisted store and releases all arrays held by the store.
+        """
+        if self._background_running:
+            self._background_thread.join()
+        with self._lock:
+            if self._storage is not None:
+                self._checkpoint()
+                self._storage.close()
+            self._index = None
+            self._pending_index_ops.clear()
+            self._id_row_dict.clear()
+            self._size = 0
+            self._deleted_cnt = 0
+            self._capacity = 0
+            self._vectors = None
+            self._key_vectors = None
+            self._q_vectors = None
+            self._q_scales = None
+            self._alive = np.zeros(0, dtype=bool)
+            self._codes.clear()
+            self._numerics.clear()
+            self._payloads.clear()
@@ -0,0 +1,223 @@
+import json
+import os
+from typing import Dict, List, Any, Iterator, Tuple
+
+import numpy as np
+
+from memoryscope.core.utils.logger import Logger
+
+
+class SegmentStorage(object):
+    """
+    The on-disk layout of a NumpyMemoryStore. Every generation of the store consists of
+    - `vectors.{gen}.f32`: a fixed-width float32 vector file, row i holding the vector of store row i,
+      opened with `np.memmap` so that vectors are paged in by the OS on demand;
+    - `key_vectors.{gen}.f32`: the key vectors of the store rows, in the same layout;
+    - `qvectors.{gen}.i8|f16` and `qscales.{gen}.f32`: the quantized vectors and their scales, if the store is
+      quantized, in the same layout;
+    - `columns.{gen}.npz`: the metadata sidecar, a checkpoint of all metadata columns as typed arrays only, the
+      payloads of each row being encoded as a JSON line into a byte array, so that it is loaded without pickle;
+    - `wal.{gen}.jsonl`: the write-ahead log of the inserts, updates and deletes applied after the checkpoint.
+    Vector rows are append-only within a generation. Compaction merges the checkpoint and the log tail into a new
+    generation without tombstoned rows, and `manifest.json` is atomically switched to it.
+    """
+
+    MANIFEST_NAME: str = "manifest.json"
+
+    QUANTIZED_DTYPES: Dict[str, Tuple[Any, str]] = {"float16": (np.float16, "f16"), "int8": (np.int8, "i8")}
+
+    def __init__(self, persist_dir: str, wal_fsync: bool = True):
+        """
+        Initializes the SegmentStorage, reading the manifest if it exists.
+
+        Args:
+            persist_dir (str): The directory holding all files of the store.
+            wal_fsync (bool): Fsync the write-ahead log on every append, else it is only flushed to the OS.
+        """
+        self.persist_dir: str = persist_dir
+        self.wal_fsync: bool = wal_fsync
+        os.makedirs(persist_dir, exist_ok=True)
+
+        self.gen: int = 0
+        self.dims: int | None = None
+        # the quantization of the quantized vector files, `none` if they are missing or out of date
+        self.quantization: str = "none"
+        manifest_path = os.path.join(persist_dir, self.MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            self.gen = manifest["gen"]
+            self.dims = manifest["dims"]
+            self.quantization = manifest.get("quantization", "none")
+
+        self._wal_file = None
+        self.wal_ops: int = 0
+        self.logger = Logger.get_logger("segment_storage")
+
+    def _path(self, kind: str, gen: int = None, suffix: str = None) -> str:
+        gen = self.gen if gen is None else gen
+        suffix = suffix or {"vectors": "f32", "key_vectors": "f32", "qscales": "f32", "columns": "npz",
+                            "wal": "jsonl"}[kind]
+        return os.path.join(self.persist_dir, f"{kind}.{gen:06d}.{suffix}")
+
+    def write_manifest(self, gen: int = None, dims: int = None, quantization: str = None):
+        """
+        Atomically points the manifest to the given generation.
+        """
+        self.gen = self.gen if gen is None else gen
+        self.dims = self.dims if dims is None else dims
+        self.quantization = self.quantization if quantization is None else quantization
+        tmp_path = os.path.join(self.persist_dir, self.MANIFEST_NAME + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"gen": self.gen, "dims": self.dims, "quantization": self.quantization}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.persist_dir, self.MANIFEST_NAME))
+
+    @staticmethod
+    def _open_rows(path: str, dtype, width: int | None, capacity: int) -> np.memmap | None:
+        """
+        Opens a file of fixed-width rows, growing it to at least `capacity` rows. Growing only extends the file,
+        so that the unused tail stays sparse on disk.
+        """
+        row_bytes = np.dtype(dtype).itemsize * (width or 1)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if capacity * row_bytes > size:
+            with open(path, "ab") as f:
+                f.truncate(capacity * row_bytes)
+            size = capacity * row_bytes
+        if not size:
+            return None
+        shape = (size // row_bytes, width) if width else (size // row_bytes,)
+        return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+
+    def open_vectors(self, capacity: int = 0, gen: int = None) -> np.memmap | None:
+        """
+        Opens the vector file of a generation, growing it to at least `capacity` rows.
+
+        Returns:
+            np.memmap | None: The (rows, dims) float32 memmap, None if nothing was written yet.
+        """
+        return self._open_rows(self._path("vectors", gen), np.float32, self.dims, capacity)
+
+    def open_key_vectors(self, capacity: int = 0, gen: int = None) -> np.memmap | None:
+        """
+        Opens the key vector file of a generation, growing it to at least `capacity` rows.
+
+        Returns:
+            np.memmap | None: The (rows, dims) float32 memmap, None if nothing was written yet.
+        """
+        return self._open_rows(self._path("key_vectors", gen), np.float32, self.dims, capacity)
+
+    def open_quantized(self,
+                       quantization: str,
+                       capacity: int = 0,
+                       gen: int = None) -> Tuple[np.memmap | None, np.memmap | None]:
+        """
+        Opens the quantized vector and scale files of a generation, growing them to at least `capacity` rows.
+
+        Returns:
+            Tuple[np.memmap | None, np.memmap | None]: The (rows, dims) quantized vectors and the (rows,) float32
+                scales, None if nothing was written yet.
+        """
+        dtype, suffix = self.QUANTIZED_DTYPES[quantization]
+        q_vectors = self._open_rows(self._path("qvectors", gen, suffix), dtype, self.dims, capacity)
+        q_scales = self._open_rows(self._path("qscales", gen), np.float32, None, capacity)
+        return q_vectors, q_scales
+
+    def load_columns(self) -> Tuple[Dict[str, np.ndarray], List[dict | None]]:
+        """
+        Loads the checkpointed metadata columns of the current generation, empty if never checkpointed.
+
+        Returns:
+            Tuple[Dict[str, np.ndarray], List[dict | None]]: The typed columns, and the payloads of each row.
+        """
+        path = self._path("columns")
+        if not os.path.exists(path):
+            return {}, []
+        with np.load(path, allow_pickle=False) as data:
+            columns = {key: data[key] for key in data.files}
+        data = columns.pop("payloads.data").tobytes()
+        offsets = columns.pop("payloads.offsets").tolist()
+        payloads = [json.loads(data[start: end]) for start, end in zip(offsets[:-1], offsets[1:])]
+        return columns, payloads
+
+    def save_columns(self, columns: Dict[str, np.ndarray], payloads: List[dict | None], gen: int = None):
+        """
+        Atomically writes the metadata columns checkpoint of a generation.
+
+        Args:
+            columns (Dict[str, np.ndarray]): The typed columns, no object arrays.
+            payloads (List[dict | None]): The JSON serializable payloads of each row.
+            gen (int): The generation, the current one if not set.
+        """
+        lines = [json.dumps(payload, ensure_ascii=False).encode("utf-8") for payload in payloads]
+        offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+        np.cumsum([len(line) for line in lines], out=offsets[1:])
+        path = self._path("columns", gen)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path,
+                 **columns,
+                 **{"payloads.data": np.frombuffer(b"".join(lines), dtype=np.uint8),
+                    "payloads.offsets": offsets})
+        os.replace(tmp_path, path)
+
+    def replay_wal(self) -> Iterator[Dict[str, Any]]:
+        """
+        Yields the logged operations of the current generation in order. A torn last line is ignored.
+        """
+        path = self._path("wal")
+        if not os.path.exists(path):
+            return
+        with open(path) as f:
+            for line in f:
+                try:
+                    op = json.loads(line)
+                except json.JSONDecodeError:
+                    self.logger.warning(f"skip broken wal line in {path}")
+                    continue
+                self.wal_ops += 1
+                yield op
+
+    def append_wal(self, ops: List[Dict[str, Any]]):
+        """
+        Appends operations to the write-ahead log of the current generation, durable once returned if `wal_fsync`.
+        """
+        if not ops:
+            return
+        if self._wal_file is None:
+            self._wal_file = open(self._path("wal"), "a")
+        self._wal_file.write("".join(json.dumps(op, ensure_ascii=False) + "\n" for op in ops))
+        self._wal_file.flush()
+        if self.wal_fsync:
+            os.fsync(self._wal_file.fileno())
+        self.wal_ops += len(ops)
+
+    def truncate_wal(self):
+        """
+        Empties the write-ahead log, to be called once its operations are checkpointed.
+        """
+        if self._wal_file is not None:
+            self._wal_file.close()
+        self._wal_file = open(self._path("wal"), "w")
+        self.wal_ops = 0
+
+    def switch_gen(self, gen: int):
+        """
+        Switches to a new generation whose files are already written, then removes the files of the old one.
+        """
+        old_gen = self.gen
+        if self._wal_file is not None:
+            self._wal_file.close()
+            self._wal_file = None
+        self.write_manifest(gen=gen)
+        self.wal_ops = 0
+        old_infix = f".{old_gen:06d}."
+        for name in os.listdir(self.persist_dir):
+            if old_infix in name:
+                os.remove(os.path.join(self.persist_dir, name))
+
+    def close(self):
+        if self._wal_file is not None:
+            self._wal_file.close()
+            self._wal_file = None
@@ -0,0 +1,340 @@
+import asyncio
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from memoryscope.core.models.base_model import BaseModel
+from memoryscope.core.storage.base_memory_store import BaseMemoryStore
+from memoryscope.core.utils.logger import Logger
+from memoryscope.core.utils.tool_functions import init_instance_by_config
+from memoryscope.scheme.memory_node import MemoryNode
+
+# pending write ops, one per memory id
+OP_INSERT = "insert"
+OP_UPDATE = "update"
+OP_UPDATE_EMBEDDING = "update_embedding"
+OP_DELETE = "delete"
+
+
+class WriteBehindMemoryStore(BaseMemoryStore):
+    """
+    Buffers the writes sent to another memory store and sends them in batches. Inserts, updates and deletes are
+    coalesced by memory id, the last write wins, and flushed once `max_pending` memory ids are pending, once the
+    oldest pending write is `max_age` seconds old, or on `flush()` / `close()`.
+
+    Reads go to the wrapped store and are overlaid with the pending writes, so that they still see them: deleted
+    nodes are dropped, written nodes replace the stored ones, and inserted nodes matching the filter are added.
+
+    Example of config:
+        memory_store:
+          class: core.storage.write_behind_memory_store
+          embedding_model: embedding_model
+          max_pending: 500
+          max_age: 5
+          store:
+            class: core.storage.llama_index_es_memory_store
+            index_name: memory_index
+            es_url: http://localhost:9200
+    """
+
+    def __init__(self,
+                 embedding_model: BaseModel,
+                 store: Dict[str, Any] | BaseMemoryStore,
+                 max_pending: int = 500,
+                 max_age: float = 5.0,
+                 **kwargs):
+        """
+        Initializes the WriteBehindMemoryStore.
+
+        Args:
+            embedding_model (BaseModel): The model used to embed queries and pending nodes for the overlay.
+            store (Dict[str, Any] | BaseMemoryStore): The wrapped memory store or its config.
+            max_pending (int): Flush once this number of memory ids are pending.
+            max_age (float): Flush once the oldest pending write is this many seconds old.
+            **kwargs: Other memory_store configs, unused by this store.
+        """
+        self.embedding_model: BaseModel = embedding_model
+        if isinstance(store, dict):
+            store = init_instance_by_config(store, embedding_model=embedding_model)
+        self.store: BaseMemoryStore = store
+        self.max_pending: int = max_pending
+        self.max_age: float = max_age
+        self.kwargs: dict = kwargs
+
+        self._lock = threading.RLock()
+        # serializes the flushes, so that the batches reach the wrapped store in order
+        self._flush_lock = threading.Lock()
+        # memory_id -> (op, node)
+        self._pending: Dict[str, Tuple[str, MemoryNode]] = {}
+        # the batch being flushed, still overlaid until it is written
+        self._flushing: Dict[str, Tuple[str, MemoryNode]] = {}
+        self._oldest_time: float | None = None
+
+        self.logger = Logger.get_logger("write_behind_memory_store")
+
+        self._stop_event = threading.Event()
+        self._flush_thread = threading.Thread(target=self._flush_job, name="write_behind_flush", daemon=True)
+        self._flush_thread.start()
+
+    @property
+    def pending_size(self) -> int:
+        """
+        Returns the number of memory ids with a pending write.
+        """
+        with self._lock:
+            return len(self._pending)
+
+    @staticmethod
+    def _merge_op(prev: Tuple[str, MemoryNode] | None, op: str, node: MemoryNode) -> Tuple[str, MemoryNode]:
+        """
+        Coalesces a new write with the pending write of the same memory id.
+        """
+        if prev is None or op in (OP_INSERT, OP_DELETE):
+            return op, node
+
+        prev_op, prev_node = prev
+        if prev_op in (OP_INSERT, OP_DELETE):
+            # the node is written as a whole, insert being an upsert in all stores
+            if op == OP_UPDATE_EMBEDDING:
+                node.vector = []
+            return OP_INSERT, node
+
+        if op == OP_UPDATE and prev_op == OP_UPDATE_EMBEDDING:
+            op = OP_UPDATE_EMBEDDING
+        if op == OP_UPDATE and prev_node is not node:
+            # the changed fields of the previous node object are not tracked by this one
+            if "content" in prev_node.dirty_fields or "content" in node.dirty_fields:
+                return OP_INSERT, node
+            node.mark_clean()
+        return op, node
+
+    def _write(self, op: str, nodes: List[MemoryNode]):
+        if not nodes:
+            return
+
+        with self._lock:
+            for node in nodes:
+                self._pending[node.memory_id] = self._merge_op(self._pending.get(node.memory_id), op, node)
+            if self._oldest_time is None:
+                self._oldest_time = time.time()
+            is_full = len(self._pending) >= self.max_pending
+        if is_full:
+            self.flush()
+
+    def batch_insert(self, nodes: List[MemoryNode]):
+        self._write(OP_INSERT, nodes)
+
+    def batch_update(self, nodes: List[MemoryNode], update_embedding: bool = True):
+        self._write(OP_UPDATE_EMBEDDING if update_embedding else OP_UPDATE, nodes)
+
+    def batch_delete(self, nodes: List[MemoryNode]):
+        self._write(OP_DELETE, nodes)
+
+    def flush(self):
+        """
+        Sends all pending writes to the wrapped store, one batch call per kind of write. Writes failing are put back
+        as pending unless they have been overwritten meanwhile.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                self._flushing = self._pending
+                self._pending = {}
+                self._oldest_time = None
+
+            op_nodes: Dict[str, List[MemoryNode]] = {OP_DELETE: [], OP_INSERT: [], OP_UPDATE_EMBEDDING: [],
+                                                     OP_UPDATE: []}
+            for op, node in self._flushing.values():
+                op_nodes[op].append(node)
+
+            try:
+                if op_nodes[OP_DELETE]:
+                    self.store.batch_delete(op_nodes[OP_DELETE])
+                if op_nodes[OP_INSERT]:
+                    self.store.batch_insert(op_nodes[OP_INSERT])
+                if op_nodes[OP_UPDATE_EMBEDDING]:
+                    self.store.batch_update(op_nodes[OP_UPDATE_EMBEDDING], update_embedding=True)
+                if op_nodes[OP_UPDATE]:
+                    self.store.batch_update(op_nodes[OP_UPDATE], update_embedding=False)
+            except Exception as e:
+                self.logger.exception(f"flush {len(self._flushing)} writes failed! error={e.args}")
+                with self._lock:
+                    for memory_id, entry in self._flushing.items():
+                        self._pending.setdefault(memory_id, entry)
+                    if self._oldest_time is None:
+                        self._oldest_time = time.time()
+                raise
+            finally:
+                with self._lock:
+                    self._flushing = {}
+
+            self.logger.log_dictionary_info({
+                "action": "flush",
+                **{op: len(nodes) for op, nodes in op_nodes.items()},
+            })
+
+    def _flush_job(self):
+        interval = max(min(self.max_age / 2, 1.0), 0.01)
+        while not self._stop_event.wait(interval):
+            with self._lock:
+                is_old = self._oldest_time is not None and time.time() - self._oldest_time >= self.max_age
+            if is_old:
+                try:
+                    self.flush()
+                except Exception:
+                    # logged by flush, retried at the next round
+                    pass
+
+    def _pending_view(self) -> Dict[str, Tuple[str, MemoryNode]]:
+        with self._lock:
+            return {**self._flushing, **self._pending}
+
+    @staticmethod
+    def _match_filter(node: MemoryNode, filter_dict: Dict[str, Any] = None) -> bool:
+        """
+        Evaluates the filter dict on a node like the stores do: a list value matches any of its items, a scalar
+        value must match exactly, and all keys are combined with AND.
+        """
+        for key, value in (filter_dict or {}).items():
+            values = value if isinstance(value, list) else [value]
+            if getattr(node, key, None) not in values:
+                return False
+        return True
+
+    def _embed_pending(self, nodes: List[MemoryNode]):
+        """
+        Embeds the pending nodes without vectors, the vectors are reused by the flush.
+        """
+        empty_nodes = [n for n in nodes if not n.vector]
+        if not empty_nodes:
+            return
+
+        response = self.embedding_model.call(text=[n.content for n in empty_nodes])
+        if response is None or not response.status:
+            self.logger.warning("embed pending nodes failed, they are left out of the query results.")
+            return
+        embeddings = response.embedding_results
+        if len(empty_nodes) == 1:
+            embeddings = [embeddings]
+        for node, embedding in zip(empty_nodes, embeddings):
+            node.vector = embedding
+
+    @staticmethod
+    def _copy_node(node: MemoryNode, score: float | None = None, return_vectors: bool = True) -> MemoryNode:
+        """
+        Copies a pending node, so that the caller does not change the write in place.
+        """
+        copy_node = node.model_copy(deep=True)
+        if not return_vectors:
+            copy_node.vector = []
+        if score is not None:
+            copy_node.score_recall = score
+        copy_node.mark_clean()
+        return copy_node
+
+    def _overlay(self,
+                 nodes: List[MemoryNode],
+                 pending: Dict[str, Tuple[str, MemoryNode]],
+                 filter_dict: Dict[str, Any],
+                 top_k: int,
+                 query_vector: np.ndarray | None = None,
+                 return_vectors: bool = True) -> List[MemoryNode]:
+        """
+        Overlays the pending writes onto the nodes retrieved from the wrapped store.
+        """
+        written_nodes = [n for op, n in pending.values() if op != OP_DELETE and self._match_filter(n, filter_dict)]
+        result = [n for n in nodes if n.memory_id not in pending]
+        if query_vector is None:
+            result.extend(self._copy_node(n, return_vectors=return_vectors) for n in written_nodes)
+            return result[:top_k]
+
+        self._embed_pending(written_nodes)
+        for node in written_nodes:
+            if not node.vector:
+                continue
+            vector = np.asarray(node.vector, dtype=np.float32)
+            sim = float(vector @ query_vector) / max(float(np.linalg.norm(vector)), 1e-12)
+            # keep the same scale as the cosine `_score` of elasticsearch: (1 + cos) / 2
+            result.append(self._copy_node(node, (1 + sim) / 2, return_vectors))
+        return sorted(result, key=lambda x: x.score_recall, reverse=True)[:top_k]
+
+    def _embed_query(self, query: str, query_vector: List[float] | None) -> List[float] | None:
+        """
+        Embeds the query once for both the wrapped store and the overlay, unless the caller did, None without query.
+        """
+        if not query:
+            return None
+        if query_vector is None:
+            query_vector = self.embedding_model.get_query_embedding(query)
+        return query_vector
+
+    @staticmethod
+    def _normalize(query_vector: List[float] | None) -> np.ndarray | None:
+        if query_vector is None:
+            return None
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        return query_vector / max(float(np.linalg.norm(query_vector)), 1e-12)
+
+    def retrieve_memories(self,
+                          query: str = "",
+                          top_k: int = 3,
+                          filter_dict: Dict[str, List[str]] | Dict[str, str] = None,
+                          return_vectors: bool = True,
+                          query_vector: List[float] = None) -> List[MemoryNode]:
+        pending = self._pending_view()
+        if not pending:
+            return self.store.retrieve_memories(query, top_k, filter_dict, return_vectors, query_vector)
+
+        # retrieve more nodes as some of them may be dropped by the overlay
+        query_vector = self._embed_query(query, query_vector)
+        nodes = self.store.retrieve_memories(query, top_k + len(pending), filter_dict, return_vectors, query_vector)
+        return self._overlay(nodes, pending, filter_dict, top_k, self._normalize(query_vector), return_vectors)
+
+    def retrieve_memories_multi(self,
+                                query: str,
+                                sub_queries: List[Tuple[Dict[str, List[str]], int]],
+                                return_vectors: bool = True,
+                                query_vector: List[float] = None) -> List[List[MemoryNode]]:
+        pending = self._pending_view()
+        if not pending:
+            return self.store.retrieve_memories_multi(query, sub_queries, return_vectors, query_vector)
+
+        query_vector = self._embed_query(query, query_vector)
+        nodes_list = self.store.retrieve_memories_multi(query,
+                                                        [(f, top_k + len(pending) if top_k > 0 else 0)
+                                                         for f, top_k in sub_queries],
+                                                        return_vectors,
+                                                        query_vector)
+        query_vector = self._normalize(query_vector)
+        return [self._overlay(nodes, pending, filter_dict, top_k, query_vector, return_vectors) if top_k > 0 else []
+                for nodes, (filter_dict, top_k) in zip(nodes_list, sub_queries)]
+
+    async def a_retrieve_memories(self,
+                                  query: str = "",
+                                  top_k: int = 3,
+                                  filter_dict: Dict[str, List[str]] | Dict[str, str] = None,
+                                  return_vectors: bool = True) -> List[MemoryNode]:
+        return await asyncio.to_thread(self.retrieve_memories, query, top_k, filter_dict, return_vectors)
+
+    def iter_memories(self,
+                      filter_dict: Dict[str, List[str]] | Dict[str, str] = None,
+                      page_size: int = 500,
+                      return_vectors: bool = False) -> Iterator[List[MemoryNode]]:
+        # a full scan is not overlaid page by page, the pending writes are flushed first
+        self.flush()
+        yield from self.store.iter_memories(filter_dict=filter_dict, page_size=page_size,
+                                            return_vectors=return_vectors)
+
+    def close(self):
+        """
+        Stops the flush thread, flushes the pending writes and closes the wrapped store.
+        """
+        self._stop_event.set()
+        self._flush_thread.join()
+        try:
+            self.flush()
+        finally:
+            self.store.close()
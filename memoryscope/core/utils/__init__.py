@@ -1,5 +1,7 @@
 from .datetime_handler import DatetimeHandler
+from .embedding_disk_cache import EmbeddingDiskCache
 from .logger import Logger
+from .lru_cache import LruCache
 from .prompt_handler import PromptHandler
 from .registry import Registry
 from .response_text_parser import ResponseTextParser
@@ -12,12 +14,16 @@ from .tool_functions import (
     char_logo,
     md5_hash,
     contains_keyword,
-    cosine_similarity
+    cosine_similarity,
+    vector_to_base64,
+    base64_to_vector
 )
 
 __all__ = [
     "DatetimeHandler",
+    "EmbeddingDiskCache",
     "Logger",
+    "LruCache",
     "PromptHandler",
     "Registry",
     "ResponseTextParser",
@@ -29,5 +35,7 @@ __all__ = [
     "char_logo",
     "md5_hash",
     "contains_keyword",
-    "cosine_similarity"
+    "cosine_similarity",
+    "vector_to_base64",
+    "base64_to_vector"
 ]
@@ -0,0 +1,74 @@
+import threading
+import time
+
+
+class CircuitBreaker(object):
+    """
+    A thread-safe circuit breaker. After `failure_threshold` consecutive failed calls, each one counted once all
+    its retries are exhausted, the circuit opens and calls fail fast without reaching the provider. Once
+    `reset_timeout` seconds have passed, one trial call is let through (half-open): its success closes the circuit,
+    its failure opens it again.
+    """
+
+    CLOSED: str = "closed"
+    OPEN: str = "open"
+    HALF_OPEN: str = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Initializes the CircuitBreaker.
+
+        Args:
+            failure_threshold (int): The number of consecutive failures opening the circuit, 0 to never open it.
+            reset_timeout (float): The seconds the circuit stays open before a trial call.
+        """
+        self.failure_threshold: int = failure_threshold
+        self.reset_timeout: float = reset_timeout
+
+        self._lock = threading.Lock()
+        self._state: str = self.CLOSED
+        self._failure_cnt: int = 0
+        self._opened_time: float = 0.0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def allow(self) -> bool:
+        """
+        Whether a call may go through. Moves an open circuit to half-open once the reset timeout has passed, letting
+        only the calling thread try.
+
+        Returns:
+            bool: True if the call may go through.
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.time() - self._opened_time >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failure_cnt = 0
+
+    def abort_trial(self):
+        """
+        Ends a half-open trial call without an outcome, e.g. cancelled: the circuit opens again with its reset
+        timeout already passed, so that the next call is the new trial. Does nothing once an outcome is recorded.
+        """
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._state = self.OPEN
+
+    def record_failure(self):
+        with self._lock:
+            self._failure_cnt += 1
+            if self._state == self.HALF_OPEN or \
+                    (self.failure_threshold > 0 and self._failure_cnt >= self.failure_threshold):
+                self._state = self.OPEN
+                self._opened_time = time.time()
@@ -0,0 +1,116 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from memoryscope.core.utils.tool_functions import md5_hash
+
+
+class EmbeddingDiskCache(object):
+    """
+    A persistent embedding cache in a SQLite file, which several processes can share. Embeddings are keyed by
+    (model, md5 of the text) and stored as raw float32 blobs. Once the cache holds more than `max_size` embeddings,
+    the least recently used ones are evicted.
+    """
+
+    def __init__(self, path: str, max_size: int = 1000000, evict_ratio: float = 0.1, timeout: float = 30.0):
+        """
+        Opens or creates the cache file.
+
+        Args:
+            path (str): The SQLite file path.
+            max_size (int): The max number of embeddings kept.
+            evict_ratio (float): The ratio of `max_size` evicted at once when full, to amortize the eviction.
+            timeout (float): The seconds to wait for the lock held by another process.
+        """
+        self.path: str = path
+        self.max_size: int = max_size
+        self.evict_ratio: float = evict_ratio
+
+        dir_name = os.path.dirname(path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings ("
+                           "model TEXT NOT NULL, "
+                           "hash TEXT NOT NULL, "
+                           "vector BLOB NOT NULL, "
+                           "access_time REAL NOT NULL, "
+                           "PRIMARY KEY (model, hash))")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_access_time ON embeddings (access_time)")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model: str, texts: List[str]) -> Dict[str, List[float]]:
+        """
+        Returns the cached embeddings of the texts found, refreshing their access time.
+
+        Args:
+            model (str): The embedding model name.
+            texts (List[str]): The texts to look up.
+
+        Returns:
+            Dict[str, List[float]]: The embeddings by text.
+        """
+        hash_text_dict = {md5_hash(t): t for t in texts}
+        result = {}
+        if not hash_text_dict:
+            return result
+
+        hashes = list(hash_text_dict.keys())
+        with self._lock:
+            # sqlite limits the number of host parameters of one statement
+            for start in range(0, len(hashes), 500):
+                chunk = hashes[start: start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(f"SELECT hash, vector FROM embeddings "
+                                          f"WHERE model = ? AND hash IN ({placeholders})", [model, *chunk])
+                for hash_value, vector in rows:
+                    result[hash_text_dict[hash_value]] = np.frombuffer(vector, dtype=np.float32).tolist()
+
+            if result:
+                now = time.time()
+                self._conn.executemany("UPDATE embeddings SET access_time = ? WHERE model = ? AND hash = ?",
+                                       [(now, model, md5_hash(t)) for t in result])
+        return result
+
+    def put_many(self, model: str, text_embedding_dict: Dict[str, List[float]]):
+        """
+        Caches the embeddings of the texts, evicting the least recently used embeddings if full.
+
+        Args:
+            model (str): The embedding model name.
+            text_embedding_dict (Dict[str, List[float]]): The embeddings by text.
+        """
+        if not text_embedding_dict:
+            return
+
+        now = time.time()
+        rows = [(model, md5_hash(t), np.asarray(e, dtype=np.float32).tobytes(), now)
+                for t, e in text_embedding_dict.items()]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany("INSERT OR REPLACE INTO embeddings (model, hash, vector, access_time) "
+                                       "VALUES (?, ?, ?, ?)", rows)
+                size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                if size > self.max_size:
+                    evict_cnt = size - self.max_size + int(self.max_size * self.evict_ratio)
+                    self._conn.execute("DELETE FROM embeddings WHERE rowid IN "
+                                       "(SELECT rowid FROM embeddings ORDER BY access_time LIMIT ?)", (evict_cnt,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
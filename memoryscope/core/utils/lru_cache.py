@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Tuple
+
+
+class LruCache(object):
+    """
+    A thread-safe bounded cache with least-recently-used eviction and an optional time-to-live, counting hits
+    and misses.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = None):
+        """
+        Initializes the LruCache.
+
+        Args:
+            max_size (int): The max number of items kept. The least recently used item is evicted when exceeded.
+            ttl (float): The seconds an item stays valid after being put. Never expires if not set.
+        """
+        self.max_size: int = max_size
+        self.ttl: float = ttl
+        self.hits: int = 0
+        self.misses: int = 0
+
+        self._lock = threading.Lock()
+        # key -> (expire_time, value)
+        self._data: OrderedDict[Hashable, Tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _get(self, key: Hashable, now: float) -> Tuple[bool, Any]:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return False, None
+        if item[0] < now:
+            del self._data[key]
+            self.misses += 1
+            return False, None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return True, item[1]
+
+    def _put(self, key: Hashable, value: Any, now: float):
+        expire_time = now + self.ttl if self.ttl else float("inf")
+        self._data[key] = (expire_time, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Returns the cached value of the key, or `default` if absent or expired.
+        """
+        with self._lock:
+            found, value = self._get(key, time.time())
+        return value if found else default
+
+    def get_many(self, keys: List[Hashable]) -> Dict[Hashable, Any]:
+        """
+        Returns the cached values of the keys found, under a single lock acquisition.
+        """
+        result = {}
+        with self._lock:
+            now = time.time()
+            for key in keys:
+                found, value = self._get(key, now)
+                if found:
+                    result[key] = value
+        return result
+
+    def put(self, key: Hashable, value: Any):
+        """
+        Caches the value of the key, evicting the least recently used items if full.
+        """
+        with self._lock:
+            self._put(key, value, time.time())
+
+    def put_many(self, items: Dict[Hashable, Any]):
+        """
+        Caches several values under a single lock acquisition.
+        """
+        with self._lock:
+            now = time.time()
+            for key, value in items.items():
+                self._put(key, value, now)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the size, hit and miss counters and the hit rate of the cache.
+        """
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
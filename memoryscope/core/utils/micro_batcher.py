@@ -0,0 +1,97 @@
+import threading
+from typing import Any, Callable, List
+
+
+class _Batch(object):
+    def __init__(self):
+        self.items: List[Any] = []
+        self.results: List[Any] | None = None
+        self.error: BaseException | None = None
+        # set when the batch takes no more items, wakes the leader up early
+        self.closed = threading.Event()
+        self.done = threading.Event()
+
+
+class MicroBatcher(object):
+    """
+    Merges the concurrent calls of a batch function from different threads. The first caller of a batch becomes its
+    leader: it waits up to `max_wait` seconds for other callers to append their items, then calls the function once
+    with all items and hands each caller its own slice of the results. No background thread is involved.
+    """
+
+    def __init__(self, fn: Callable[[List[Any]], List[Any]], max_size: int = 25, max_wait: float = 0.005):
+        """
+        Initializes the MicroBatcher.
+
+        Args:
+            fn (Callable[[List[Any]], List[Any]]): The batch function, returning one result per item in order.
+            max_size (int): The max number of items of one batch. Larger calls are not merged.
+            max_wait (float): The max seconds the leader waits for other callers.
+        """
+        self.fn: Callable[[List[Any]], List[Any]] = fn
+        self.max_size: int = max_size
+        self.max_wait: float = max_wait
+        self.batch_cnt: int = 0
+        self.item_cnt: int = 0
+
+        self._lock = threading.Lock()
+        self._pending: _Batch | None = None
+
+    def submit(self, items: List[Any]) -> List[Any]:
+        """
+        Calls the batch function with the items, possibly merged with the items of concurrent callers.
+
+        Args:
+            items (List[Any]): The items of this caller.
+
+        Returns:
+            List[Any]: The results of the items of this caller, in order.
+        """
+        if not items:
+            return []
+        if len(items) >= self.max_size or self.max_wait <= 0:
+            return self._run(list(items))
+
+        with self._lock:
+            batch = self._pending
+            if batch is not None and len(batch.items) + len(items) > self.max_size:
+                # the pending batch is too full for these items, it is sent right away
+                batch.closed.set()
+                batch = None
+            is_leader = batch is None
+            if is_leader:
+                batch = _Batch()
+                self._pending = batch
+            start = len(batch.items)
+            batch.items.extend(items)
+            if len(batch.items) >= self.max_size:
+                batch.closed.set()
+            if batch.closed.is_set() and self._pending is batch:
+                self._pending = None
+
+        if is_leader:
+            batch.closed.wait(self.max_wait)
+            with self._lock:
+                batch.closed.set()
+                if self._pending is batch:
+                    self._pending = None
+            try:
+                batch.results = self._run(batch.items)
+            except BaseException as e:
+                batch.error = e
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[start: start + len(items)]
+
+    def _run(self, items: List[Any]) -> List[Any]:
+        results = self.fn(items)
+        if len(results) != len(items):
+            raise RuntimeError(f"batch function returns {len(results)} results for {len(items)} items!")
+        self.batch_cnt += 1
+        self.item_cnt += len(items)
+        return results
@@ -0,0 +1,275 @@
+import asyncio
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+from typing import Iterator, Set, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class _ReleasingStream(Iterator[T]):
+    """
+    Wraps the stream of a request acquired before, releasing it exactly once when the stream is exhausted, fails,
+    is closed or is garbage collected.
+    """
+
+    def __init__(self, stream: Iterator[T], limiter: "RateLimiter"):
+        self._stream = stream
+        self._limiter = limiter
+        self._released: bool = False
+
+    def _release(self):
+        if not self._released:
+            self._released = True
+            self._limiter.release()
+
+    def __next__(self) -> T:
+        if self._released:
+            raise StopIteration
+        try:
+            return next(self._stream)
+        except BaseException:
+            self._release()
+            raise
+
+    def close(self):
+        try:
+            close = getattr(self._stream, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self._release()
+
+    def __del__(self):
+        self._release()
+
+
+class RateLimiter(object):
+    """
+    A thread-safe limiter of the requests sent to a model provider: at most `max_concurrency` requests in flight,
+    and token buckets refilled continuously with `rpm` requests and `tpm` tokens per minute. Callers are served
+    first come, first served: a caller waits until all callers arrived before it went through. Any limit set to 0 is
+    disabled.
+    """
+
+    def __init__(self, max_concurrency: int = 0, rpm: int = 0, tpm: int = 0):
+        """
+        Initializes the RateLimiter, its buckets full.
+
+        Args:
+            max_concurrency (int): The max number of requests in flight.
+            rpm (int): The max number of requests per minute.
+            tpm (int): The max number of tokens per minute.
+        """
+        self.max_concurrency: int = max_concurrency
+        self.rpm: int = rpm
+        self.tpm: int = tpm
+
+        self._cond = threading.Condition()
+        self._in_flight: int = 0
+        self._request_bucket: float = float(rpm)
+        self._token_bucket: float = float(tpm)
+        self._refill_time: float = time.monotonic()
+        # the ticket of each caller is its arrival order, callers go through in ticket order
+        self._next_ticket: int = 0
+        self._serving_ticket: int = 0
+        # the tickets of the callers which gave up waiting, skipped when their turn comes
+        self._abandoned_tickets: Set[int] = set()
+        # the event loop and the event of each async caller waiting, set on every change of the limits
+        self._async_waiters: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_concurrency or self.rpm or self.tpm)
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._refill_time
+        self._refill_time = now
+        if self.rpm:
+            self._request_bucket = min(float(self.rpm), self._request_bucket + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._token_bucket = min(float(self.tpm), self._token_bucket + elapsed * self.tpm / 60)
+
+    def _wait_time(self, tokens: int) -> float | None:
+        """
+        Returns the seconds until the buckets hold enough for the request, 0 if it can go now, None if it has to
+        wait for a request in flight to finish.
+        """
+        if self.max_concurrency and self._in_flight >= self.max_concurrency:
+            return None
+        wait_time = 0.0
+        if self.rpm and self._request_bucket < 1:
+            wait_time = max(wait_time, (1 - self._request_bucket) * 60 / self.rpm)
+        if self.tpm and self._token_bucket < tokens:
+            wait_time = max(wait_time, (tokens - self._token_bucket) * 60 / self.tpm)
+        return wait_time
+
+    def _notify_all(self):
+        """
+        Wakes up all the sync and async callers waiting, must be called with `_cond` held.
+        """
+        self._cond.notify_all()
+        for loop, event in self._async_waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # the loop of the waiter is closed
+                pass
+
+    def _take_ticket(self) -> int:
+        with self._cond:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            return ticket
+
+    def _next_turn(self):
+        self._serving_ticket += 1
+        while self._serving_ticket in self._abandoned_tickets:
+            self._abandoned_tickets.remove(self._serving_ticket)
+            self._serving_ticket += 1
+        self._notify_all()
+
+    def _abandon_ticket(self, ticket: int):
+        """
+        Gives up the turn of a caller which stopped waiting, so that the callers behind it are not blocked.
+        """
+        with self._cond:
+            if ticket == self._serving_ticket:
+                self._next_turn()
+            elif ticket > self._serving_ticket:
+                self._abandoned_tickets.add(ticket)
+
+    def _try_acquire(self, ticket: int, tokens: int) -> float | None:
+        """
+        Takes the share of the limits of the request if it is its turn and the limits allow it, must be called with
+        `_cond` held.
+
+        Returns:
+            float | None: 0 if acquired, else the seconds to wait before trying again, None to wait for a change of
+                the limits.
+        """
+        if ticket != self._serving_ticket:
+            return None
+        self._refill()
+        wait_time = self._wait_time(tokens)
+        if wait_time != 0:
+            return wait_time
+
+        self._in_flight += 1
+        if self.rpm:
+            self._request_bucket -= 1
+        if self.tpm:
+            self._token_bucket -= tokens
+        self._next_turn()
+        return 0
+
+    def acquire(self, tokens: int = 0):
+        """
+        Blocks until the request may be sent, then takes its share of the limits.
+
+        Args:
+            tokens (int): The estimated tokens of the request, capped by `tpm` so that any request can go.
+        """
+        if not self.enabled:
+            return
+        tokens = min(tokens, self.tpm)
+
+        ticket = self._take_ticket()
+        try:
+            with self._cond:
+                while True:
+                    wait_time = self._try_acquire(ticket, tokens)
+                    if wait_time == 0:
+                        return
+                    self._cond.wait(timeout=wait_time)
+        except BaseException:
+            self._abandon_ticket(ticket)
+            raise
+
+    async def aacquire(self, tokens: int = 0):
+        """
+        Awaits until the request may be sent, see `acquire`. The caller waits on an event of its own loop, so that
+        sync and async callers share the same queue without blocking the event loop. A caller cancelled while
+        waiting gives up its turn and holds nothing.
+        """
+        if not self.enabled:
+            return
+        tokens = min(tokens, self.tpm)
+
+        ticket = self._take_ticket()
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        try:
+            while True:
+                with self._cond:
+                    waiter[1].clear()
+                    wait_time = self._try_acquire(ticket, tokens)
+                    if wait_time == 0:
+                        return
+                    self._async_waiters.add(waiter)
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), timeout=wait_time)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            self._abandon_ticket(ticket)
+            raise
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+
+    def release(self):
+        """
+        Marks a request acquired before as finished.
+        """
+        if not self.enabled:
+            return
+        with self._cond:
+            self._in_flight -= 1
+            self._notify_all()
+
+    def adjust_tokens(self, delta: int):
+        """
+        Corrects the token bucket once the actual tokens of a request are known: a positive delta (more tokens than
+        estimated) is taken from the bucket, possibly into debt, a negative one is given back.
+
+        Args:
+            delta (int): The actual tokens minus the estimated tokens.
+        """
+        if not self.tpm or not delta:
+            return
+        with self._cond:
+            self._refill()
+            self._token_bucket = min(float(self.tpm), self._token_bucket - delta)
+            self._notify_all()
+
+    def release_after(self, stream: Iterator[T]) -> Iterator[T]:
+        """
+        Keeps a request acquired before in flight while its response is streamed, and releases it once the stream
+        is exhausted or closed.
+
+        Args:
+            stream (Iterator[T]): The streamed response of the request.
+
+        Returns:
+            Iterator[T]: The same stream, releasing the request at its end.
+        """
+        if not self.enabled:
+            return stream
+        return _ReleasingStream(stream, self)
+
+    @contextmanager
+    def limit(self, tokens: int = 0):
+        self.acquire(tokens)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def alimit(self, tokens: int = 0):
+        await self.aacquire(tokens)
+        try:
+            yield
+        finally:
+            self.release()
@@ -0,0 +1,87 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class ResponseDiskCache(object):
+    """
+    A persistent LLM response cache in a SQLite file, which several processes can share. Responses are keyed by the
+    hash of the request, see `LlamaIndexGenerationModel.response_cache_key`. Once the cache holds more than `max_size`
+    responses, the least recently used ones are evicted.
+    """
+
+    def __init__(self, path: str, max_size: int = 100000, evict_ratio: float = 0.1, timeout: float = 30.0):
+        """
+        Opens or creates the cache file.
+
+        Args:
+            path (str): The SQLite file path.
+            max_size (int): The max number of responses kept.
+            evict_ratio (float): The ratio of `max_size` evicted at once when full, to amortize the eviction.
+            timeout (float): The seconds to wait for the lock held by another process.
+        """
+        self.path: str = path
+        self.max_size: int = max_size
+        self.evict_ratio: float = evict_ratio
+
+        dir_name = os.path.dirname(path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS responses ("
+                           "hash TEXT NOT NULL PRIMARY KEY, "
+                           "response TEXT NOT NULL, "
+                           "access_time REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_access_time ON responses (access_time)")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, key: str) -> str | None:
+        """
+        Returns the cached response of the key, refreshing its access time.
+
+        Args:
+            key (str): The request hash.
+
+        Returns:
+            str | None: The response text, None if not cached.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE hash = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE responses SET access_time = ? WHERE hash = ?", (time.time(), key))
+        return row[0]
+
+    def put(self, key: str, response: str):
+        """
+        Caches the response of the key, evicting the least recently used responses if full.
+
+        Args:
+            key (str): The request hash.
+            response (str): The response text.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("INSERT OR REPLACE INTO responses (hash, response, access_time) VALUES (?, ?, ?)",
+                                   (key, response, time.time()))
+                size = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+                if size > self.max_size:
+                    evict_cnt = size - self.max_size + int(self.max_size * self.evict_ratio)
+                    self._conn.execute("DELETE FROM responses WHERE rowid IN "
+                                       "(SELECT rowid FROM responses ORDER BY access_time LIMIT ?)", (evict_cnt,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,80 @@
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+
+class RetryPolicy(object):
+    """
+    Exponential backoff with full jitter: the n-th retry waits a random time in
+    [0, min(max_interval, interval * multiplier ** n)], so that clients failing together do not retry together.
+    A `Retry-After` (or `retry-after-ms`) header of the error response, e.g. of a 429, overrides the backoff.
+    """
+
+    def __init__(self,
+                 max_retries: int = 3,
+                 interval: float = 1.0,
+                 max_interval: float = 30.0,
+                 multiplier: float = 2.0,
+                 jitter: bool = True):
+        """
+        Initializes the RetryPolicy.
+
+        Args:
+            max_retries (int): The max number of attempts, the first one included.
+            interval (float): The backoff of the first retry in seconds.
+            max_interval (float): The max backoff in seconds, `Retry-After` included.
+            multiplier (float): The growth factor of the backoff between two retries.
+            jitter (bool): Randomize the backoff in [0, backoff].
+        """
+        self.max_retries: int = max(max_retries, 1)
+        self.interval: float = interval
+        self.max_interval: float = max_interval
+        self.multiplier: float = multiplier
+        self.jitter: bool = jitter
+
+    @staticmethod
+    def retry_after(error: BaseException | None) -> float | None:
+        """
+        Reads the seconds to wait from the `retry-after-ms` or `Retry-After` header of the response attached to the
+        error, as the openai and httpx errors do.
+
+        Args:
+            error (BaseException | None): The error of the failed attempt.
+
+        Returns:
+            float | None: The seconds to wait, None if the error carries no such header.
+        """
+        headers = getattr(getattr(error, "response", None), "headers", None)
+        if not headers:
+            return None
+        try:
+            value = headers.get("retry-after-ms")
+            if value is not None:
+                return float(value) / 1000
+            value = headers.get("retry-after")
+            if value is None:
+                return None
+            try:
+                return float(value)
+            except ValueError:
+                # an http date
+                return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+    def backoff(self, attempt: int, error: BaseException | None = None) -> float:
+        """
+        Returns the seconds to wait after the failed attempt.
+
+        Args:
+            attempt (int): The index of the failed attempt, from 0.
+            error (BaseException | None): The error of the failed attempt, if any.
+
+        Returns:
+            float: The seconds to wait before the next attempt.
+        """
+        retry_after = self.retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_interval)
+        backoff = min(self.max_interval, self.interval * self.multiplier ** attempt)
+        return random.uniform(0, backoff) if self.jitter else backoff
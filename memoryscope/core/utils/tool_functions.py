@@ -1,3 +1,4 @@
+import base64
 import hashlib
 import random
 import re
@@ -218,3 +219,31 @@ def cosine_similarity_matrix(query: List[List[float]]):
     return dot_product
 
 
+def vector_to_base64(vector: List[float]) -> str:
+    """
+    Encodes a vector into a compact base64 string of its float32 bytes.
+
+    Args:
+        vector (List[float]): The vector to encode.
+
+    Returns:
+        str: The base64 string, empty for an empty vector.
+    """
+    if vector is None or len(vector) == 0:
+        return ""
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def base64_to_vector(vector_str: str) -> List[float]:
+    """
+    Decodes a vector encoded by `vector_to_base64`.
+
+    Args:
+        vector_str (str): The base64 string.
+
+    Returns:
+        List[float]: The decoded vector, empty for an empty string.
+    """
+    if not vector_str:
+        return []
+    return np.frombuffer(base64.b64decode(vector_str), dtype=np.float32).tolist()
@@ -15,6 +15,8 @@ class LoadMemoryWorker(MemoryBaseWorker):
         self.retrieve_not_updated_top_k: int = kwargs.get("retrieve_not_updated_top_k", 0)
         self.retrieve_insight_top_k: int = kwargs.get("retrieve_insight_top_k", 0)
         self.retrieve_today_top_k: int = kwargs.get("retrieve_today_top_k", 0)
+        # the vectors of observations are compared with insight keys by UpdateInsightWorker
+        self.return_vectors: bool = kwargs.get("return_vectors", True)
 
     @timer
     def retrieve_not_reflected_memory(self):
@@ -32,7 +34,8 @@ class LoadMemoryWorker(MemoryBaseWorker):
             "obs_reflected": 0,
         }
         nodes: List[MemoryNode] = self.memory_store.retrieve_memories(top_k=self.retrieve_not_reflected_top_k,
-                                                                      filter_dict=filter_dict)
+                                                                      filter_dict=filter_dict,
+                                                                      return_vectors=self.return_vectors)
         self.memory_manager.set_memories(NOT_REFLECTED_NODES, nodes)
 
     @timer
@@ -51,7 +54,8 @@ class LoadMemoryWorker(MemoryBaseWorker):
             "obs_updated": 0,
         }
         nodes: List[MemoryNode] = self.memory_store.retrieve_memories(top_k=self.retrieve_not_updated_top_k,
-                                                                      filter_dict=filter_dict)
+                                                                      filter_dict=filter_dict,
+                                                                      return_vectors=self.return_vectors)
         self.memory_manager.set_memories(NOT_UPDATED_NODES, nodes)
 
     @timer
@@ -69,7 +73,8 @@ class LoadMemoryWorker(MemoryBaseWorker):
             "memory_type": MemoryTypeEnum.INSIGHT.value,
         }
         nodes: List[MemoryNode] = self.memory_store.retrieve_memories(top_k=self.retrieve_insight_top_k,
-                                                                      filter_dict=filter_dict)
+                                                                      filter_dict=filter_dict,
+                                                                      return_vectors=self.return_vectors)
         self.memory_manager.set_memories(INSIGHT_NODES, nodes)
 
     @timer
@@ -91,7 +96,8 @@ class LoadMemoryWorker(MemoryBaseWorker):
             "dt": dt,
         }
         nodes: List[MemoryNode] = self.memory_store.retrieve_memories(top_k=self.retrieve_today_top_k,
-                                                                      filter_dict=filter_dict)
+                                                                      filter_dict=filter_dict,
+                                                                      return_vectors=self.return_vectors)
 
         self.memory_manager.set_memories(TODAY_NODES, nodes)
 
@@ -47,7 +47,8 @@ class LongContraRepeatWorker(MemoryBaseWorker):
         # Retrieve memories similar to the node's content, limited by top_k and filtered by filter_dict
         retrieve_nodes = self.memory_store.retrieve_memories(query=node.content,
                                                              top_k=self.long_contra_repeat_top_k,
-                                                             filter_dict=filter_dict)
+                                                             filter_dict=filter_dict,
+                                                             return_vectors=False)
         # Filter retrieved nodes based on the similarity threshold
         return node, [n for n in retrieve_nodes if n.score_recall >= self.long_contra_repeat_threshold]
 
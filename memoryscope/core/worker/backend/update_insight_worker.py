@@ -1,4 +1,3 @@
-import time
 from typing import List
 
 from memoryscope.constants.common_constants import INSIGHT_NODES, NOT_UPDATED_NODES, NOT_REFLECTED_NODES
@@ -61,6 +60,7 @@ class UpdateInsightWorker(MemoryBaseWorker):
                     self.logger.warning(f"embedding call {insight_node.key} failed!")
                     return insight_node, filtered_nodes, max_score
 
+                # tracked as a dirty field, the memory manager persists it even if the insight is not updated
                 insight_node.key_vector = key_vector
 
             score_recall_list = cosine_similarity(insight_node.key_vector, [x.vector for x in obs_nodes])
@@ -211,9 +211,8 @@ class UpdateInsightWorker(MemoryBaseWorker):
             return
 
         # Process active insight nodes with corresponding not updated nodes
+        # the model calls of the parallel tasks are paced by the rate limiter of the model, see RateLimiter
         for node in insight_nodes:
-            if self.enable_parallel:
-                time.sleep(1)
             if node.action_status == ActionStatusEnum.NEW.value:
                 self.submit_thread_task(fn=self.filter_obs_nodes,
                                         insight_node=node,
@@ -234,8 +233,6 @@ class UpdateInsightWorker(MemoryBaseWorker):
 
         # Submit tasks to update insights for the top nodes
         for insight_node, filtered_nodes, _ in result_sorted:
-            if self.enable_parallel:
-                time.sleep(1)
             self.submit_thread_task(fn=self.update_insight,
                                     insight_node=insight_node,
                                     filtered_nodes=filtered_nodes)
@@ -1,4 +1,4 @@
-from typing import List, Dict
+from typing import Dict, Iterator, List
 
 from memoryscope.constants.common_constants import RESULT
 from memoryscope.core.utils.datetime_handler import DatetimeHandler
@@ -13,6 +13,7 @@ class UpdateMemoryWorker(MemoryBaseWorker):
     def _parse_params(self, **kwargs):
         self.method: str = kwargs.get("method", "")
         self.memory_key: str = kwargs.get("memory_key", "")
+        self.scan_page_size: int = kwargs.get("scan_page_size", 500)
 
     def from_query(self):
         """
@@ -49,18 +50,28 @@ class UpdateMemoryWorker(MemoryBaseWorker):
 
         return self.memory_manager.get_memories(keys=self.memory_key)
 
-    def delete_all(self):
+    def delete_all(self) -> Iterator[List[MemoryNode]]:
         """
-        Marks all memories for deletion by setting their action_status to 'DELETE'.
+        Scans the observations and insights of the current user and target in the memory store page by page, and
+        marks each page for deletion by setting their action_status to 'DELETE'.
 
         Returns:
-            List[MemoryNode]: A list of all MemoryNode objects marked for deletion.
+            Iterator[List[MemoryNode]]: The pages of MemoryNode objects marked for deletion.
         """
-        nodes: List[MemoryNode] = self.memory_manager.get_memories(keys="all")
-        for node in nodes:
-            node.action_status = ActionStatusEnum.DELETE.value
-        self.logger.info(f"delete_all.size={len(nodes)}")
-        return nodes
+        filter_dict = {
+            "user_name": self.user_name,
+            "target_name": self.target_name,
+            "memory_type": [MemoryTypeEnum.OBSERVATION.value,
+                            MemoryTypeEnum.OBS_CUSTOMIZED.value,
+                            MemoryTypeEnum.INSIGHT.value],
+        }
+        size = 0
+        for nodes in self.memory_store.iter_memories(filter_dict=filter_dict, page_size=self.scan_page_size):
+            for node in nodes:
+                node.action_status = ActionStatusEnum.DELETE.value
+            size += len(nodes)
+            yield nodes
+        self.logger.info(f"delete_all.size={size}")
 
     def delete_memory(self):
         """
@@ -104,16 +115,20 @@ class UpdateMemoryWorker(MemoryBaseWorker):
         Executes a memory update method provided via the 'method' attribute.
 
         The method specified by the 'method' attribute is invoked,
-        which updates memories accordingly.
+        which updates memories accordingly. A method may return a list of nodes, or yield pages of nodes which are
+        updated one page at a time.
         """
         method = self.method.strip()
         if not hasattr(self, method):
             self.logger.info(f"method={method} is missing!")
             return
 
-        updated_nodes: Dict[str, List[MemoryNode]] = self.memory_manager.update_memories(nodes=getattr(self, method)())
+        nodes = getattr(self, method)()
+        pages = [nodes] if nodes is None or isinstance(nodes, list) else nodes
         line = ["[MEMORY ACTIONS]:"]
-        for action, nodes in updated_nodes.items():
-            for node in nodes:
-                line.append(f"{action} {node.memory_type}: {node.content} ({node.store_status})")
+        for page in pages:
+            updated_nodes: Dict[str, List[MemoryNode]] = self.memory_manager.update_memories(nodes=page)
+            for action, action_nodes in updated_nodes.items():
+                for node in action_nodes:
+                    line.append(f"{action} {node.memory_type}: {node.content} ({node.store_status})")
         self.set_workflow_context(RESULT, "\n".join(line))
@@ -1,4 +1,4 @@
-from typing import List
+from typing import Iterator, List
 
 from memoryscope.constants.common_constants import RETRIEVE_MEMORY_NODES, RESULT
 from memoryscope.core.utils.datetime_handler import DatetimeHandler
@@ -14,6 +14,28 @@ class PrintMemoryWorker(MemoryBaseWorker):
     """
     FILE_PATH: str = __file__
 
+    def _parse_params(self, **kwargs):
+        # scan all memories of the memory store instead of printing the memories retrieved by the workflow
+        self.scan_store: bool = kwargs.get("scan_store", False)
+        self.scan_page_size: int = kwargs.get("scan_page_size", 500)
+
+    def _iter_memory_pages(self) -> Iterator[List[MemoryNode]]:
+        """
+        Yields the pages of memories to print, either streamed from the memory store or the retrieved ones.
+        """
+        if not self.scan_store:
+            yield self.memory_manager.get_memories(RETRIEVE_MEMORY_NODES)
+            return
+
+        filter_dict = {
+            "user_name": self.user_name,
+            "target_name": self.target_name,
+            "memory_type": [MemoryTypeEnum.OBSERVATION.value,
+                            MemoryTypeEnum.OBS_CUSTOMIZED.value,
+                            MemoryTypeEnum.INSIGHT.value],
+        }
+        yield from self.memory_store.iter_memories(filter_dict=filter_dict, page_size=self.scan_page_size)
+
     def _run(self):
         """
         Executes the primary function, it involves:
@@ -21,9 +43,12 @@ class PrintMemoryWorker(MemoryBaseWorker):
         2. Formats them by 'print_template'.
         3. Set the formatted string back into the worker's context
         """
-        # get long-term memory
-        memory_node_list: List[MemoryNode] = self.memory_manager.get_memories(RETRIEVE_MEMORY_NODES)
-        memory_node_list = sorted(memory_node_list, key=lambda x: x.timestamp, reverse=True)
+        # get long-term memory, only the printed fields of each page are kept
+        memory_list = []
+        for nodes in self._iter_memory_pages():
+            memory_list.extend((n.timestamp, n.store_status, n.memory_type, n.content, n.obs_reflected, n.obs_updated)
+                               for n in nodes if n.content)
+        memory_list = sorted(memory_list, key=lambda x: x[0], reverse=True)
 
         observation_memory_list: List[str] = []
         insight_memory_list: List[str] = []
@@ -34,28 +59,25 @@ class PrintMemoryWorker(MemoryBaseWorker):
         k = 0
         # remove duplicate content
         expired_content_set = set()
-        for node in memory_node_list:
-            if not node.content:
-                continue
-
-            dt_handler = DatetimeHandler(node.timestamp)
+        for timestamp, store_status, memory_type, content, obs_reflected, obs_updated in memory_list:
+            dt_handler = DatetimeHandler(timestamp)
             dt = dt_handler.datetime_format("%Y%m%d %H:%M:%S")
-            if StoreStatusEnum(node.store_status) is StoreStatusEnum.EXPIRED:
-                if node.content in expired_content_set:
+            if StoreStatusEnum(store_status) is StoreStatusEnum.EXPIRED:
+                if content in expired_content_set:
                     continue
                 else:
-                    expired_content_set.add(node.content)
+                    expired_content_set.add(content)
                     i += 1
-                    expired_memory_list.append(f"{dt}] {i}. {node.content}")
+                    expired_memory_list.append(f"{dt}] {i}. {content}")
 
-            elif MemoryTypeEnum(node.memory_type) in [MemoryTypeEnum.OBSERVATION, MemoryTypeEnum.OBS_CUSTOMIZED]:
+            elif MemoryTypeEnum(memory_type) in [MemoryTypeEnum.OBSERVATION, MemoryTypeEnum.OBS_CUSTOMIZED]:
                 j += 1
-                observation_memory_list.append(f"{dt}] {j}. {node.content} "
-                                               f"[status({node.obs_reflected},{node.obs_updated})")
+                observation_memory_list.append(f"{dt}] {j}. {content} "
+                                               f"[status({obs_reflected},{obs_updated})")
 
-            elif MemoryTypeEnum(node.memory_type) is MemoryTypeEnum.INSIGHT:
+            elif MemoryTypeEnum(memory_type) is MemoryTypeEnum.INSIGHT:
                 k += 1
-                insight_memory_list.append(f"{dt}] {k}. {node.content}")
+                insight_memory_list.append(f"{dt}] {k}. {content}")
 
         result: str = self.prompt_handler.print_template.format(
             user_name=self.user_name,
@@ -1,6 +1,6 @@
-from typing import List
+from typing import Any, Dict, List
 
-from memoryscope.constants.common_constants import QUERY_WITH_TS, RETRIEVE_MEMORY_NODES
+from memoryscope.constants.common_constants import QUERY_WITH_TS, QUERY_VECTOR, RETRIEVE_MEMORY_NODES
 from memoryscope.core.utils.timer import timer
 from memoryscope.core.worker.memory_base_worker import MemoryBaseWorker
 from memoryscope.enumeration.action_status_enum import ActionStatusEnum
@@ -20,115 +20,114 @@ class RetrieveMemoryWorker(MemoryBaseWorker):
         self.retrieve_obs_top_k: int = kwargs.get("retrieve_obs_top_k", 0)
         self.retrieve_ins_top_k: int = kwargs.get("retrieve_ins_top_k", 0)
         self.retrieve_expired_top_k: int = kwargs.get("retrieve_expired_top_k", 0)
+        # the vectors are only needed to rank the retrieved memories locally, without a rank model
+        self.return_vectors: bool = kwargs.get("return_vectors",
+                                               not self.memoryscope_context.meta_data["enable_ranker"])
 
-    @timer
-    def retrieve_from_observation(self, query: str) -> List[MemoryNode]:
+    @property
+    def observation_filter(self) -> Dict[str, Any]:
         """
-        Retrieves memory nodes from observation based on a query, considering active memories
-        with specific types. If the retrieval limit is not set, an empty list is returned.
-
-        Args:
-            query (str): The query string used to filter and rank the memory nodes.
-
-        Returns:
-            List[MemoryNode]: A list of MemoryNode objects that match the query criteria,
-                             sorted by their relevance. Returns an empty list if no retrieval limit is configured.
+        The filter of valid observations of the current user and target.
         """
-        if not self.retrieve_obs_top_k:
-            return []
-
-        filter_dict = {
+        return {
             "user_name": self.user_name,
             "target_name": self.target_name,
             "store_status": StoreStatusEnum.VALID.value,
             "memory_type": [MemoryTypeEnum.OBSERVATION.value, MemoryTypeEnum.OBS_CUSTOMIZED.value],
         }
-        # Retrieve memories matching the query, filtered by the specified conditions,
-        # limited to a certain number, and sorted by relevance.
-        return self.memory_store.retrieve_memories(query=query,
-                                                   top_k=self.retrieve_obs_top_k,
-                                                   filter_dict=filter_dict)
 
-    @timer
-    def retrieve_from_insight(self, query: str) -> List[MemoryNode]:
+    @property
+    def insight_filter(self) -> Dict[str, Any]:
         """
-        Retrieves memories marked as insights from the store based on a query, filtered by user, target,
-        and set to active status.
-
-        Args:
-            query (str): The search query to match against the insights.
-
-        Returns:
-            List[MemoryNode]: A list of MemoryNode objects that match the query criteria,
-                              limited by 'retrieve_ins_pf_top_k'.
-                              Returns an empty list if 'retrieve_ins_pf_top_k' is not set.
+        The filter of valid insights of the current user and target.
         """
-        if not self.retrieve_ins_top_k:
-            return []
-
-        filter_dict = {
+        return {
             "user_name": self.user_name,
             "target_name": self.target_name,
             "store_status": StoreStatusEnum.VALID.value,
             "memory_type": MemoryTypeEnum.INSIGHT.value,
         }
-        # ⭐ Retrieve insights matching the query, filtered, and limited by top_k
-        return self.memory_store.retrieve_memories(query=query,
-                                                   top_k=self.retrieve_ins_top_k,
-                                                   filter_dict=filter_dict)
+
+    @property
+    def expired_filter(self) -> Dict[str, Any]:
+        """
+        The filter of expired observations of the current user and target.
+        """
+        return {
+            "user_name": self.user_name,
+            "target_name": self.target_name,
+            "store_status": StoreStatusEnum.EXPIRED.value,
+            "memory_type": [MemoryTypeEnum.OBSERVATION.value, MemoryTypeEnum.OBS_CUSTOMIZED.value],
+        }
+
+    def embed_query(self, query: str) -> List[float] | None:
+        """
+        Embeds the query once per workflow with the embedding model of the worker, if configured. The vector is put
+        into the workflow context, so that the following workers (e.g. the local rank) do not embed it again.
+
+        Args:
+            query (str): The query.
+
+        Returns:
+            List[float] | None: The query vector, None to let the memory store embed the query itself.
+        """
+        query_vector = self.get_workflow_context(QUERY_VECTOR)
+        if query_vector is not None or not query or not self._embedding_model:
+            return query_vector
+
+        try:
+            query_vector = self.embedding_model.get_query_embedding(query)
+        except Exception as e:
+            self.logger.warning(f"get query embedding failed, left to the memory store! error={e.args}")
+            return None
+        self.set_workflow_context(QUERY_VECTOR, query_vector)
+        return query_vector
 
     @timer
-    def retrieve_expired_memory(self, query: str) -> List[MemoryNode]:
+    def retrieve_memories(self, query: str) -> List[MemoryNode]:
         """
-        Retrieves expired memories marked as observation from the store based on a query, filtered by user, target,
-        and set to active status.
+        Retrieves observations, insights and expired observations matching the query in one store call, so that
+        the query is embedded once and all searches are sent together. Sources whose top_k is not set are skipped.
 
         Args:
-            query (str): The search query to match against the memories.
+            query (str): The query string used to filter and rank the memory nodes.
 
         Returns:
-            List[MemoryNode]: A list of MemoryNode objects that match the query criteria,
-                              limited by 'retrieve_expired_top_k'.
-                              Returns an empty list if 'retrieve_expired_top_k' is not set.
+            List[MemoryNode]: The MemoryNode objects retrieved from all sources.
         """
-        if not self.retrieve_expired_top_k:
+        sub_queries = [(filter_dict, top_k) for filter_dict, top_k in [
+            (self.observation_filter, self.retrieve_obs_top_k),
+            (self.insight_filter, self.retrieve_ins_top_k),
+            (self.expired_filter, self.retrieve_expired_top_k),
+        ] if top_k]
+        if not sub_queries:
             return []
 
-        filter_dict = {
-            "user_name": self.user_name,
-            "target_name": self.target_name,
-            "store_status": StoreStatusEnum.EXPIRED.value,
-            "memory_type": [MemoryTypeEnum.OBSERVATION.value, MemoryTypeEnum.OBS_CUSTOMIZED.value],
-        }
-        return self.memory_store.retrieve_memories(query=query,
-                                                   top_k=self.retrieve_expired_top_k,
-                                                   filter_dict=filter_dict)
+        memory_node_list: List[MemoryNode] = []
+        for nodes in self.memory_store.retrieve_memories_multi(query=query,
+                                                               sub_queries=sub_queries,
+                                                               return_vectors=self.return_vectors,
+                                                               query_vector=self.embed_query(query)):
+            memory_node_list.extend(nodes)
+        return memory_node_list
 
     def _run(self):
         """
-        Executes the main retrieval for memories. It fetches the query from the context, initiates concurrent tasks
-        to retrieve memories from observations, insights, and expired sources, collects the results, sorts them by
+        Executes the main retrieval for memories. It fetches the query from the context, retrieves memories from
+        observations, insights, and expired sources in one store call, collects the results, sorts them by
         similarity score, logs the details, and finally sets the retrieved memory nodes.
 
         The method follows these steps:
         1. Retrieves the query from the worker's context.
-        2. Submits tasks to asynchronously retrieve memories from various sources.
-        3. Gathers the results from all submitted tasks.
-        4. Logs the total number of collected memory nodes.
-        5. Sorts the memory nodes based on their similarity scores in descending order.
-        6. Logs detailed information about each memory node.
-        7. Stores the processed memory nodes for further use.
+        2. Retrieves memories from various sources with one multi-search call.
+        3. Logs the total number of collected memory nodes.
+        4. Sorts the memory nodes based on their similarity scores in descending order.
+        5. Logs detailed information about each memory node.
+        6. Stores the processed memory nodes for further use.
         """
         query, _ = self.get_workflow_context(QUERY_WITH_TS)
         self.logger.info(f"retrieve memory with query={query}.")
-        self.submit_thread_task(self.retrieve_from_observation, query=query)
-        self.submit_thread_task(self.retrieve_from_insight, query=query)
-        self.submit_thread_task(self.retrieve_expired_memory, query=query)
-
-        memory_node_list: List[MemoryNode] = []
-        for result in self.gather_thread_result():
-            if result:
-                memory_node_list.extend(result)
+        memory_node_list: List[MemoryNode] = self.retrieve_memories(query)
         self.logger.info(f"memory_node_list.size={len(memory_node_list)}")
 
         if not memory_node_list:
@@ -1,6 +1,9 @@
 from typing import List, Dict
 
-from memoryscope.constants.common_constants import RETRIEVE_MEMORY_NODES, QUERY_WITH_TS, RANKED_MEMORY_NODES
+import numpy as np
+
+from memoryscope.constants.common_constants import RETRIEVE_MEMORY_NODES, QUERY_WITH_TS, RANKED_MEMORY_NODES, \
+    QUERY_VECTOR
 from memoryscope.core.worker.memory_base_worker import MemoryBaseWorker
 from memoryscope.scheme.memory_node import MemoryNode
 
@@ -11,11 +14,107 @@ class SemanticRankWorker(MemoryBaseWorker):
     removing duplicates, ranking them based on semantic relevance using a model,
     assigning scores, sorting the nodes, and storing the ranked nodes back,
     while logging relevant information.
+    Without a rank model, the nodes are ranked locally by the cosine similarity of their vectors with the query, which
+    unlike the recall scores of separate searches are comparable, optionally diversified by MMR.
     """
 
     def _parse_params(self, **kwargs):
         self.enable_ranker: bool = self.memoryscope_context.meta_data["enable_ranker"]
         self.output_memory_max_count: int = self.memoryscope_context.meta_data["output_memory_max_count"]
+        self.enable_local_rank: bool = kwargs.get("enable_local_rank", True)
+        # 1.0 ranks by relevance only, lower values trade relevance for diversity
+        self.mmr_lambda: float = kwargs.get("mmr_lambda", 1.0)
+
+    @staticmethod
+    def mmr_select(vectors: np.ndarray, scores: np.ndarray, top_k: int, mmr_lambda: float = 1.0) -> np.ndarray:
+        """
+        Selects the top_k rows by maximal marginal relevance: each pick maximizes
+        `mmr_lambda * score - (1 - mmr_lambda) * max similarity with the rows picked before`, so near-duplicates of
+        a picked row are passed over.
+
+        Args:
+            vectors (np.ndarray): The normalized vectors, of shape (n, dims).
+            scores (np.ndarray): The relevance scores, of shape (n,).
+            top_k (int): The number of rows selected.
+            mmr_lambda (float): The weight of relevance against diversity, 1.0 for relevance only.
+
+        Returns:
+            np.ndarray: The selected row indices, in order of selection.
+        """
+        top_k = min(top_k, len(scores))
+        if top_k <= 0:
+            return np.zeros(0, dtype=np.int64)
+        if mmr_lambda >= 1.0:
+            if top_k < len(scores):
+                indices = np.argpartition(-scores, top_k - 1)[:top_k]
+            else:
+                indices = np.arange(len(scores))
+            return indices[np.argsort(-scores[indices], kind="stable")]
+
+        selected: List[int] = []
+        max_sims = np.zeros(len(scores), dtype=np.float32)
+        available = np.ones(len(scores), dtype=bool)
+        for _ in range(top_k):
+            mmr_scores = np.where(available, mmr_lambda * scores - (1 - mmr_lambda) * max_sims, -np.inf)
+            idx = int(np.argmax(mmr_scores))
+            selected.append(idx)
+            available[idx] = False
+            max_sims = np.maximum(max_sims, vectors @ vectors[idx])
+        return np.asarray(selected, dtype=np.int64)
+
+    def local_rank(self,
+                   query: str,
+                   memory_node_list: List[MemoryNode],
+                   query_vector: List[float] = None) -> List[MemoryNode] | None:
+        """
+        Scores all nodes by the cosine similarity of their vectors with the query vector in one matmul, then keeps
+        the top `output_memory_max_count` nodes, see `mmr_select`. The `score_rank` is the similarity mapped to
+        [0, 1] as (1 + cos) / 2, the scale `fuse_score_threshold` is tuned on.
+
+        Args:
+            query (str): The query.
+            memory_node_list (List[MemoryNode]): The retrieved nodes, with their vectors.
+            query_vector (List[float]): The query vector computed by the retrieve worker, the query is embedded only
+                if not set.
+
+        Returns:
+            List[MemoryNode] | None: The selected nodes with their `score_rank`, None if some node has no vector or
+                the query embedding failed.
+        """
+        if not memory_node_list:
+            return []
+        if query_vector is None and not self._embedding_model:
+            self.logger.warning("embedding_model is not configured, local rank is skipped!")
+            return None
+        dims = len(memory_node_list[0].vector)
+        if not dims or any(len(n.vector) != dims for n in memory_node_list):
+            self.logger.warning("some memory nodes have no vector, local rank is skipped!")
+            return None
+
+        if query_vector is None:
+            try:
+                query_vector = self.embedding_model.get_query_embedding(query)
+            except Exception as e:
+                self.logger.warning(f"get query embedding failed, local rank is skipped! error={e.args}")
+                return None
+        query_vector = np.array(query_vector, dtype=np.float32)
+        if len(query_vector) != dims:
+            self.logger.warning(f"query vector dims={len(query_vector)} != memory vector dims={dims}!")
+            return None
+        query_vector /= max(float(np.linalg.norm(query_vector)), 1e-12)
+        vectors = np.asarray([n.vector for n in memory_node_list], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors /= norms
+
+        scores = vectors @ query_vector
+        indices = self.mmr_select(vectors, scores, self.output_memory_max_count, self.mmr_lambda)
+        selected = []
+        for idx in indices:
+            node = memory_node_list[idx]
+            node.score_rank = (1.0 + float(scores[idx])) / 2
+            selected.append(node)
+        return selected
 
     def _run(self):
         """
@@ -23,7 +122,7 @@ class SemanticRankWorker(MemoryBaseWorker):
         - Retrieves query and timestamp from context.
         - Fetches memory nodes.
         - Removes duplicate nodes.
-        - Ranks nodes semantically.
+        - Ranks nodes semantically, with the rank model or locally by cosine similarity.
         - Assigns scores to nodes.
         - Sorts nodes by score.
         - Saves the ranked nodes back with logging.
@@ -38,12 +137,7 @@ class SemanticRankWorker(MemoryBaseWorker):
             self.logger.warning("Retrieve memory nodes is empty!")
             return
 
-        if not self.enable_ranker or len(memory_node_list) <= self.output_memory_max_count:
-            for node in memory_node_list:
-                node.score_rank = node.score_recall
-            self.logger.warning("use score_recall instead of score_rank!")
-
-        else:
+        if self.enable_ranker and len(memory_node_list) > self.output_memory_max_count:
             # drop repeated
             memory_node_dict: Dict[str, MemoryNode] = {n.content.strip(): n for n in memory_node_list if
                                                        n.content.strip()}
@@ -60,6 +154,21 @@ class SemanticRankWorker(MemoryBaseWorker):
                     continue
                 memory_node_list[idx].score_rank = score
 
+        else:
+            ranked_node_list = None
+            if not self.enable_ranker and self.enable_local_rank:
+                memory_node_dict: Dict[str, MemoryNode] = {n.content.strip(): n for n in memory_node_list if
+                                                           n.content.strip()}
+                ranked_node_list = self.local_rank(query, list(memory_node_dict.values()),
+                                                   self.get_workflow_context(QUERY_VECTOR))
+
+            if ranked_node_list is not None:
+                memory_node_list = ranked_node_list
+            else:
+                for node in memory_node_list:
+                    node.score_rank = node.score_recall
+                self.logger.warning("use score_recall instead of score_rank!")
+
         # sort by score
         memory_node_list = sorted(memory_node_list, key=lambda n: n.score_rank, reverse=True)
 
@@ -185,7 +185,8 @@ class MemoryManager(object):
         - New: Embeds and inserts the memory node.
         - Modified: Directly updates the memory node.
         - Content Modified: Embeds and then updates the memory node.
-        - Active: No action required.
+        - Active: No action required, unless its key vector was just computed, then it is updated as modified,
+          so that the key vector is reused next time.
         - Expired: Updates the memory node.
 
         Args:
@@ -200,6 +201,9 @@ class MemoryManager(object):
             # Non-deleted expired memory nodes need to be changed to a modified state.
             if node.store_status == StoreStatusEnum.EXPIRED.value and node.action_status != ActionStatusEnum.DELETE:
                 node.action_status = ActionStatusEnum.MODIFIED
+            # the key vector computed for an unchanged node, e.g. by update_insight, is persisted without embedding
+            elif node.action_status == ActionStatusEnum.NONE.value and "key_vector" in node.dirty_fields:
+                node.action_status = ActionStatusEnum.MODIFIED
 
         # emb & insert new memories
         new_memories = [n for n in nodes if n.action_status == ActionStatusEnum.NEW.value]
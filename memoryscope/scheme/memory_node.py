@@ -1,8 +1,8 @@
 import datetime
-from typing import Dict, List
+from typing import Any, Dict, FrozenSet, List
 from uuid import uuid4
 
-from pydantic import Field, BaseModel
+from pydantic import Field, BaseModel, PrivateAttr
 
 
 class MemoryNode(BaseModel):
@@ -50,9 +50,32 @@ class MemoryNode(BaseModel):
 
     obs_updated: int = Field(0, description="if the observation has updated user profile or insight: 0/1")
 
+    # names of the fields assigned with a different value since the node is created or marked clean
+    _dirty_fields: FrozenSet[str] = PrivateAttr(default_factory=frozenset)
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.dt = datetime.datetime.fromtimestamp(self.timestamp).strftime("%Y%m%d")
+        self.mark_clean()
+
+    def __setattr__(self, name: str, value: Any):
+        if name in type(self).model_fields and getattr(self, name) != value:
+            # reassign a new frozenset, so that copies of the node never share the tracker
+            self._dirty_fields = self._dirty_fields | {name}
+        super().__setattr__(name, value)
+
+    @property
+    def dirty_fields(self) -> FrozenSet[str]:
+        """
+        Returns the names of the fields changed since the node is created or marked clean.
+        """
+        return self._dirty_fields
+
+    def mark_clean(self):
+        """
+        Resets the dirty field tracker, typically once the node is written to the memory store.
+        """
+        self._dirty_fields = frozenset()
 
     @property
     def node_keys(self):
@@ -0,0 +1,62 @@
+"""
+Migrates the `key_vector` of an elasticsearch index from the legacy latin1 pickle strings to base64 float32 bytes.
+The documents are partially updated, their text and embedding are untouched. Legacy values are still readable, so
+the migration can run while the index is being served.
+
+Example:
+    python migrate-key-vector.py --index_name=memory_index --es_url=http://localhost:9200
+"""
+
+import fire
+from elasticsearch import Elasticsearch
+from elasticsearch.helpers import scan, streaming_bulk
+
+from memoryscope.core.storage.llama_index_es_memory_store import LlamaIndexEsMemoryStore
+from memoryscope.core.utils.tool_functions import vector_to_base64
+
+
+def migrate(index_name: str, es_url: str = "http://localhost:9200", batch_size: int = 500, dry_run: bool = False):
+    """
+    Re-encodes every legacy `metadata.key_vector` of the index.
+
+    Args:
+        index_name (str): The elasticsearch index to migrate.
+        es_url (str): The elasticsearch url.
+        batch_size (int): The number of documents read and updated at once.
+        dry_run (bool): Only count the documents to migrate.
+    """
+    client = Elasticsearch(es_url)
+
+    def _actions():
+        for hit in scan(client, index=index_name, size=batch_size, _source=["metadata.key_vector"]):
+            key_vector_str = hit["_source"].get("metadata", {}).get("key_vector")
+            if not LlamaIndexEsMemoryStore.is_legacy_key_vector(key_vector_str):
+                continue
+            key_vector = LlamaIndexEsMemoryStore.decode_key_vector(key_vector_str)
+            yield {
+                "_op_type": "update",
+                "_index": index_name,
+                "_id": hit["_id"],
+                "doc": {"metadata": {"key_vector": vector_to_base64(key_vector)}},
+            }
+
+    if dry_run:
+        print(f"{sum(1 for _ in _actions())} documents of index={index_name} to migrate.")
+        client.close()
+        return
+
+    migrated_cnt = 0
+    failed_cnt = 0
+    for ok, item in streaming_bulk(client, _actions(), chunk_size=batch_size, raise_on_error=False):
+        if ok:
+            migrated_cnt += 1
+        else:
+            failed_cnt += 1
+            print(f"migrate failed! item={item}")
+    client.indices.refresh(index=index_name)
+    print(f"migrate {migrated_cnt} documents of index={index_name}, {failed_cnt} failed.")
+    client.close()
+
+
+if __name__ == "__main__":
+    fire.Fire(migrate)
@@ -0,0 +1,60 @@
+"""
+Prewarms the persistent embedding cache with the contents and embeddings already stored in an elasticsearch index,
+so that backfills and re-indexing runs do not embed them again.
+
+Example:
+    python prewarm-embedding-cache.py --disk_cache_path=./cache/embedding.db --index_name=memory_index \
+        --module_name=openai_embedding --model_name=text-embedding-3-small
+"""
+
+import fire
+from elasticsearch import Elasticsearch
+from elasticsearch.helpers import scan
+
+from memoryscope.core.utils.embedding_disk_cache import EmbeddingDiskCache
+
+
+def prewarm(disk_cache_path: str,
+            index_name: str,
+            module_name: str,
+            model_name: str,
+            es_url: str = "http://localhost:9200",
+            disk_cache_size: int = 1000000,
+            batch_size: int = 500):
+    """
+    Copies (content, embedding) pairs of an elasticsearch index into the persistent embedding cache.
+
+    Args:
+        disk_cache_path (str): The SQLite file of the persistent embedding cache.
+        index_name (str): The elasticsearch index to read.
+        module_name (str): The `module_name` of the embedding model which embedded the index.
+        model_name (str): The `model_name` of the embedding model which embedded the index.
+        es_url (str): The elasticsearch url.
+        disk_cache_size (int): The max number of embeddings kept in the persistent cache.
+        batch_size (int): The number of documents read and cached at once.
+    """
+    disk_cache = EmbeddingDiskCache(disk_cache_path, max_size=disk_cache_size)
+    client = Elasticsearch(es_url)
+    # same naming as LlamaIndexEmbeddingModel.disk_cache_model
+    model = f"{module_name}/{model_name}"
+
+    count = 0
+    batch = {}
+    for hit in scan(client, index=index_name, size=batch_size, _source=["content", "embedding"]):
+        source = hit["_source"]
+        if source.get("content") and source.get("embedding"):
+            batch[source["content"]] = source["embedding"]
+        if len(batch) >= batch_size:
+            disk_cache.put_many(model, batch)
+            count += len(batch)
+            batch = {}
+    disk_cache.put_many(model, batch)
+    count += len(batch)
+
+    print(f"prewarm {count} embeddings of {model} from index={index_name}, cache size={len(disk_cache)}")
+    disk_cache.close()
+    client.close()
+
+
+if __name__ == "__main__":
+    fire.Fire(prewarm)
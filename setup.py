@@ -80,4 +80,5 @@ setuptools.setup(
     packages=setuptools.find_packages(where="."),
     python_requires=">=3.10",
     install_requires=_process_requirements(),
+    extras_require={"hnsw": ["hnswlib>=0.8.0"]},
 )
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+import time
+from typing import List
+
+import numpy as np
+
+from memoryscope.core.models.llama_index_embedding_model import LlamaIndexEmbeddingModel
+from memoryscope.scheme.model_response import ModelResponse
+
+
+def bag_of_chars(text: str) -> List[float]:
+    """Embeds a text as its histogram of characters, so that texts sharing words are similar."""
+    vector = np.zeros(64, dtype=np.float32)
+    for c in text:
+        vector[ord(c) % 64] += 1
+    return vector.tolist()
+
+
+class BagOfCharsEmbeddingModel(LlamaIndexEmbeddingModel):
+    """Embeds texts and queries as character histograms, no remote call involved."""
+
+    def _call(self, model_response: ModelResponse, **kwargs):
+        model_response.raw = [bag_of_chars(t) for t in model_response.meta_data["data"]["texts"]]
+
+    def get_query_embedding(self, query: str):
+        return bag_of_chars(query)
+
+
+class LengthEmbedding(object):
+    """
+    Stands in for the llama-index backend of a LlamaIndexEmbeddingModel, set as its `_model`. Embeds a text as
+    [len(text)] after `delay` seconds and fails the first `fail_cnt` calls, recording the texts and batches sent
+    upstream, the number of calls and the max number of calls in flight.
+    """
+
+    def __init__(self, fail_cnt: int = 0, delay: float = 0.0):
+        self.fail_cnt = fail_cnt
+        self.delay = delay
+        self.call_cnt = 0
+        self.texts = []
+        self.batches = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def _enter(self):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def _exit(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        with self._lock:
+            self.call_cnt += 1
+            if self.call_cnt <= self.fail_cnt:
+                raise ConnectionError("provider is down")
+            self.texts.extend(texts)
+            self.batches.append(list(texts))
+        return [[float(len(t))] for t in texts]
+
+    def get_text_embedding_batch(self, texts):
+        self._enter()
+        try:
+            time.sleep(self.delay)
+        finally:
+            self._exit()
+        return self._embed(texts)
+
+    async def aget_text_embedding_batch(self, texts):
+        self._enter()
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self._exit()
+        return self._embed(texts)
+
+    def get_query_embedding(self, query):
+        return self.get_text_embedding_batch([query])[0]
+
+    async def aget_query_embedding(self, query):
+        return (await self.aget_text_embedding_batch([query]))[0]
@@ -0,0 +1,84 @@
+import os
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from memoryscope.core.models.llama_index_embedding_model import LlamaIndexEmbeddingModel
+from memoryscope.core.utils.embedding_disk_cache import EmbeddingDiskCache
+from memoryscope.core.utils.lru_cache import LruCache
+from tests.fake_embeddings import LengthEmbedding
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    """Tests for LruCache and the embedding cache of LlamaIndexEmbeddingModel"""
+
+    def test_lru_cache(self):
+        cache = LruCache(max_size=2, ttl=0.05)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get_many(["a", "c"]), {"a": 1, "c": 3})
+        time.sleep(0.06)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats["hits"], 3)
+        self.assertEqual(cache.stats["misses"], 2)
+
+    def test_batch_embedding_cache(self):
+        emb = LlamaIndexEmbeddingModel(module_name="dashscope_embedding", model_name="counting")
+        emb._model = LengthEmbedding()
+
+        self.assertEqual(emb.call(text="abc").embedding_results, [3.0])
+        result = emb.call(text=["a", "abc", "ab", "a"])
+        self.assertEqual(result.embedding_results, [[1.0], [3.0], [2.0], [1.0]])
+        self.assertEqual(emb._model.texts, ["abc", "a", "ab"])
+        self.assertEqual(emb.cache.stats["hits"], 1)
+
+    def test_disk_cache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "embedding.db")
+            disk_cache = EmbeddingDiskCache(path, max_size=3, evict_ratio=0)
+            disk_cache.put_many("m", {"a": [1.0, 2.0], "b": [3.0, 4.0], "c": [5.0, 6.0]})
+            self.assertEqual(disk_cache.get_many("m", ["a", "x"]), {"a": [1.0, 2.0]})
+            self.assertEqual(disk_cache.get_many("other", ["a"]), {})
+            disk_cache.put_many("m", {"d": [7.0, 8.0]})
+            self.assertEqual(len(disk_cache), 3)
+            self.assertEqual(sorted(disk_cache.get_many("m", ["a", "b", "c", "d"])), ["a", "c", "d"])
+            disk_cache.close()
+
+            # a second model instance, e.g. another process, reuses the embeddings of the first one
+            emb = LlamaIndexEmbeddingModel(module_name="dashscope_embedding", model_name="counting",
+                                           disk_cache_path=path)
+            emb._model = LengthEmbedding()
+            emb.call(text=["abc", "ab"])
+            emb.disk_cache.close()
+
+            emb = LlamaIndexEmbeddingModel(module_name="dashscope_embedding", model_name="counting",
+                                           disk_cache_path=path)
+            emb._model = LengthEmbedding()
+            self.assertEqual(emb.call(text=["ab", "abcd"]).embedding_results, [[2.0], [4.0]])
+            self.assertEqual(emb._model.texts, ["abcd"])
+            emb.disk_cache.close()
+
+    def test_micro_batch(self):
+        emb = LlamaIndexEmbeddingModel(module_name="dashscope_embedding", model_name="counting", cache_size=0,
+                                       batch_max_size=8, batch_max_wait=0.2)
+        emb._model = LengthEmbedding()
+
+        texts = ["x" * i for i in range(1, 7)] + ["x"]
+        with ThreadPoolExecutor(max_workers=len(texts)) as executor:
+            results = list(executor.map(lambda t: emb.call(text=t).embedding_results, texts))
+        self.assertEqual(results, [[float(len(t))] for t in texts])
+        # all calls are merged, the repeated text is embedded once
+        self.assertEqual(len(emb._model.batches), 1)
+        self.assertEqual(sorted(emb._model.texts), sorted(set(texts)))
+
+        # a batch never exceeds batch_max_size
+        texts = [f"text {i}" for i in range(20)]
+        with ThreadPoolExecutor(max_workers=len(texts)) as executor:
+            results = list(executor.map(lambda t: emb.call(text=t).embedding_results, texts))
+        self.assertEqual(results, [[float(len(t))] for t in texts])
+        self.assertTrue(all(len(batch) <= 8 for batch in emb._model.batches))
+        self.assertGreater(emb.text_batcher.item_cnt / emb.text_batcher.batch_cnt, 2)
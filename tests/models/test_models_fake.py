@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+from memoryscope.core.memoryscope import MemoryScope
+from memoryscope.core.models.fake_backends import FakeBackendError, FakeLatency
+from memoryscope.core.models.llama_index_embedding_model import LlamaIndexEmbeddingModel
+from memoryscope.core.models.llama_index_generation_model import LlamaIndexGenerationModel
+from memoryscope.core.models.llama_index_rank_model import LlamaIndexRankModel
+from memoryscope.enumeration.message_role_enum import MessageRoleEnum
+from memoryscope.scheme.message import Message
+
+
+class TestFakeBackends(unittest.TestCase):
+    """Tests for the fake embedding, generation and rank backends"""
+
+    def test_fake_embedding(self):
+        model = LlamaIndexEmbeddingModel(module_name="fake_embedding", model_name="fake", dimensions=16,
+                                         cache_size=0)
+        embeddings = model.call(text=["hello", "world", "hello"]).embedding_results
+        self.assertEqual(len(embeddings[0]), 16)
+        self.assertEqual(embeddings[0], embeddings[2])
+        self.assertNotEqual(embeddings[0], embeddings[1])
+        self.assertAlmostEqual(float(np.linalg.norm(embeddings[1])), 1.0)
+        self.assertEqual(model.get_query_embedding("hello"), embeddings[0])
+
+    def test_fake_rank(self):
+        model = LlamaIndexRankModel(module_name="fake_rank", model_name="fake")
+        response = model.call(query="I like green tea", documents=["coffee", "green tea", "I like green tea"])
+        self.assertLess(response.rank_scores[1], response.rank_scores[2])
+        self.assertEqual(response.rank_scores[0], 0.0)
+
+    def test_fake_generation(self):
+        model = LlamaIndexGenerationModel(module_name="fake_generation", model_name="fake")
+        response = model.call(messages=[Message(role=MessageRoleEnum.USER.value, content="hi")])
+        self.assertTrue(response.status)
+        self.assertTrue(response.message.content)
+
+    def test_fake_latency(self):
+        latency = FakeLatency(latency=0.1, latency_dist="exponential", seed=0)
+        samples = [latency.sample() for _ in range(2000)]
+        self.assertAlmostEqual(float(np.mean(samples)), 0.1, delta=0.01)
+
+        latency = FakeLatency(error_rate=1.0)
+        with self.assertRaises(FakeBackendError):
+            latency.wait("fake")
+
+        model = LlamaIndexEmbeddingModel(module_name="fake_embedding", model_name="fake", error_rate=1.0,
+                                         cache_size=0, retry_interval=0, raise_exception=False)
+        self.assertFalse(model.call(text=["hello"]).status)
+
+    def test_fake_workflow(self):
+        with open(Path(__file__).parents[2] / "memoryscope/core/config/demo_config_fake.yaml") as f:
+            config = yaml.safe_load(f)
+        for model_config in config["model"].values():
+            model_config["latency"] = 0
+        config["memory_chat"] = {"api_memory_chat": {"class": "core.chat.api_memory_chat",
+                                                     "memory_service": "memoryscope_service",
+                                                     "generation_model": "generation_model",
+                                                     "stream": False}}
+        config_path = os.path.join(tempfile.mkdtemp(), "fake_config.yaml")
+        with open(config_path, "w") as f:
+            yaml.safe_dump(config, f)
+
+        with MemoryScope(config_path=config_path) as ms:
+            memory_chat = ms.default_memory_chat
+            for query in ["I work at JD.com", "I like tea", "Is basketball healthy?", "I like tea"]:
+                memory_chat.chat_with_memory(query=query)
+            result = memory_chat.run_service_operation("consolidate_memory")
+
+        self.assertIn("i work at jd.com", result)
+        self.assertNotIn("basketball", result)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+
+from llama_index.core.base.llms.types import ChatMessage, ChatResponse
+
+from memoryscope.core.memoryscope_context import MemoryscopeContext
+from memoryscope.core.models.llama_index_generation_model import LlamaIndexGenerationModel
+from memoryscope.core.storage.dummy_monitor import DummyMonitor
+from memoryscope.scheme.message import Message
+
+
+class CountingLLM(object):
+    """Answers with the number of calls so far, so that a cached response is recognizable."""
+
+    def __init__(self):
+        self.call_cnt = 0
+
+    def chat(self, messages, **kwargs):
+        self.call_cnt += 1
+        return ChatResponse(message=ChatMessage(role="assistant", content=f"answer {self.call_cnt}"))
+
+    def stream_chat(self, messages, **kwargs):
+        self.call_cnt += 1
+        content = f"answer {self.call_cnt}"
+        yield ChatResponse(message=ChatMessage(role="assistant", content=content), delta=content)
+
+
+class RecordingMonitor(DummyMonitor):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.records = []
+
+    def add(self, key: str = None, value=None, **kwargs):
+        self.records.append((key, value))
+
+
+class TestGenerationCache(unittest.TestCase):
+    """Tests for the response cache of LlamaIndexGenerationModel"""
+
+    def setUp(self):
+        self.monitor = RecordingMonitor()
+        MemoryscopeContext().monitor = self.monitor
+
+    def tearDown(self):
+        MemoryscopeContext().monitor = None
+
+    def test_response_cache(self):
+        model = LlamaIndexGenerationModel(module_name="openai_generation", model_name="counting", temperature=0.01,
+                                          cache_size=10)
+        model._model = CountingLLM()
+        messages = [Message(role="system", content="be brief"), Message(role="user", content="hello")]
+
+        self.assertEqual(model.call(messages=messages).message.content, "answer 1")
+        self.assertEqual(model.call(messages=messages).message.content, "answer 1")
+        self.assertEqual(model.call(messages=messages, max_tokens=10).message.content, "answer 2")
+        self.assertEqual(model.call(messages=messages[1:]).message.content, "answer 3")
+        self.assertEqual(model.call(messages=messages[1:]).message.content, "answer 3")
+        self.assertEqual(model._model.call_cnt, 3)
+        self.assertEqual((model.cache_hits, model.cache_misses), (2, 3))
+        self.assertEqual(self.monitor.records[-1], ("counting.response_cache_hit_ratio", 0.4))
+
+        # streaming calls skip the cache
+        contents = [r.message.content for r in model.call(messages=messages, stream=True)]
+        self.assertEqual(contents[-1], "answer 4")
+        self.assertEqual(model.cache_misses, 3)
+
+    def test_disk_cache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "response.db")
+            model = LlamaIndexGenerationModel(module_name="openai_generation", model_name="counting",
+                                              disk_cache_path=path)
+            model._model = CountingLLM()
+            self.assertEqual(model.call(messages=[Message(role="user", content="hello")]).message.content, "answer 1")
+            model.disk_cache.close()
+
+            # another process reuses the responses of the first one
+            model = LlamaIndexGenerationModel(module_name="openai_generation", model_name="counting",
+                                              disk_cache_path=path)
+            model._model = CountingLLM()
+            self.assertEqual(model.call(messages=[Message(role="user", content="hello")]).message.content, "answer 1")
+            self.assertEqual(model._model.call_cnt, 0)
+            model.disk_cache.close()
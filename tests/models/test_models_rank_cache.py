@@ -0,0 +1,50 @@
+import unittest
+
+from memoryscope.core.models.llama_index_rank_model import LlamaIndexRankModel
+
+
+class TestRankCache(unittest.TestCase):
+    """Tests for the rank score cache of LlamaIndexRankModel"""
+
+    def setUp(self):
+        self.model = LlamaIndexRankModel(module_name="fake_rank", model_name="fake", chunk_size=2)
+        self.ranked_documents = []
+        rank_chunk = self.model._rank_chunk
+
+        def spy(query_str, nodes):
+            self.ranked_documents.extend(node.node.text for node in nodes)
+            return rank_chunk(query_str, nodes)
+
+        self.model._rank_chunk = spy
+
+    def test_cache(self):
+        documents = ["I like green tea", "black coffee", "green tea is healthy"]
+        first = self.model.call(query="green tea", documents=documents).rank_scores
+        self.assertEqual(self.ranked_documents, documents)
+
+        # same query up to case and whitespace, one document changed
+        self.ranked_documents.clear()
+        documents[1] = "black tea"
+        second = self.model.call(query="  Green   TEA ", documents=documents).rank_scores
+        self.assertEqual(self.ranked_documents, ["black tea"])
+        self.assertEqual(second[0], first[0])
+        self.assertEqual(second[2], first[2])
+        self.assertGreater(second[1], first[1])
+
+        # all cached, nothing sent upstream
+        self.ranked_documents.clear()
+        third = self.model.call(query="green tea", documents=documents[::-1]).rank_scores
+        self.assertEqual(self.ranked_documents, [])
+        self.assertEqual(third, {0: second[2], 1: second[1], 2: second[0]})
+        self.assertEqual((self.model.cache_hits, self.model.cache_misses), (5, 4))
+
+    def test_no_cache(self):
+        self.model.cache = None
+        documents = ["I like green tea", "black coffee"]
+        self.model.call(query="green tea", documents=documents)
+        self.model.call(query="green tea", documents=documents)
+        self.assertEqual(self.ranked_documents, documents * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import asyncio
+import unittest
+
+from memoryscope.core.models.llama_index_rank_model import LlamaIndexRankModel
+
+
+class TestRankChunk(unittest.TestCase):
+    """Tests for the chunked reranking of LlamaIndexRankModel"""
+
+    def setUp(self):
+        self.query = "I like green tea"
+        self.documents = [f"green tea {i}" if i % 3 == 0 else f"black coffee {i}" for i in range(1200)]
+        self.documents[7] = self.documents[6]
+
+    def check_scores(self, rank_scores: dict, chunk_size: int):
+        expected = LlamaIndexRankModel(module_name="fake_rank", model_name="fake", chunk_size=chunk_size)
+        self.assertEqual(sorted(rank_scores.keys()), list(range(len(self.documents))))
+        for idx in [0, 1, 6, 7, 999]:
+            score = expected.call(query=self.query, documents=[self.documents[idx]]).rank_scores[0]
+            self.assertAlmostEqual(rank_scores[idx], score)
+
+    def test_call(self):
+        model = LlamaIndexRankModel(module_name="fake_rank", model_name="fake", chunk_size=100, latency=0.01)
+        response = model.call(query=self.query, documents=self.documents)
+        self.assertTrue(response.status)
+        self.check_scores(response.rank_scores, 100)
+
+    def test_async_call(self):
+        model = LlamaIndexRankModel(module_name="fake_rank", model_name="fake", chunk_size=100, max_concurrency=3)
+        response = asyncio.run(model.async_call(query=self.query, documents=self.documents))
+        self.assertTrue(response.status)
+        self.check_scores(response.rank_scores, 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
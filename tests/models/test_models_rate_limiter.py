@@ -0,0 +1,124 @@
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from memoryscope.core.models.llama_index_embedding_model import LlamaIndexEmbeddingModel
+from memoryscope.core.models.llama_index_generation_model import LlamaIndexGenerationModel
+from memoryscope.core.utils.rate_limiter import RateLimiter
+from memoryscope.enumeration.message_role_enum import MessageRoleEnum
+from memoryscope.scheme.message import Message
+from tests.fake_embeddings import LengthEmbedding
+
+
+class TestRateLimiter(unittest.TestCase):
+    """Tests for RateLimiter and the rate limits of BaseModel"""
+
+    def test_rpm(self):
+        limiter = RateLimiter(rpm=600)
+        start = time.time()
+        # the first 600 requests of the full bucket go at once, then one every 0.1s
+        for _ in range(603):
+            limiter.acquire()
+            limiter.release()
+        self.assertGreater(time.time() - start, 0.25)
+
+    def test_tpm(self):
+        limiter = RateLimiter(tpm=6000)
+        limiter.acquire(tokens=6000)
+        limiter.release()
+        # the bucket is empty, 100 tokens take about 1s to refill, 50 of them given back
+        limiter.adjust_tokens(-50)
+        start = time.time()
+        limiter.acquire(tokens=100)
+        limiter.release()
+        self.assertTrue(0.3 < time.time() - start < 0.9)
+
+    def test_fifo(self):
+        limiter = RateLimiter(max_concurrency=1)
+        limiter.acquire()
+        order = []
+
+        def worker(i: int):
+            with limiter.limit():
+                order.append(i)
+
+        threads = []
+        for i in range(5):
+            thread = threading.Thread(target=worker, args=(i,))
+            thread.start()
+            threads.append(thread)
+            # let each thread take its ticket before the next one
+            time.sleep(0.02)
+        limiter.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, list(range(5)))
+
+    def test_async_cancel(self):
+        limiter = RateLimiter(max_concurrency=1)
+        limiter.acquire()
+
+        async def run():
+            # the cancelled callers give up their turn and hold no slot
+            for _ in range(3):
+                with self.assertRaises(asyncio.TimeoutError):
+                    await asyncio.wait_for(limiter.aacquire(), timeout=0.05)
+            waiter = asyncio.create_task(limiter.aacquire())
+            await asyncio.sleep(0.02)
+            self.assertFalse(waiter.done())
+            limiter.release()
+            await asyncio.wait_for(waiter, timeout=1)
+            limiter.release()
+            async with limiter.alimit():
+                self.assertEqual(limiter._in_flight, 1)
+
+        asyncio.run(run())
+        self.assertEqual(limiter._in_flight, 0)
+        self.assertEqual(limiter._async_waiters, set())
+
+    def test_model_concurrency(self):
+        model = LlamaIndexEmbeddingModel(module_name="dashscope_embedding", model_name="slow", cache_size=0,
+                                         batch_max_wait=0, max_concurrency=2)
+        model._model = LengthEmbedding(delay=0.05)
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            responses = list(executor.map(lambda i: model.call(text=[f"text_{i}"]), range(6)))
+        self.assertTrue(all(r.status for r in responses))
+        self.assertEqual(model._model.max_in_flight, 2)
+
+    def test_model_async_concurrency(self):
+        model = LlamaIndexEmbeddingModel(module_name="dashscope_embedding", model_name="slow", cache_size=0,
+                                         batch_max_wait=0, max_concurrency=2)
+        model._model = LengthEmbedding(delay=0.05)
+
+        async def run():
+            return await asyncio.gather(*[model.async_call(text=[f"text_{i}"]) for i in range(6)])
+
+        responses = asyncio.run(run())
+        self.assertTrue(all(r.status for r in responses))
+        self.assertEqual(model._model.max_in_flight, 2)
+
+    def test_model_stream(self):
+        model = LlamaIndexGenerationModel(module_name="fake_generation", model_name="fake", max_concurrency=1)
+        messages = [Message(role=MessageRoleEnum.USER.value, content="hi")]
+
+        # the slot is held until the stream is exhausted
+        stream = model.call(messages=messages, stream=True)
+        self.assertEqual(model.rate_limiter._in_flight, 1)
+        content = [response.delta for response in stream]
+        self.assertTrue(content)
+        self.assertEqual(model.rate_limiter._in_flight, 0)
+
+        # or closed by the consumer
+        stream = model.call(messages=messages, stream=True)
+        next(stream)
+        self.assertEqual(model.rate_limiter._in_flight, 1)
+        stream.close()
+        self.assertEqual(model.rate_limiter._in_flight, 0)
+        self.assertTrue(model.call(messages=messages).status)
+        self.assertEqual(model.rate_limiter._in_flight, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
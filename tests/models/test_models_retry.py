@@ -0,0 +1,132 @@
+import asyncio
+import time
+import unittest
+from types import SimpleNamespace
+
+from memoryscope.core.models.llama_index_embedding_model import LlamaIndexEmbeddingModel
+from memoryscope.core.utils.circuit_breaker import CircuitBreaker
+from memoryscope.core.utils.retry_policy import RetryPolicy
+from tests.fake_embeddings import LengthEmbedding
+
+
+def new_model(fail_cnt: int, **kwargs) -> LlamaIndexEmbeddingModel:
+    kwargs.setdefault("retry_interval", 0.05)
+    model = LlamaIndexEmbeddingModel(module_name="dashscope_embedding", model_name="flaky", cache_size=0,
+                                     batch_max_wait=0, **kwargs)
+    model._model = LengthEmbedding(fail_cnt)
+    return model
+
+
+class TestRetry(unittest.TestCase):
+    """Tests for RetryPolicy, CircuitBreaker and the retries of BaseModel"""
+
+    def test_retry_policy(self):
+        policy = RetryPolicy(interval=1.0, max_interval=5.0, jitter=False)
+        self.assertEqual([policy.backoff(i) for i in range(4)], [1.0, 2.0, 4.0, 5.0])
+        policy.jitter = True
+        self.assertTrue(all(0 <= policy.backoff(3) <= 5.0 for _ in range(20)))
+
+        error = ConnectionError()
+        error.response = SimpleNamespace(headers={"retry-after": "3"})
+        self.assertEqual(policy.backoff(0, error), 3.0)
+        error.response = SimpleNamespace(headers={"retry-after-ms": "250"})
+        self.assertEqual(policy.backoff(0, error), 0.25)
+
+    def test_circuit_breaker(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        # only one trial call while half-open
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_call(self):
+        model = new_model(fail_cnt=2)
+        self.assertEqual(model.call(text="abc").embedding_results, [3.0])
+        self.assertEqual(model._model.call_cnt, 3)
+
+        # the failed response is returned instead of None
+        model = new_model(fail_cnt=10, raise_exception=False, circuit_failure_threshold=0)
+        response = model.call(text="abc")
+        self.assertFalse(response.status)
+        self.assertEqual(model._model.call_cnt, 3)
+
+        model = new_model(fail_cnt=10)
+        with self.assertRaises(ConnectionError):
+            model.call(text="abc")
+
+    def test_circuit_open(self):
+        model = new_model(fail_cnt=100, raise_exception=False, max_retries=3, circuit_failure_threshold=2,
+                          circuit_reset_timeout=60, retry_interval=0)
+        # one failure per exhausted call, not per attempt
+        self.assertFalse(model.call(text="abc").status)
+        self.assertEqual(model._model.call_cnt, 3)
+        self.assertEqual(model.circuit_breaker.state, CircuitBreaker.CLOSED)
+        self.assertFalse(model.call(text="abc").status)
+        self.assertEqual(model._model.call_cnt, 6)
+        self.assertEqual(model.circuit_breaker.state, CircuitBreaker.OPEN)
+        # fail fast, the provider is not called
+        response = model.call(text="abc")
+        self.assertFalse(response.status)
+        self.assertIn("circuit", response.details)
+        self.assertEqual(model._model.call_cnt, 6)
+
+    def test_query_embedding(self):
+        model = new_model(fail_cnt=2, retry_interval=0, circuit_failure_threshold=1, circuit_reset_timeout=60)
+        self.assertEqual(model.get_query_embedding("abc"), [3.0])
+        self.assertEqual(model._model.call_cnt, 3)
+
+        model._model.fail_cnt = 100
+        with self.assertRaises(ConnectionError):
+            asyncio.run(model.aget_query_embedding("abcd"))
+        self.assertEqual(model._model.call_cnt, 6)
+        self.assertEqual(model.circuit_breaker.state, CircuitBreaker.OPEN)
+        # fail fast, the provider is not called
+        with self.assertRaises(RuntimeError):
+            model.get_query_embedding("abcde")
+        self.assertEqual(model._model.call_cnt, 6)
+
+    def test_cancel_trial(self):
+        model = new_model(fail_cnt=1, raise_exception=False, max_retries=1, circuit_failure_threshold=1,
+                          circuit_reset_timeout=0.05)
+        self.assertFalse(model.call(text="abc").status)
+        self.assertEqual(model.circuit_breaker.state, CircuitBreaker.OPEN)
+        time.sleep(0.06)
+
+        # the half-open trial call is cancelled without an outcome, the next call is the new trial
+        model._model.delay = 1.0
+        for trial in [lambda: model.async_call(text="abc"), lambda: model.aget_query_embedding("abc")]:
+            with self.assertRaises(asyncio.TimeoutError):
+                asyncio.run(asyncio.wait_for(trial(), timeout=0.05))
+            self.assertEqual(model.circuit_breaker.state, CircuitBreaker.OPEN)
+            self.assertTrue(model.circuit_breaker.allow())
+            model.circuit_breaker.abort_trial()
+
+        model._model.delay = 0.0
+        self.assertEqual(asyncio.run(model.async_call(text="abc")).embedding_results, [3.0])
+        self.assertEqual(model.circuit_breaker.state, CircuitBreaker.CLOSED)
+
+    def test_async_call_does_not_block(self):
+        model = new_model(fail_cnt=2, retry_interval=0.2)
+        model.retry_policy.jitter = False
+
+        async def _run():
+            ticks = []
+
+            async def _tick():
+                for _ in range(10):
+                    ticks.append(time.time())
+                    await asyncio.sleep(0.03)
+
+            response, _ = await asyncio.gather(model.async_call(text="abc"), _tick())
+            return response, ticks
+
+        response, ticks = asyncio.run(_run())
+        self.assertEqual(response.embedding_results, [3.0])
+        self.assertLess(max(b - a for a, b in zip(ticks, ticks[1:])), 0.15)
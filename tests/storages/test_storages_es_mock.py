@@ -0,0 +1,340 @@
+import asyncio
+import unittest
+from typing import Any, Dict, Tuple
+from unittest import mock
+
+from elasticsearch import NotFoundError
+
+from memoryscope.core.memoryscope_context import MemoryscopeContext
+from memoryscope.core.models.llama_index_embedding_model import LlamaIndexEmbeddingModel
+from memoryscope.core.storage import llama_index_sync_elasticsearch
+from memoryscope.core.storage.llama_index_es_memory_store import LlamaIndexEsMemoryStore
+from memoryscope.core.storage.llama_index_sync_elasticsearch import _to_elasticsearch_filter
+from memoryscope.core.utils.tool_functions import md5_hash
+from memoryscope.scheme.memory_node import MemoryNode
+
+
+class TestMockedElasticsearchStore(unittest.TestCase):
+    """Tests for the requests LlamaIndexEsMemoryStore sends to a mocked elasticsearch client"""
+
+    def setUp(self):
+        # the bulk requests are recorded by a fake `streaming_bulk`, the other requests by the mocked client
+        self.bulk_calls = []
+        # the (op type, id) -> status of the bulk items, 200 if not set
+        self.bulk_status: Dict[Tuple[str, str], int] = {}
+        for name, kwargs in [("get_memoryscope_context", {"return_value": MemoryscopeContext()}),
+                             ("streaming_bulk", {"side_effect": self._streaming_bulk})]:
+            patcher = mock.patch.object(llama_index_sync_elasticsearch, name, **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.client = mock.MagicMock()
+        # the vector store of elasticsearch uses a copy of the client with its user agent
+        self.client.options.return_value = self.client
+        self.client.indices.exists.return_value = False
+        self.emb = LlamaIndexEmbeddingModel(module_name="fake_embedding", model_name="fake", dimensions=8,
+                                            cache_size=0)
+
+    def _streaming_bulk(self, client, actions, raise_on_error: bool = True, yield_ok: bool = True, **kwargs):
+        actions = list(actions)
+        self.bulk_calls.append((actions, kwargs))
+        for action in actions:
+            status = self.bulk_status.get((action["_op_type"], action["_id"]), 200)
+            ok = status < 300
+            if ok and not yield_ok:
+                continue
+            item = {action["_op_type"]: {"_index": action["_index"], "_id": action["_id"], "status": status}}
+            if not ok and raise_on_error:
+                raise RuntimeError(f"bulk item failed! item={item}")
+            yield ok, item
+
+    def new_store(self, **kwargs) -> LlamaIndexEsMemoryStore:
+        store = LlamaIndexEsMemoryStore(embedding_model=self.emb,
+                                        index_name="memory",
+                                        es_url=None,
+                                        es_client=self.client,
+                                        create_index=False,
+                                        **kwargs)
+        self.assertIs(store.es_store.client, self.client)
+        return store
+
+    @staticmethod
+    def new_node(memory_id: str, user_name: str = "u1", target_name: str = "t1", **kwargs) -> MemoryNode:
+        return MemoryNode(memory_id=memory_id, user_name=user_name, target_name=target_name,
+                          content=f"the content of {memory_id}", memory_type="observation", **kwargs)
+
+    def new_hit(self, store: LlamaIndexEsMemoryStore, node: MemoryNode, score: float = 1.0) -> Dict[str, Any]:
+        node.vector = self.emb.get_query_embedding(node.content)
+        action = store.es_store._index_action(store._memory_node_2_text_node(node))
+        return {"_id": node.memory_id, "_score": score,
+                "_source": {key: action[key] for key in ["content", "embedding", "metadata"]}}
+
+    def test_bulk_add(self):
+        store = self.new_store()
+        nodes = [self.new_node("a"), self.new_node("b", user_name="u2")]
+        store.batch_insert(nodes)
+
+        self.assertEqual(len(self.bulk_calls), 1)
+        actions, _ = self.bulk_calls[0]
+        self.assertEqual([(a["_op_type"], a["_index"], a["_id"]) for a in actions],
+                         [("index", "memory", "a"), ("index", "memory", "b")])
+        for action, node in zip(actions, nodes):
+            self.assertNotIn("_routing", action)
+            self.assertEqual(action["content"], node.content)
+            self.assertEqual(action["embedding"], self.emb.get_query_embedding(node.content))
+            self.assertEqual(action["metadata"]["memory_id"], node.memory_id)
+            self.assertEqual(action["metadata"]["user_name"], node.user_name)
+        self.client.indices.create.assert_called_once()
+        self.assertEqual(self.client.indices.create.call_args.kwargs["index"], "memory")
+        self.client.indices.refresh.assert_called_once_with(index="memory")
+
+    def test_bulk_delete(self):
+        store = self.new_store()
+        self.bulk_status = {("delete", "missing"): 404, ("delete", "broken"): 500}
+        errors = store.es_store.batch_delete(["a", "missing", "broken"], chunk_size=2)
+
+        actions, kwargs = self.bulk_calls[0]
+        self.assertEqual(actions, [{"_op_type": "delete", "_index": "memory", "_id": _id}
+                                   for _id in ["a", "missing", "broken"]])
+        self.assertEqual(kwargs, {"chunk_size": 2})
+        # ids not found are not considered failed
+        self.assertEqual([e["delete"]["_id"] for e in errors], ["broken"])
+        self.client.indices.refresh.assert_called_once_with(index="memory", ignore_unavailable=True)
+        self.client.delete_by_query.assert_not_called()
+
+    def test_batch_update_metadata(self):
+        store = self.new_store()
+        node = self.new_node("a", meta_data={"k": "v"})
+        node.obs_reflected = 1
+        store.batch_update([node], update_embedding=False)
+
+        self.assertEqual(len(self.bulk_calls), 1)
+        actions, kwargs = self.bulk_calls[0]
+        self.assertEqual(actions, [{
+            "_op_type": "update",
+            "_index": "memory",
+            "_id": "a",
+            "script": {"source": llama_index_sync_elasticsearch.UPDATE_METADATA_SCRIPT,
+                       "lang": "painless",
+                       # only the changed fields, `meta_data` being possibly changed in place
+                       "params": {"metadata": {"obs_reflected": 1, "meta_data": {"k": "v"}}}},
+        }])
+        self.assertEqual(kwargs, {"chunk_size": store.delete_chunk_size})
+        self.client.indices.refresh.assert_called_once_with(index="memory", ignore_unavailable=True)
+        self.assertEqual(node.dirty_fields, set())
+
+    def test_batch_update_metadata_missing(self):
+        store = self.new_store()
+        nodes = [self.new_node("a"), self.new_node("missing")]
+        for node in nodes:
+            node.obs_reflected = 1
+        self.bulk_status = {("update", "missing"): 404}
+        store.batch_update(nodes, update_embedding=False)
+
+        # the partial update of the missing node fails, it is reinserted as a whole
+        self.assertEqual([[(a["_op_type"], a["_id"]) for a in actions] for actions, _ in self.bulk_calls],
+                         [[("update", "a"), ("update", "missing")], [("delete", "missing")], [("index", "missing")]])
+        action = self.bulk_calls[2][0][0]
+        self.assertEqual(action["content"], nodes[1].content)
+        self.assertEqual(action["metadata"]["obs_reflected"], 1)
+        self.assertEqual(len(action["embedding"]), 8)
+        self.assertEqual([n.dirty_fields for n in nodes], [set(), set()])
+
+    def test_update_without_vectors(self):
+        store = self.new_store()
+        hits = [self.new_hit(store, self.new_node(memory_id)) for memory_id in "ab"]
+        for hit in hits:
+            hit["_source"].pop("embedding")
+        self.client.search.return_value = {"hits": {"hits": hits}}
+        nodes = store.retrieve_memories(filter_dict={"memory_id": ["a", "b"]}, return_vectors=False)
+        self.assertNotIn("embedding", self.client.search.call_args.kwargs["source_includes"])
+        self.assertEqual([(n.vector, n.dirty_fields) for n in nodes], [([], set()), ([], set())])
+
+        # neither the changed node nor the unchanged one send their empty vector or their content
+        nodes[0].obs_reflected = 1
+        store.batch_update(nodes, update_embedding=False)
+        self.assertEqual(len(self.bulk_calls), 1)
+        actions, _ = self.bulk_calls[0]
+        self.assertEqual([a["_op_type"] for a in actions], ["update", "update"])
+        self.assertEqual(actions[0]["script"]["params"]["metadata"], {"obs_reflected": 1, "meta_data": {}})
+        metadata = actions[1]["script"]["params"]["metadata"]
+        self.assertEqual(metadata["memory_id"], "b")
+        self.assertFalse({"content", "vector", "embedding", "_node_content"} & set(metadata))
+
+        # updated with its embedding, the content loaded from the store is embedded again
+        store.batch_update(nodes[:1], update_embedding=True)
+        actions = [action for actions, _ in self.bulk_calls[1:] for action in actions]
+        self.assertEqual([a["_op_type"] for a in actions], ["delete", "index"])
+        self.assertEqual(actions[1]["content"], "the content of a")
+        self.assertEqual(actions[1]["embedding"], self.emb.get_query_embedding("the content of a"))
+
+    def test_multi_query(self):
+        store = self.new_store(routing=True)
+        query_vector = self.emb.get_query_embedding("apples")
+        self.client.msearch.return_value = {"responses": [
+            {"hits": {"hits": [self.new_hit(store, self.new_node("a"), 0.9)]}},
+            {"error": {"type": "index_not_found_exception"}},
+        ]}
+        sub_queries = [({"user_name": "u1", "target_name": "t1", "memory_type": "observation"}, 3),
+                       ({"memory_type": "insight"}, 0),
+                       ({"user_name": "u1"}, 2)]
+        with mock.patch.object(self.emb, "get_query_embedding") as get_query_embedding:
+            nodes_list = store.retrieve_memories_multi("apples", sub_queries, query_vector=query_vector)
+        get_query_embedding.assert_not_called()
+
+        # one `_msearch` with a header and a body per sub query, the empty sub query is not sent
+        searches = self.client.msearch.call_args.kwargs["searches"]
+        self.assertEqual(searches[0::2], [{"index": "memory", "routing": "u1/t1"}, {"index": "memory"}])
+        for body, (filter_dict, top_k) in zip(searches[1::2], [sub_queries[0], sub_queries[2]]):
+            self.assertEqual(body["size"], top_k)
+            self.assertEqual(body["knn"]["k"], top_k)
+            self.assertEqual(body["knn"]["query_vector"], query_vector)
+            self.assertEqual(body["knn"]["filter"], _to_elasticsearch_filter(filter_dict))
+            self.assertEqual(body["_source"], {"includes": ["embedding", "metadata", "content"]})
+        self.assertEqual([[n.memory_id for n in nodes] for nodes in nodes_list], [["a"], [], []])
+        self.assertEqual(nodes_list[0][0].score_recall, 0.9)
+        self.client.search.assert_not_called()
+
+        # the index found missing is not asked again
+        self.assertFalse(store.es_store.index_exists)
+        self.client.indices.exists.assert_not_called()
+
+    def test_missing_index(self):
+        store = self.new_store()
+        self.client.search.side_effect = NotFoundError("index_not_found_exception", mock.MagicMock(status=404), {})
+        self.assertEqual(store.retrieve_memories(query="apples", top_k=3), [])
+        self.assertEqual(store.retrieve_memories(top_k=3), [])
+        self.assertEqual(self.client.search.call_count, 2)
+        self.assertFalse(store.es_store.index_exists)
+        self.client.indices.exists.assert_not_called()
+
+        # an insert creates the index once
+        self.client.search.side_effect = None
+        store.batch_insert([self.new_node("a")])
+        self.assertTrue(store.es_store.index_exists)
+        self.client.indices.create.assert_called_once()
+        self.client.indices.exists.assert_not_called()
+
+    def test_scan_past_max_result_window(self):
+        store = self.new_store(routing=True)
+        store.es_store.max_result_window = 2
+        hits = [self.new_hit(store, self.new_node(memory_id)) for memory_id in "abcde"]
+        for i, hit in enumerate(hits):
+            hit["sort"] = [i]
+        self.client.open_point_in_time.return_value = {"id": "pit_0"}
+        self.client.search.side_effect = [{"pit_id": f"pit_{i + 1}", "hits": {"hits": hits[i * 2: i * 2 + 2]}}
+                                          for i in range(3)]
+        filter_dict = {"user_name": "u1", "target_name": "t1"}
+        nodes = store.retrieve_memories(filter_dict=filter_dict, top_k=5, return_vectors=False)
+        self.assertEqual([n.memory_id for n in nodes], list("abcde"))
+
+        # one point in time on the routed index, then pages of `max_result_window` after the last sort value
+        self.client.open_point_in_time.assert_called_once_with(index="memory", keep_alive="1m", routing="u1/t1")
+        calls = self.client.search.call_args_list
+        self.assertEqual([c.kwargs["pit"]["id"] for c in calls], ["pit_0", "pit_1", "pit_2"])
+        self.assertEqual([c.kwargs["search_after"] for c in calls], [None, [1], [3]])
+        for c in calls:
+            # the index and routing of a point in time search come from the point in time
+            self.assertNotIn("index", c.kwargs)
+            self.assertNotIn("routing", c.kwargs)
+            self.assertEqual(c.kwargs["size"], 2)
+            self.assertEqual(c.kwargs["sort"], [{"_shard_doc": "asc"}])
+            self.assertEqual(c.kwargs["query"], {"bool": {"filter": _to_elasticsearch_filter(filter_dict)}})
+            self.assertEqual(c.kwargs["source_includes"], ["metadata", "content"])
+        self.client.close_point_in_time.assert_called_once_with(id="pit_3")
+
+    def test_async(self):
+        async_bulk_calls = []
+
+        async def async_streaming_bulk(client, actions, **kwargs):
+            async_bulk_calls.append((client, list(actions), kwargs))
+            for action in async_bulk_calls[-1][1]:
+                yield True, {action["_op_type"]: {"_id": action["_id"], "status": 200}}
+
+        store = self.new_store(routing=True)
+        async_client = mock.AsyncMock()
+        store.es_store._async_client = async_client
+        node = self.new_node("a")
+        async_client.search.return_value = {"hits": {"hits": [self.new_hit(store, node, 0.9)]}}
+        node.vector = []
+
+        async def _run():
+            with mock.patch.object(llama_index_sync_elasticsearch, "async_streaming_bulk", async_streaming_bulk):
+                await store.a_batch_insert([node])
+                return await store.a_retrieve_memories(query="apples", filter_dict={"user_name": "u1",
+                                                                                    "target_name": "t1"})
+
+        nodes = asyncio.run(_run())
+        self.assertEqual([n.memory_id for n in nodes], ["a"])
+
+        # the documents and the searches go through the asynchronous client only
+        client, actions, _ = async_bulk_calls[0]
+        self.assertIs(client, async_client)
+        self.assertEqual([(a["_op_type"], a["_index"], a["_id"], a["_routing"]) for a in actions],
+                         [("index", "memory", "a", "u1/t1")])
+        self.assertEqual(actions[0]["embedding"], self.emb.get_query_embedding(node.content))
+        async_client.indices.refresh.assert_awaited_once_with(index="memory")
+        search_kwargs = async_client.search.call_args.kwargs
+        self.assertEqual((search_kwargs["index"], search_kwargs["routing"]), ("memory", "u1/t1"))
+        self.assertEqual(search_kwargs["knn"]["query_vector"], self.emb.get_query_embedding("apples"))
+        self.assertEqual(self.bulk_calls, [])
+        self.client.search.assert_not_called()
+
+    def test_route_buckets(self):
+        store = self.new_store(routing=True, index_name_template="{index_name}_{bucket}", index_buckets=4)
+        es_store = store.es_store
+        self.assertEqual(es_store.bucket_indices(), [f"memory_{i}" for i in range(4)])
+        store.create_index()
+        self.assertEqual([c.kwargs["index"] for c in self.client.indices.create.call_args_list],
+                         es_store.bucket_indices())
+
+        def bucket_index(tenant_key: str) -> str:
+            return f"memory_{int(md5_hash(tenant_key)[:8], 16) % 4}"
+
+        self.assertEqual(es_store.route({"user_name": "u1", "target_name": ["t1"]}), (bucket_index("u1/t1"), "u1/t1"))
+        # a query not pinning all the tenant fields searches all the buckets without routing
+        self.assertEqual(es_store.route({"user_name": "u1"}), ("memory_*", None))
+        self.assertEqual(es_store.route({"user_name": "u1", "target_name": ["t1", "t2"]}), ("memory_*", None))
+
+        nodes = [self.new_node("a"), self.new_node("b", user_name="u2", target_name="t2")]
+        store.batch_insert(nodes)
+        actions, _ = self.bulk_calls[0]
+        self.assertEqual([(a["_index"], a["_routing"]) for a in actions],
+                         [(bucket_index("u1/t1"), "u1/t1"), (bucket_index("u2/t2"), "u2/t2")])
+        self.client.indices.refresh.assert_called_once_with(
+            index=",".join(dict.fromkeys([bucket_index("u1/t1"), bucket_index("u2/t2")])))
+
+        store.batch_delete(nodes[1:])
+        actions, _ = self.bulk_calls[1]
+        self.assertEqual(actions, [{"_op_type": "delete", "_index": bucket_index("u2/t2"), "_id": "b",
+                                    "_routing": "u2/t2"}])
+
+        self.client.search.return_value = {"hits": {"hits": []}}
+        store.retrieve_memories(query="apples", filter_dict={"user_name": "u1", "target_name": "t1"})
+        store.retrieve_memories(filter_dict={"user_name": "u1"})
+        self.assertEqual([(c.kwargs["index"], c.kwargs["routing"]) for c in self.client.search.call_args_list],
+                         [(bucket_index("u1/t1"), "u1/t1"), ("memory_*", None)])
+
+    def test_route_tenant_indices(self):
+        store = self.new_store(index_name_template="{index_name}_{user_name}")
+        es_store = store.es_store
+        # the indices of the tenants are created on their first insert
+        self.assertEqual(es_store.bucket_indices(), [])
+        # index names are lowercase, without any of \/*?"<>| ,#:
+        self.assertEqual(es_store.route({"user_name": "Bob Smith/#1", "target_name": "t1"}),
+                         ("memory_bob_smith__1", None))
+        self.assertEqual(es_store.route({"user_name": "Bob"}), ("memory_bob", None))
+        self.assertEqual(es_store.route({"target_name": "t1"}), ("memory_*", None))
+        self.assertEqual(es_store.index_pattern, "memory_*")
+
+        store.batch_insert([self.new_node("a", user_name="Alice"), self.new_node("b", user_name="Bob")])
+        actions, _ = self.bulk_calls[0]
+        self.assertEqual([(a["_index"], "_routing" in a) for a in actions],
+                         [("memory_alice", False), ("memory_bob", False)])
+        self.assertEqual([c.kwargs["index"] for c in self.client.indices.create.call_args_list],
+                         ["memory_alice", "memory_bob"])
+        self.client.indices.refresh.assert_called_once_with(index="memory_alice,memory_bob")
+
+
+if __name__ == "__main__":
+    unittest.main()
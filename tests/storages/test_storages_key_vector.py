@@ -0,0 +1,25 @@
+import pickle
+import unittest
+
+from memoryscope.core.storage.llama_index_es_memory_store import LlamaIndexEsMemoryStore
+from memoryscope.core.utils.tool_functions import vector_to_base64, base64_to_vector
+from memoryscope.scheme.memory_node import MemoryNode
+
+
+class TestKeyVectorEncoding(unittest.TestCase):
+    """Tests for the key_vector encoding of LlamaIndexEsMemoryStore"""
+
+    def test_base64_roundtrip(self):
+        self.assertEqual(base64_to_vector(vector_to_base64([0.5, -0.25, 1.0])), [0.5, -0.25, 1.0])
+        self.assertEqual(vector_to_base64([]), "")
+        self.assertEqual(base64_to_vector(""), [])
+
+    def test_decode_key_vector(self):
+        node = MemoryNode(key="hobby", key_vector=[0.5, 0.25])
+        metadata = LlamaIndexEsMemoryStore._memory_node_2_metadata(node)
+        self.assertFalse(LlamaIndexEsMemoryStore.is_legacy_key_vector(metadata["key_vector"]))
+        self.assertEqual(LlamaIndexEsMemoryStore.decode_key_vector(metadata["key_vector"]), [0.5, 0.25])
+
+        legacy = pickle.dumps([0.5, 0.25]).decode("latin1")
+        self.assertTrue(LlamaIndexEsMemoryStore.is_legacy_key_vector(legacy))
+        self.assertEqual(LlamaIndexEsMemoryStore.decode_key_vector(legacy), [0.5, 0.25])
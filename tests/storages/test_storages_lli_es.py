@@ -1,3 +1,4 @@
+import socket
 import unittest
 
 from memoryscope.core.models.llama_index_embedding_model import LlamaIndexEmbeddingModel
@@ -5,6 +6,15 @@ from memoryscope.core.storage.llama_index_es_memory_store import LlamaIndexEsMem
 from memoryscope.scheme.memory_node import MemoryNode
 
 
+def es_reachable(host: str = "localhost", port: int = 9200) -> bool:
+    try:
+        with socket.create_connection((host, port), timeout=1):
+            return True
+    except OSError:
+        return False
+
+
+@unittest.skipUnless(es_reachable(), "elasticsearch is not reachable at localhost:9200")
 class TestLlamaIndexElasticSearchStore(unittest.TestCase):
     """Tests for LLIEmbedding"""
 
@@ -1,3 +1,5 @@
+import asyncio
+import socket
 import unittest
 
 from memoryscope.core.models.llama_index_embedding_model import LlamaIndexEmbeddingModel
@@ -5,6 +7,15 @@ from memoryscope.core.storage.llama_index_es_memory_store import LlamaIndexEsMem
 from memoryscope.scheme.memory_node import MemoryNode
 
 
+def es_reachable(host: str = "localhost", port: int = 9200) -> bool:
+    try:
+        with socket.create_connection((host, port), timeout=1):
+            return True
+    except OSError:
+        return False
+
+
+@unittest.skipUnless(es_reachable(), "elasticsearch is not reachable at localhost:9200")
 class TestLlamaIndexElasticSearchStore(unittest.TestCase):
     """Tests for LLIEmbedding"""
 
@@ -173,16 +184,96 @@ class TestLlamaIndexElasticSearchStore(unittest.TestCase):
         }
 
         res = self.es_store.retrieve_memories(query="hacker", filter_dict=filter_dict, top_k=15)
-        print(len(res))
-        print(res)
+        self.assertEqual([n.memory_id for n in res], ["kkk234"])
 
     def test_retrieve_wo_query(self, ):
         filter_dict = {
             "memory_id": "bbb456",
         }
         res = self.es_store.retrieve_memories(filter_dict=filter_dict, top_k=15)
-        print(len(res))
-        print(res)
+        self.assertEqual([n.memory_id for n in res], ["bbb456"])
+        self.assertEqual(res[0].meta_data, {"1": "1"})
+
+    def test_batch_delete(self):
+        self.es_store.batch_delete(self.data[:3] + [MemoryNode(memory_id="not_exist")])
+        res = self.es_store.retrieve_memories(filter_dict={"memory_id": ["aaa123", "bbb456", "ccc789"]}, top_k=15)
+        self.assertEqual(len(res), 0)
+
+    def test_batch_update_metadata(self):
+        node = self.es_store.retrieve_memories(filter_dict={"memory_id": "bbb456"}, top_k=1)[0]
+        vector = node.vector
+        node.obs_reflected = 1
+        self.assertEqual(node.dirty_fields, {"obs_reflected"})
+        self.es_store.batch_update([node], update_embedding=False)
+        self.assertEqual(node.dirty_fields, set())
+
+        res = self.es_store.retrieve_memories(query="Joker", filter_dict={"obs_reflected": 1}, top_k=15)
+        self.assertEqual([n.memory_id for n in res], ["bbb456"])
+        self.assertEqual(res[0].obs_reflected, 1)
+        self.assertEqual(res[0].vector, vector)
+
+    def test_batch_update_metadata_remove_key(self):
+        node = self.es_store.retrieve_memories(filter_dict={"memory_id": "bbb456"}, top_k=1)[0]
+        self.assertEqual(node.meta_data, {"1": "1"})
+        # changed in place, the removed key must not survive the update
+        node.meta_data.pop("1")
+        node.meta_data["3"] = "3"
+        node.obs_reflected = 1
+        self.es_store.batch_update([node], update_embedding=False)
+
+        res = self.es_store.retrieve_memories(filter_dict={"memory_id": "bbb456"}, top_k=1)
+        self.assertEqual(res[0].meta_data, {"3": "3"})
+        self.assertEqual(res[0].obs_reflected, 1)
+
+    def test_async(self):
+        async def _run():
+            node = MemoryNode(memory_id="async_001", content="An async hacker in Gotham", memory_type="observation")
+            await self.es_store.a_batch_insert([node])
+            res = await self.es_store.a_retrieve_memories(query="hacker", filter_dict={"memory_id": "async_001"})
+            self.assertEqual([n.memory_id for n in res], ["async_001"])
+            await self.es_store.a_batch_delete([node])
+            res = await self.es_store.a_retrieve_memories(filter_dict={"memory_id": "async_001"})
+            self.assertEqual(res, [])
+            await self.es_store.es_store.aclose()
+
+        asyncio.run(_run())
+
+    def test_missing_index(self):
+        store = LlamaIndexEsMemoryStore(embedding_model=self.es_store.embedding_model,
+                                        index_name="missing_index_0708",
+                                        es_url="http://localhost:9200",
+                                        create_index=False)
+        self.assertEqual(store.retrieve_memories(query="hacker", top_k=3), [])
+        self.assertEqual(store.retrieve_memories(top_k=3), [])
+        self.assertEqual(list(store.iter_memories()), [])
+        self.assertFalse(store.es_store.index_exists)
+        store.close()
+
+    def test_routing(self):
+        store = LlamaIndexEsMemoryStore(embedding_model=self.es_store.embedding_model,
+                                        index_name="routing_0708",
+                                        es_url="http://localhost:9200",
+                                        routing=True,
+                                        index_name_template="{index_name}_{bucket}",
+                                        index_buckets=2)
+        es_store = store.es_store
+        self.assertEqual(es_store.bucket_indices(), ["routing_0708_0", "routing_0708_1"])
+        index, routing = es_store.route({"user_name": "u1", "target_name": ["t1"]})
+        self.assertIn(index, es_store.bucket_indices())
+        self.assertEqual(routing, "u1/t1")
+        self.assertEqual(es_store.route({"user_name": "u1"}), ("routing_0708_*", None))
+
+        node = MemoryNode(memory_id="route_001", user_name="u1", target_name="t1", content="A routed hacker",
+                          memory_type="observation")
+        store.batch_insert([node])
+        filter_dict = {"user_name": "u1", "target_name": "t1"}
+        res = store.retrieve_memories(query="hacker", filter_dict=filter_dict)
+        self.assertEqual([n.memory_id for n in res], ["route_001"])
+        self.assertEqual([n.memory_id for n in store.retrieve_memories(filter_dict={"user_name": "u1"})],
+                         ["route_001"])
+        store.batch_delete([node])
+        self.assertEqual(store.retrieve_memories(filter_dict=filter_dict), [])
+        store.close()
 
     def tearDown(self):
         self.es_store.close()
@@ -0,0 +1,47 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from memoryscope.core.models.llama_index_embedding_model import LlamaIndexEmbeddingModel
+from memoryscope.core.storage.memory_dump import MemoryDump
+from memoryscope.core.storage.numpy_memory_store import NumpyMemoryStore
+from memoryscope.scheme.memory_node import MemoryNode
+from memoryscope.scheme.model_response import ModelResponse
+
+
+class FailingEmbeddingModel(LlamaIndexEmbeddingModel):
+    """Fails every embedding call, the dump must never need one."""
+
+    def _call(self, model_response: ModelResponse, **kwargs):
+        raise RuntimeError("unexpected embedding call!")
+
+
+class TestMemoryDump(unittest.TestCase):
+    """Tests for MemoryDump"""
+
+    def test_export_and_load(self):
+        emb = FailingEmbeddingModel(module_name="dashscope_embedding", model_name="failing")
+        source = NumpyMemoryStore(embedding_model=emb)
+        nodes = [MemoryNode(memory_id=str(i), user_name=f"u{i % 2}", content=f"记忆 {i}", key="k", value="v",
+                            key_vector=[0.5, float(i)], meta_data={"i": str(i)}, vector=[1.0, float(i), 0.0],
+                            memory_type="observation", obs_reflected=i % 2, timestamp=1700000000 + i)
+                 for i in range(25)]
+        source.batch_insert([n.model_copy() for n in nodes])
+
+        with tempfile.TemporaryDirectory() as dump_dir:
+            dump = MemoryDump(dump_dir)
+            self.assertEqual(dump.export(source, filter_dict={"user_name": "u1"}, chunk_size=4), 12)
+            target = NumpyMemoryStore(embedding_model=emb)
+            self.assertEqual(dump.load(target, batch_size=3, workers=2), 12)
+
+        loaded = {n.memory_id: n for n in target.retrieve_memories(top_k=100)}
+        self.assertEqual(sorted(loaded, key=int), [str(i) for i in range(1, 25, 2)])
+        for i in range(1, 25, 2):
+            node = loaded[str(i)]
+            expected = source.retrieve_memories(top_k=1, filter_dict={"memory_id": str(i)})[0]
+            # the numpy store renormalizes the vectors it is given
+            self.assertEqual(node.model_dump(exclude={"vector"}), expected.model_dump(exclude={"vector"}))
+            self.assertTrue(np.allclose(node.vector, expected.vector))
+        source.close()
+        target.close()
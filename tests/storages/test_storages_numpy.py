@@ -0,0 +1,291 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from memoryscope.core.storage.base_memory_store import BaseMemoryStore
+from memoryscope.core.storage.dummy_memory_store import DummyMemoryStore
+from memoryscope.core.storage.hnsw_index import HnswIndex
+from memoryscope.core.storage.numpy_memory_store import NumpyMemoryStore
+from memoryscope.scheme.memory_node import MemoryNode
+from tests.fake_embeddings import BagOfCharsEmbeddingModel
+
+
+class TestNumpyMemoryStore(unittest.TestCase):
+    """Tests for NumpyMemoryStore"""
+
+    def setUp(self):
+        emb = BagOfCharsEmbeddingModel(module_name="dashscope_embedding", model_name="bag_of_chars")
+        self.store = NumpyMemoryStore(embedding_model=emb, init_capacity=2)
+        self.data = [
+            MemoryNode(memory_id="a", user_name="u1", target_name="t1", content="I like apples",
+                       memory_type="observation"),
+            MemoryNode(memory_id="b", user_name="u1", target_name="t1", content="I like bananas",
+                       memory_type="observation", obs_reflected=1),
+            MemoryNode(memory_id="c", user_name="u1", target_name="t1", content="zzz qqq xxx",
+                       memory_type="insight"),
+            MemoryNode(memory_id="d", user_name="u2", target_name="t1", content="I like apples",
+                       memory_type="observation"),
+        ]
+        self.store.batch_insert(self.data)
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_retrieve(self):
+        filter_dict = {"user_name": "u1", "memory_type": ["observation", "insight"]}
+        nodes = self.store.retrieve_memories(query="apples", top_k=2, filter_dict=filter_dict)
+        self.assertEqual([n.memory_id for n in nodes], ["a", "b"])
+        self.assertGreaterEqual(nodes[0].score_recall, nodes[1].score_recall)
+
+    def test_retrieve_multi(self):
+        sub_queries = [({"user_name": "u1", "memory_type": "observation"}, 1),
+                       ({"memory_type": "insight"}, 3),
+                       ({"user_name": "u2"}, 0)]
+        nodes_list = self.store.retrieve_memories_multi(query="apples", sub_queries=sub_queries)
+        self.assertEqual([[n.memory_id for n in nodes] for nodes in nodes_list], [["a"], ["c"], []])
+        expected = self.store.retrieve_memories(query="apples", top_k=1, filter_dict=sub_queries[0][0])
+        self.assertAlmostEqual(nodes_list[0][0].score_recall, expected[0].score_recall, places=6)
+
+    def test_retrieve_wo_query(self):
+        nodes = self.store.retrieve_memories(top_k=10, filter_dict={"user_name": "u1", "obs_reflected": 0})
+        self.assertEqual(sorted(n.memory_id for n in nodes), ["a", "c"])
+        self.assertEqual(self.store.retrieve_memories(top_k=10, filter_dict={"user_name": "unknown"}), [])
+        nodes = self.store.retrieve_memories(top_k=10, filter_dict={"user_name": "u1"}, return_vectors=False)
+        self.assertTrue(nodes and all(not n.vector for n in nodes))
+
+    def test_iter_memories(self):
+        pages = list(self.store.iter_memories(filter_dict={"user_name": "u1"}, page_size=2))
+        self.assertEqual([len(page) for page in pages], [2, 1])
+        self.assertEqual(sorted(n.memory_id for page in pages for n in page), ["a", "b", "c"])
+        self.assertTrue(all(not n.vector for page in pages for n in page))
+
+        # nodes deleted while scanning are skipped
+        page_iter = self.store.iter_memories(page_size=1)
+        first = next(page_iter)
+        self.store.batch_delete([n for n in self.data if n.memory_id != first[0].memory_id][:2])
+        self.assertEqual(len(first) + sum(len(page) for page in page_iter), 2)
+
+    def test_default_iter_memories(self):
+        # the scan of the stores without a native one, over growing windows of `retrieve_memories`
+        self.store.batch_insert([MemoryNode(memory_id=f"e{i}", user_name="u1", content=f"memory {i}")
+                                 for i in range(6)])
+        pages = list(BaseMemoryStore.iter_memories(self.store, filter_dict={"user_name": "u1"}, page_size=2))
+        self.assertTrue(all(0 < len(page) <= 2 for page in pages))
+        memory_ids = [n.memory_id for page in pages for n in page]
+        self.assertEqual(sorted(memory_ids), sorted(["a", "b", "c"] + [f"e{i}" for i in range(6)]))
+
+        self.assertEqual(list(DummyMemoryStore(embedding_model=None).iter_memories()), [])
+
+    def test_async(self):
+        asyncio.run(self.store.a_batch_delete([self.data[3]]))
+        nodes = asyncio.run(self.store.a_retrieve_memories(query="apples", top_k=10, return_vectors=False))
+        self.assertEqual([n.memory_id for n in nodes][:1], ["a"])
+        self.assertNotIn("d", [n.memory_id for n in nodes])
+
+    def test_update_and_delete(self):
+        node = self.data[0]
+        node.obs_reflected = 1
+        self.store.batch_update([node], update_embedding=False)
+        nodes = self.store.retrieve_memories(top_k=10, filter_dict={"user_name": "u1", "obs_reflected": 1})
+        self.assertEqual(sorted(n.memory_id for n in nodes), ["a", "b"])
+
+        self.store.batch_delete(self.data[:3])
+        self.assertEqual(self.store.size, 1)
+        nodes = self.store.retrieve_memories(query="apples", top_k=10)
+        self.assertEqual([n.memory_id for n in nodes], ["d"])
+
+    @unittest.skipUnless(HnswIndex.available(), "hnswlib is not installed")
+    def test_hnsw_index(self):
+        rng = np.random.default_rng(0)
+        vectors = NumpyMemoryStore._normalize(rng.normal(size=(2000, 32)).astype(np.float32))
+        index = HnswIndex(dim=32, m=8, ef_construction=64, init_capacity=16)
+        for start in range(0, 2000, 500):
+            index.add(np.arange(start, start + 500), vectors[start: start + 500])
+        for row in range(0, 2000, 3):
+            index.remove(row)
+        self.assertEqual(index.size, 2000 - 667)
+
+        allowed = np.ones(2000, dtype=bool)
+        allowed[::3] = False
+        allowed[1::5] = False
+        hit_cnt = 0
+        for query in vectors[:50]:
+            labels, _ = index.search(query, 10, ef=64, allowed=allowed)
+            rows = np.flatnonzero(allowed)
+            expected = rows[np.argsort(-(vectors[rows] @ query))[:10]]
+            self.assertTrue(allowed[labels].all())
+            hit_cnt += len(set(labels.tolist()) & set(expected.tolist()))
+        self.assertGreater(hit_cnt / 500, 0.9)
+
+    @unittest.skipUnless(HnswIndex.available(), "hnswlib is not installed")
+    def test_hnsw_store(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(600, 64)).astype(np.float32)
+        nodes = [MemoryNode(memory_id=str(i), user_name=f"u{i % 2}", content=f"memory {i}", vector=v.tolist())
+                 for i, v in enumerate(vectors)]
+        store = NumpyMemoryStore(embedding_model=self.store.embedding_model, index_type="hnsw", brute_force_rows=50,
+                                 brute_force_ratio=0.05, hnsw_ef_search=128)
+        store.batch_insert(nodes)
+        self.assertEqual(store._index.size, 600)
+        self.assertTrue(store._use_index(300))
+        self.assertFalse(store._use_index(50))
+
+        index_search = store._index.search
+        search_cnt = [0]
+
+        def counting_search(*args, **kwargs):
+            search_cnt[0] += 1
+            return index_search(*args, **kwargs)
+
+        store._index.search = counting_search
+        flat_store = NumpyMemoryStore(embedding_model=self.store.embedding_model)
+        flat_store.batch_insert([n.model_copy() for n in nodes])
+        query = "memory 42"
+        result = store.retrieve_memories(query=query, top_k=5, filter_dict={"user_name": "u0"})
+        expected = flat_store.retrieve_memories(query=query, top_k=5, filter_dict={"user_name": "u0"})
+        self.assertEqual(search_cnt[0], 1)
+        self.assertGreaterEqual(len({n.memory_id for n in result} & {n.memory_id for n in expected}), 4)
+
+        # a selective filter is answered exactly by the brute-force scan
+        filter_dict = {"memory_id": [str(i) for i in range(20)]}
+        result = store.retrieve_memories(query=query, top_k=5, filter_dict=filter_dict)
+        expected = flat_store.retrieve_memories(query=query, top_k=5, filter_dict=filter_dict)
+        self.assertEqual(search_cnt[0], 1)
+        self.assertEqual([n.memory_id for n in result], [n.memory_id for n in expected])
+
+        # deleting most rows compacts the arrays and rebuilds the index in the background
+        old_index = store._index
+        store.batch_delete(nodes[:400])
+        self.assertEqual(store._size, 200)
+        store.batch_insert([MemoryNode(memory_id="new", content=query)])
+        store._background_thread.join()
+        self.assertIsNot(store._index, old_index)
+        self.assertEqual(store._index.size, 201)
+        self.assertEqual(store._index.deleted_ratio, 0.0)
+        result = store.retrieve_memories(query=query, top_k=1)
+        self.assertEqual([n.memory_id for n in result], ["new"])
+        store.close()
+        flat_store.close()
+
+    def test_hnsw_unavailable(self):
+        with mock.patch.object(HnswIndex, "available", return_value=False):
+            store = NumpyMemoryStore(embedding_model=self.store.embedding_model, index_type="hnsw")
+        self.assertEqual(store.index_type, "flat")
+        store.batch_insert([n.model_copy() for n in self.data])
+        self.assertIsNone(store._index)
+        self.assertEqual(store.retrieve_memories(query="apples", top_k=1)[0].memory_id, "a")
+        store.close()
+
+    def test_persist_and_reload(self):
+        emb = self.store.embedding_model
+        with tempfile.TemporaryDirectory() as persist_dir:
+            store = NumpyMemoryStore(embedding_model=emb, init_capacity=2, persist_dir=persist_dir,
+                                     wal_checkpoint_ops=3)
+            store.batch_insert([n.model_copy() for n in self.data])
+            store.batch_delete(self.data[1:2])
+            node = self.data[0].model_copy()
+            node.obs_reflected = 1
+            store.batch_update([node], update_embedding=False)
+            store.close()
+
+            store = NumpyMemoryStore(embedding_model=emb, persist_dir=persist_dir)
+            self.assertEqual(store.size, 3)
+            nodes = store.retrieve_memories(query="apples", top_k=10, filter_dict={"user_name": "u1"})
+            self.assertEqual([n.memory_id for n in nodes], ["a", "c"])
+            self.assertEqual(nodes[0].obs_reflected, 1)
+
+            # deleting most rows compacts the segments into a new generation in the background
+            store.batch_delete(self.data[:3])
+            store._background_thread.join()
+            store.close()
+
+            store = NumpyMemoryStore(embedding_model=emb, persist_dir=persist_dir)
+            nodes = store.retrieve_memories(query="apples", top_k=10)
+            self.assertEqual([n.memory_id for n in nodes], ["d"])
+            store.close()
+
+    def test_quantization(self):
+        emb = self.store.embedding_model
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(500, 64)).astype(np.float32)
+        nodes = [MemoryNode(memory_id=str(i), content=f"memory {i}", vector=v.tolist()) for i, v in enumerate(vectors)]
+        flat_store = NumpyMemoryStore(embedding_model=emb)
+        flat_store.batch_insert([n.model_copy() for n in nodes])
+        for quantization in ["float16", "int8"]:
+            with tempfile.TemporaryDirectory() as persist_dir:
+                store = NumpyMemoryStore(embedding_model=emb, init_capacity=64, persist_dir=persist_dir,
+                                         quantization=quantization)
+                store.batch_insert([n.model_copy() for n in nodes])
+                store.batch_delete(nodes[:300])
+                store._background_thread.join()
+                self.assertLess(store.scan_bytes, flat_store.scan_bytes / 2)
+
+                for query in ["memory 42", "memory 7 and 8"]:
+                    expected = flat_store.retrieve_memories(query=query, top_k=5, filter_dict={"memory_id": [
+                        str(i) for i in range(300, 500)]})
+                    result = store.retrieve_memories(query=query, top_k=5)
+                    self.assertEqual([n.memory_id for n in result], [n.memory_id for n in expected])
+                    self.assertAlmostEqual(result[0].score_recall, expected[0].score_recall, places=5)
+                store.close()
+
+                # the quantized vectors are persisted, reopening the store does not quantize them again
+                with mock.patch.object(NumpyMemoryStore, "_requantize") as requantize:
+                    store = NumpyMemoryStore(embedding_model=emb, persist_dir=persist_dir, quantization=quantization)
+                    requantize.assert_not_called()
+                    result = store.retrieve_memories(query="memory 42", top_k=5)
+                    self.assertEqual(len(result), 5)
+                    store.close()
+                with mock.patch.object(NumpyMemoryStore, "_requantize") as requantize:
+                    store = NumpyMemoryStore(embedding_model=emb, persist_dir=persist_dir)
+                    store.close()
+                    requantize.assert_called_once()
+        flat_store.close()
+
+    def test_persist_format(self):
+        emb = self.store.embedding_model
+        key_vector = np.linspace(-1, 1, 64, dtype=np.float32).tolist()
+        nodes = [n.model_copy() for n in self.data]
+        nodes[2].key_vector = key_vector
+        with tempfile.TemporaryDirectory() as persist_dir:
+            store = NumpyMemoryStore(embedding_model=emb, persist_dir=persist_dir)
+            store.batch_insert(nodes)
+
+            # the log references the key vector row instead of holding the floats
+            with open(os.path.join(persist_dir, "wal.000000.jsonl")) as f:
+                ops = [json.loads(line) for line in f]
+            self.assertEqual([op["op"] for op in ops], ["insert"] * 4)
+            self.assertTrue(ops[2]["key_vector_row"])
+            self.assertTrue(all("key_vector" not in op["node"] for op in ops))
+
+            # a change failing to be logged is not applied
+            with mock.patch.object(store._storage, "append_wal", side_effect=OSError("disk full")):
+                with self.assertRaises(OSError):
+                    store.batch_insert([MemoryNode(memory_id="e", content="I like apples")])
+                with self.assertRaises(OSError):
+                    store.batch_delete(nodes[:1])
+            self.assertEqual(store.size, 4)
+            self.assertEqual([n.memory_id for n in store.retrieve_memories(filter_dict={"memory_id": ["a", "e"]})],
+                             ["a"])
+
+            # reopened without closing, as after a crash, from the log only
+            reopened = NumpyMemoryStore(embedding_model=emb, persist_dir=persist_dir)
+            self.assertEqual(reopened.size, 4)
+            node = reopened.retrieve_memories(filter_dict={"memory_id": "c"})[0]
+            np.testing.assert_allclose(node.key_vector, key_vector, rtol=1e-6)
+            reopened.close()
+            store._storage.close()
+
+            # the checkpoint holds typed columns only
+            with np.load(os.path.join(persist_dir, "columns.000000.npz"), allow_pickle=False) as data:
+                self.assertTrue(all(data[key].dtype != object for key in data.files))
+            store = NumpyMemoryStore(embedding_model=emb, persist_dir=persist_dir)
+            nodes = store.retrieve_memories(top_k=10)
+            self.assertEqual([n.memory_id for n in nodes], ["a", "b", "c", "d"])
+            np.testing.assert_allclose(nodes[2].key_vector, key_vector, rtol=1e-6)
+            self.assertEqual(nodes[1].obs_reflected, 1)
+            store.close()
@@ -0,0 +1,96 @@
+import time
+import unittest
+from unittest import mock
+
+from memoryscope.core.storage.numpy_memory_store import NumpyMemoryStore
+from memoryscope.core.storage.write_behind_memory_store import WriteBehindMemoryStore
+from memoryscope.scheme.memory_node import MemoryNode
+from tests.fake_embeddings import BagOfCharsEmbeddingModel, bag_of_chars
+
+
+class CountingStore(NumpyMemoryStore):
+    """Counts the batch writes reaching the store."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.write_cnt = 0
+
+    def batch_insert(self, nodes):
+        self.write_cnt += 1
+        super().batch_insert(nodes)
+
+    def batch_update(self, nodes, update_embedding: bool = True):
+        self.write_cnt += 1
+        super().batch_update(nodes, update_embedding)
+
+    def batch_delete(self, nodes):
+        self.write_cnt += 1
+        super().batch_delete(nodes)
+
+
+class TestWriteBehindMemoryStore(unittest.TestCase):
+    """Tests for WriteBehindMemoryStore"""
+
+    def setUp(self):
+        emb = BagOfCharsEmbeddingModel(module_name="dashscope_embedding", model_name="bag_of_chars")
+        self.inner = CountingStore(embedding_model=emb)
+        self.store = WriteBehindMemoryStore(embedding_model=emb, store=self.inner, max_pending=100, max_age=60)
+        self.inner.batch_insert([
+            MemoryNode(memory_id="a", user_name="u1", content="I like apples", memory_type="observation"),
+            MemoryNode(memory_id="b", user_name="u1", content="I like bananas", memory_type="observation"),
+        ])
+        self.inner.write_cnt = 0
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_coalesce_and_overlay(self):
+        node_c = MemoryNode(memory_id="c", user_name="u1", content="apples and apples", memory_type="observation")
+        self.store.batch_insert([node_c])
+        node_c.obs_reflected = 1
+        self.store.batch_update([node_c], update_embedding=False)
+        self.store.batch_delete([MemoryNode(memory_id="b")])
+        self.assertEqual(self.store.pending_size, 2)
+        self.assertEqual(self.inner.write_cnt, 0)
+
+        # reads see the pending writes
+        nodes = self.store.retrieve_memories(query="apples", top_k=10, filter_dict={"user_name": "u1"})
+        self.assertEqual([n.memory_id for n in nodes], ["c", "a"])
+        self.assertEqual(nodes[0].obs_reflected, 1)
+        nodes = self.store.retrieve_memories(top_k=10, filter_dict={"obs_reflected": 1})
+        self.assertEqual([n.memory_id for n in nodes], ["c"])
+
+        self.store.flush()
+        self.assertEqual(self.inner.write_cnt, 2)
+        self.assertEqual(self.store.pending_size, 0)
+        nodes = self.inner.retrieve_memories(top_k=10, filter_dict={"user_name": "u1"})
+        self.assertEqual(sorted(n.memory_id for n in nodes), ["a", "c"])
+
+    def test_embed_query_once(self):
+        self.store.batch_insert([MemoryNode(memory_id="c", user_name="u1", content="apples and apples",
+                                            memory_type="observation", vector=bag_of_chars("apples and apples"))])
+        emb = self.store.embedding_model
+        # the query is embedded once for both the wrapped store and the overlay
+        with mock.patch.object(emb, "get_query_embedding", wraps=emb.get_query_embedding) as get_query_embedding, \
+                mock.patch.object(emb, "call", wraps=emb.call) as call:
+            nodes = self.store.retrieve_memories(query="apples", top_k=10, filter_dict={"user_name": "u1"})
+            self.assertEqual(get_query_embedding.call_count, 1)
+            nodes_list = self.store.retrieve_memories_multi(query="apples",
+                                                            sub_queries=[({"user_name": "u1"}, 10),
+                                                                         ({"memory_id": "c"}, 1)])
+            self.assertEqual(get_query_embedding.call_count, 2)
+            call.assert_not_called()
+        self.assertEqual([n.memory_id for n in nodes], ["c", "a", "b"])
+        self.assertEqual([[n.memory_id for n in nodes] for nodes in nodes_list], [["c", "a", "b"], ["c"]])
+
+    def test_flush_on_size_and_age(self):
+        self.store.max_pending = 2
+        self.store.batch_insert([MemoryNode(memory_id=str(i), content=f"memory {i}") for i in range(2)])
+        self.assertEqual(self.store.pending_size, 0)
+        self.assertEqual(self.inner.size, 4)
+
+        self.store.max_age = 0.05
+        self.store.batch_delete([MemoryNode(memory_id="0")])
+        time.sleep(1.2)
+        self.assertEqual(self.store.pending_size, 0)
+        self.assertEqual(self.inner.size, 3)
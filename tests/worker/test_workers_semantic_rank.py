@@ -0,0 +1,145 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+from memoryscope.constants.common_constants import QUERY_WITH_TS, RETRIEVE_MEMORY_NODES, RANKED_MEMORY_NODES, \
+    MEMORYSCOPE_CONTEXT, TARGET_NAME, USER_NAME
+from memoryscope.core.memoryscope import MemoryScope
+from memoryscope.core.utils.tool_functions import init_instance_by_config
+from memoryscope.core.worker.frontend.semantic_rank_worker import SemanticRankWorker
+from memoryscope.scheme.memory_node import MemoryNode
+
+
+class TestSemanticRankWorker(unittest.TestCase):
+    """Tests for the local cosine rank of SemanticRankWorker, with the fake backends"""
+
+    def setUp(self):
+        with open(Path(__file__).parents[2] / "memoryscope/core/config/demo_config_fake.yaml") as f:
+            config = yaml.safe_load(f)
+        for model_config in config["model"].values():
+            model_config["latency"] = 0
+        config["model"]["embedding_model"]["dimensions"] = 64
+        config["global"]["output_memory_max_count"] = 3
+        config_path = os.path.join(tempfile.mkdtemp(), "fake_config.yaml")
+        with open(config_path, "w") as f:
+            yaml.safe_dump(config, f)
+        self.ms = MemoryScope(config_path=config_path)
+        self.embedding_model = self.ms.context.model_dict["embedding_model"]
+
+    def tearDown(self):
+        self.ms.close()
+
+    def new_worker(self, name: str = "semantic_rank", context: dict = None, **kwargs) -> SemanticRankWorker:
+        config = {**self.ms.context.worker_conf_dict[name], **kwargs}
+        return init_instance_by_config(config=config,
+                                       name=name,
+                                       is_multi_thread=False,
+                                       context=context or {MEMORYSCOPE_CONTEXT: self.ms.context, TARGET_NAME: "user"},
+                                       context_lock=None,
+                                       memoryscope_context=self.ms.context,
+                                       thread_pool=self.ms.context.thread_pool)
+
+    def new_node(self, content: str, vector: np.ndarray, score_recall: float) -> MemoryNode:
+        return MemoryNode(content=content, vector=vector.tolist(), score_recall=score_recall)
+
+    def test_mmr_select(self):
+        vectors = np.eye(4, dtype=np.float32)
+        vectors[1] = vectors[0]
+        scores = np.array([0.9, 0.9, 0.5, 0.1], dtype=np.float32)
+        self.assertEqual(SemanticRankWorker.mmr_select(vectors, scores, 3).tolist(), [0, 1, 2])
+        self.assertEqual(SemanticRankWorker.mmr_select(vectors, scores, 3, mmr_lambda=0.5).tolist(), [0, 2, 3])
+        self.assertEqual(SemanticRankWorker.mmr_select(vectors, scores, 10).tolist(), [0, 1, 2, 3])
+
+    def test_local_rank(self):
+        query = "I like green tea"
+        query_vector = np.asarray(self.embedding_model.get_query_embedding(query))
+        rng = np.random.default_rng(0)
+        noise = rng.standard_normal((5, len(query_vector)))
+        nodes = [self.new_node(f"memory {i}", query_vector * (5 - i) / 5 + noise[i] * 0.05 * (i + 1), i / 10)
+                 for i in range(5)]
+        # the recall scores of separate searches disagree with the similarities
+        nodes[4].score_recall = 10.0
+
+        worker = self.new_worker(mmr_lambda=1.0)
+        worker.set_workflow_context(QUERY_WITH_TS, (query, 0))
+        worker.memory_manager.set_memories(RETRIEVE_MEMORY_NODES, nodes)
+        worker.run()
+        ranked = worker.memory_manager.get_memories(RANKED_MEMORY_NODES)
+        self.assertEqual([n.content for n in ranked], ["memory 0", "memory 1", "memory 2"])
+        # the cosine similarity mapped to [0, 1]
+        vectors = np.asarray([n.vector for n in ranked])
+        cos = vectors @ query_vector / np.linalg.norm(vectors, axis=1) / np.linalg.norm(query_vector)
+        for node, similarity in zip(ranked, cos):
+            self.assertTrue(0.0 <= node.score_rank <= 1.0)
+            self.assertAlmostEqual(node.score_rank, (1 + similarity) / 2, places=5)
+
+    def test_local_rank_score_range(self):
+        query = "I like green tea"
+        query_vector = np.asarray(self.embedding_model.get_query_embedding(query))
+        # identical, orthogonal and opposite to the query
+        orthogonal = np.zeros_like(query_vector)
+        orthogonal[np.argmin(np.abs(query_vector))] = 1.0
+        orthogonal -= orthogonal @ query_vector / (query_vector @ query_vector) * query_vector
+        nodes = [self.new_node("same", query_vector, 0.0),
+                 self.new_node("orthogonal", orthogonal, 0.0),
+                 self.new_node("opposite", -query_vector, 0.0)]
+        ranked = self.new_worker().local_rank(query, nodes)
+        self.assertEqual([n.content for n in ranked], ["same", "orthogonal", "opposite"])
+        for node, score in zip(ranked, [1.0, 0.5, 0.0]):
+            self.assertAlmostEqual(node.score_rank, score, places=5)
+
+    def test_local_rank_embedding_failed(self):
+        def fail(query):
+            raise ConnectionError("embedding service is down")
+
+        self.embedding_model.get_query_embedding = fail
+        nodes = [self.new_node(f"memory {i}", np.ones(64), i / 10) for i in range(5)]
+        worker = self.new_worker()
+        self.assertIsNone(worker.local_rank("I like green tea", nodes))
+
+        # falls back to the recall scores
+        worker.set_workflow_context(QUERY_WITH_TS, ("I like green tea", 0))
+        worker.memory_manager.set_memories(RETRIEVE_MEMORY_NODES, nodes)
+        worker.run()
+        ranked = worker.memory_manager.get_memories(RANKED_MEMORY_NODES)
+        self.assertEqual([n.score_rank for n in ranked], [0.4, 0.3, 0.2, 0.1, 0.0])
+
+    def test_reuse_query_vector(self):
+        query = "I like green tea"
+        self.ms.context.memory_store.batch_insert([
+            MemoryNode(memory_id=f"m{i}", user_name="alice", target_name="user", content=f"I like tea {i}",
+                       memory_type="observation") for i in range(5)])
+        queries = []
+        get_query_embedding = self.embedding_model.get_query_embedding
+        self.embedding_model.get_query_embedding = lambda q: queries.append(q) or get_query_embedding(q)
+
+        # the query embedded by the retrieve worker is reused by the local rank
+        context = {MEMORYSCOPE_CONTEXT: self.ms.context, TARGET_NAME: "user", USER_NAME: "alice"}
+        retrieve_worker = self.new_worker(name="retrieve_obs_ins", context=context)
+        retrieve_worker.set_workflow_context(QUERY_WITH_TS, (query, 0))
+        retrieve_worker.run()
+        self.assertEqual(len(retrieve_worker.memory_manager.get_memories(RETRIEVE_MEMORY_NODES)), 5)
+        self.assertEqual(queries, [query])
+        rank_worker = self.new_worker(context=context)
+        rank_worker.run()
+        ranked = rank_worker.memory_manager.get_memories(RANKED_MEMORY_NODES)
+        self.assertEqual(len(ranked), 3)
+        self.assertTrue(all(0.0 <= n.score_rank <= 1.0 for n in ranked))
+        self.assertEqual(queries, [query])
+
+    def test_local_rank_without_vectors(self):
+        nodes = [MemoryNode(content=f"memory {i}", score_recall=i / 10) for i in range(5)]
+        worker = self.new_worker()
+        worker.set_workflow_context(QUERY_WITH_TS, ("I like green tea", 0))
+        worker.memory_manager.set_memories(RETRIEVE_MEMORY_NODES, nodes)
+        worker.run()
+        ranked = worker.memory_manager.get_memories(RANKED_MEMORY_NODES)
+        self.assertEqual([n.score_rank for n in ranked], [0.4, 0.3, 0.2, 0.1, 0.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import yaml
+
+from memoryscope.constants.common_constants import MEMORYSCOPE_CONTEXT, TARGET_NAME
+from memoryscope.core.memoryscope import MemoryScope
+from memoryscope.core.utils.tool_functions import init_instance_by_config
+from memoryscope.core.worker.backend.update_insight_worker import UpdateInsightWorker
+from memoryscope.enumeration.action_status_enum import ActionStatusEnum
+from memoryscope.scheme.memory_node import MemoryNode
+
+
+class TestUpdateInsightWorker(unittest.TestCase):
+    """Tests for the action status of the insights updated by UpdateInsightWorker, with the fake backends"""
+
+    def setUp(self):
+        with open(Path(__file__).parents[2] / "memoryscope/core/config/demo_config_fake.yaml") as f:
+            config = yaml.safe_load(f)
+        for model_config in config["model"].values():
+            model_config["latency"] = 0
+        config_path = os.path.join(tempfile.mkdtemp(), "fake_config.yaml")
+        with open(config_path, "w") as f:
+            yaml.safe_dump(config, f)
+        self.ms = MemoryScope(config_path=config_path)
+        self.embedding_model = self.ms.context.model_dict["embedding_model"]
+
+    def tearDown(self):
+        self.ms.close()
+
+    def new_worker(self) -> UpdateInsightWorker:
+        return init_instance_by_config(config=self.ms.context.worker_conf_dict["update_insight"],
+                                       name="update_insight",
+                                       is_multi_thread=False,
+                                       context={MEMORYSCOPE_CONTEXT: self.ms.context, TARGET_NAME: "user"},
+                                       context_lock=None,
+                                       memoryscope_context=self.ms.context,
+                                       thread_pool=self.ms.context.thread_pool)
+
+    def test_key_vector_status(self):
+        worker = self.new_worker()
+        self.assertFalse(worker.enable_ranker)
+        store = mock.MagicMock()
+        worker.memory_manager._memory_store = store
+
+        content = "I like green tea"
+        obs_node = MemoryNode(content=content, vector=self.embedding_model.get_query_embedding(content))
+        insight_nodes = [MemoryNode(memory_id=f"insight_{i}", memory_type="insight", key="drink", value="tea",
+                                    content="user drink: tea") for i in range(2)]
+        for node in insight_nodes:
+            worker.filter_obs_nodes(node, [obs_node])
+            self.assertTrue(node.key_vector)
+            # the key vector alone does not change the status, it is left to the content update
+            self.assertEqual(node.action_status, ActionStatusEnum.NONE.value)
+            self.assertIn("key_vector", node.dirty_fields)
+
+        worker.update_insight_node(insight_nodes[0], "coffee")
+        self.assertEqual(insight_nodes[0].action_status, ActionStatusEnum.CONTENT_MODIFIED.value)
+
+        # the updated insight is embedded again, the other one only persists its key vector
+        updated_nodes = worker.memory_manager.update_memories(nodes=insight_nodes)
+        self.assertEqual(store.batch_update.call_args_list,
+                         [mock.call([insight_nodes[0]], update_embedding=True),
+                          mock.call([insight_nodes[1]], update_embedding=False)])
+        self.assertEqual({action: [n.memory_id for n in nodes] for action, nodes in updated_nodes.items()},
+                         {ActionStatusEnum.CONTENT_MODIFIED.value: ["insight_0"],
+                          ActionStatusEnum.MODIFIED.value: ["insight_1"]})
+
+
+if __name__ == "__main__":
+    unittest.main()